@@ -0,0 +1,140 @@
+import asyncio
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncDatabase:
+    """asyncio front end for Database, so handlers never block the event loop.
+
+    - slot reads are answered from the in-memory slot store, without a thread hop
+    - other reads run on a small pool of reader threads (WAL lets them run
+      concurrently, each on its own pooled connection)
+    - writes are queued to one writer thread, which drains whatever has queued
+      up into a single transaction: every operation gets its own SAVEPOINT, so
+      one failing operation does not affect the others, and the batch pays for
+      one commit
+
+    The synchronous Database API stays available for scripts and threads.
+    """
+
+    READ_METHODS = (
+        'get_history_page', 'get_parking_history', 'get_pending_payments',
+        'get_revenue_stats', 'requote_history', 'get_events', 'replay_slots',
+    )
+    WRITE_METHODS = (
+        'reserve_slot', 'cancel_reservation', 'expire_reservation', 'occupy_slot', 'vacate_slot',
+        'reset_all_slots', 'mark_payment_paid', 'settle_payments', 'clear_history',
+    )
+
+    def __init__(self, db, readers: int = 4, max_batch: int = 64):
+        if db.pool is None:
+            raise ValueError("AsyncDatabase needs a pooled Database")
+        self.db = db
+        self.reader_count = readers
+        self.max_batch = max_batch
+        self._readers = None
+        self._queue = queue.Queue()
+        self._writer = None
+        self.stats = {"writes": 0, "batches": 0, "max_batch": 0, "failed_batches": 0}
+
+    def start(self):
+        if self._writer:
+            return
+        self._readers = ThreadPoolExecutor(self.reader_count, thread_name_prefix="db-reader")
+        self._writer = threading.Thread(target=self._run_writer, name="db-writer", daemon=True)
+        self._writer.start()
+        print(f"🗄️  Async database started ({self.reader_count} readers, 1 batched writer)")
+
+    def stop(self, timeout: float = 10.0):
+        """Finish queued writes, then stop the writer and reader threads"""
+        if self._writer:
+            self._queue.put(None)
+            self._writer.join(timeout)
+            self._writer = None
+        if self._readers:
+            self._readers.shutdown(wait=True)
+            self._readers = None
+
+    # ============= READS =============
+
+    def get_slot(self, slot_id):
+        return self.db.get_slot(slot_id)
+
+    def get_all_slots(self):
+        return self.db.get_all_slots()
+
+    async def read(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, functools.partial(method, *args, **kwargs))
+
+    # ============= WRITES =============
+
+    async def write(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((method, args, kwargs, loop, future))
+        return await future
+
+    def __getattr__(self, name):
+        """db.<read or write method> as a coroutine function, e.g. await adb.vacate_slot(1, now)"""
+        if name in self.READ_METHODS:
+            return functools.partial(self.read, getattr(self.db, name))
+        if name in self.WRITE_METHODS:
+            return functools.partial(self.write, getattr(self.db, name))
+        raise AttributeError(name)
+
+    def _run_writer(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Everything that queued up while the previous batch committed goes in this one
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._execute(batch)
+
+    def _execute(self, batch):
+        outcomes = []
+        try:
+            with self.db.write_batch() as conn:
+                for method, args, kwargs, _, _ in batch:
+                    try:
+                        outcomes.append((True, self.db.run_in_savepoint(conn, method, *args, **kwargs)))
+                    except Exception as e:
+                        outcomes.append((False, e))
+        except Exception as e:
+            # BEGIN / COMMIT itself failed: nothing in the batch was written
+            print(f"⚠️ Write batch of {len(batch)} failed: {e}")
+            self.stats["failed_batches"] += 1
+            # Slots are only published after COMMIT, so the store still matches the table
+            outcomes = [(False, e)] * len(batch)
+
+        self.stats["writes"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        for (ok, value), (_, _, _, loop, future) in zip(outcomes, batch):
+            loop.call_soon_threadsafe(self._resolve, future, ok, value)
+
+    @staticmethod
+    def _resolve(future, ok, value):
+        if future.cancelled():
+            return
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats, queued=self._queue.qsize())
+        stats["avg_batch"] = round(stats["writes"] / stats["batches"], 2) if stats["batches"] else None
+        return stats
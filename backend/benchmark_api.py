@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+API load benchmark
+Drives main.app in-process (httpx ASGITransport) against a local Blynk HTTP
+stand-in, a fake SMTP server and a stubbed Twilio client, replaying a mix of
+/api/slots polling, reserve/cancel and occupy/pay-bill traffic at a fixed
+concurrency. Reports p50/p95/p99 latency and throughput per endpoint and exits
+with status 1 if results regress beyond the stored baseline
+(benchmark_baseline.json, recorded with the default settings) or if that
+baseline is missing.
+
+Usage: python benchmark_api.py [--concurrency 16] [--duration 10] [--slots 32]
+                               [--mix slots=70,reserve=15,paybill=15,history=0]
+                               [--baseline FILE] [--save-baseline FILE] [--tolerance 0.25]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+from benchmark_db import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = "slots=70,reserve=15,paybill=15,history=0"
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmark_baseline.json")
+
+# Ignore latency differences below this, so sub-millisecond endpoints don't flap
+NOISE_FLOOR_MS = 1.0
+
+
+# ============= STAND-INS =============
+
+class BlynkStandIn(BaseHTTPRequestHandler):
+    """Answers Blynk external API calls; every pin reads "0" (free / no timer)"""
+
+    requests = 0
+
+    def do_GET(self):
+        BlynkStandIn.requests += 1
+        url = urlsplit(self.path)
+        pins = [key for key, _ in parse_qsl(url.query, keep_blank_values=True) if key != "token"]
+        if url.path.endswith("/get") and len(pins) > 1:
+            body = json.dumps({pin: "0" for pin in pins})
+        elif url.path.endswith("/get"):
+            body = "0"
+        else:
+            body = ""
+        payload = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP (EHLO, AUTH, MAIL, RCPT, DATA, NOOP, QUIT) to accept mail"""
+
+    messages = 0
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost fake SMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif command.startswith("AUTH"):
+                self.reply("235 Authentication successful")
+            elif command.startswith("DATA"):
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                FakeSMTPHandler.messages += 1
+                self.reply("250 Queued")
+            elif command.startswith("QUIT"):
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class StubTwilioClient:
+    """Replaces twilio.rest.Client: messages.create() returns instantly"""
+
+    sent = 0
+
+    def __init__(self, *args, **kwargs):
+        self.messages = self
+
+    def create(self, **kwargs):
+        StubTwilioClient.sent += 1
+        return type("Message", (), {"sid": f"SM{StubTwilioClient.sent:032d}"})()
+
+
+def start_server(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def load_app(workdir: str, slot_count: int):
+    """Point the app at the stand-ins and import it with a fresh database in `workdir`"""
+    blynk_port = start_server(ThreadingHTTPServer(("127.0.0.1", 0), BlynkStandIn))
+    smtp_server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeSMTPHandler)
+    smtp_server.daemon_threads = True
+    smtp_port = start_server(smtp_server)
+
+    with open(os.path.join(workdir, "slots.json"), "w") as f:
+        json.dump({"ranges": [{
+            "first_slot": 1, "count": slot_count,
+            "status_pin_start": 0, "reserve_pin_start": slot_count, "entry_time_pin_start": 2 * slot_count
+        }]}, f)
+
+    os.environ.update({
+        "BLYNK_AUTH_TOKEN": "bench-token",
+        "BLYNK_SERVER": f"http://127.0.0.1:{blynk_port}",
+        "SLOT_CONFIG": "slots.json",
+        "EMAIL_SENDER": "bench@example.com",
+        "EMAIL_PASSWORD": "bench",
+        "SMTP_SERVER": "127.0.0.1",
+        "SMTP_PORT": str(smtp_port),
+        "SMTP_SECURITY": "plain",
+        "TWILIO_ACCOUNT_SID": "ACbench",
+        "TWILIO_AUTH_TOKEN": "bench",
+    })
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import whatsapp_service
+    whatsapp_service.Client = StubTwilioClient
+    import main
+    return main
+
+
+# ============= WORKLOAD =============
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+async def timed(client, recorder, label, method, url, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        ok = response.status_code < 400
+    except Exception:
+        ok = False
+    recorder(label, time.perf_counter() - start, ok)
+
+
+async def scenario_slots(client, recorder, slot_id, n):
+    await timed(client, recorder, "GET /api/slots", "GET", "/api/slots")
+
+
+async def scenario_reserve(client, recorder, slot_id, n):
+    email = f"user{slot_id}@example.com"
+    await timed(client, recorder, "POST /api/slots/reserve", "POST", "/api/slots/reserve", json={
+        "slot_id": slot_id, "user_email": email, "user_phone": "+910000000000",
+        "vehicle_number": f"KA01B{n:05d}", "arrival_time": int(time.time()) + 3600, "duration_hours": 1
+    })
+    await timed(client, recorder, "POST /api/slots/cancel", "POST", "/api/slots/cancel",
+                json={"slot_id": slot_id, "email_id": email})
+
+
+async def scenario_paybill(client, recorder, slot_id, n):
+    await timed(client, recorder, "POST /api/slots/occupy/{id}", "POST", f"/api/slots/occupy/{slot_id}")
+    await timed(client, recorder, "POST /api/slots/pay-bill/{id}", "POST", f"/api/slots/pay-bill/{slot_id}", json={
+        "user_email": f"user{slot_id}@example.com", "user_phone": "+910000000000", "vehicle_number": f"KA01B{n:05d}"
+    })
+
+
+async def scenario_history(client, recorder, slot_id, n):
+    await timed(client, recorder, "GET /api/history", "GET", "/api/history?limit=50")
+
+
+SCENARIOS = {
+    "slots": scenario_slots,
+    "reserve": scenario_reserve,
+    "paybill": scenario_paybill,
+    "history": scenario_history,
+}
+
+
+async def run_load(app, mix: dict, concurrency: int, slot_count: int, duration: float, warmup: float, seed: int):
+    """Run `concurrency` workers for warmup + duration seconds; returns ({label: [(seconds, ok)]}, elapsed)"""
+    import httpx
+
+    samples = {}
+    measuring = False
+
+    def recorder(label, seconds, ok):
+        if measuring:
+            samples.setdefault(label, []).append((seconds, ok))
+
+    names, weights = list(mix), list(mix.values())
+
+    async def worker(index, client, deadline):
+        rng = random.Random(seed + index)
+        # Each worker owns a disjoint set of slots, so scenarios never collide on state
+        own_slots = list(range(index + 1, slot_count + 1, concurrency))
+        n = 0
+        while time.perf_counter() < deadline:
+            n += 1
+            scenario = SCENARIOS[rng.choices(names, weights)[0]]
+            await scenario(client, recorder, own_slots[n % len(own_slots)], n)
+            # Handlers that never suspend would otherwise let one worker monopolise the loop
+            await asyncio.sleep(0)
+
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not send lifespan events, so run startup/shutdown explicitly
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        deadline = start + warmup + duration
+        tasks = [asyncio.create_task(worker(i, client, deadline)) for i in range(concurrency)]
+        await asyncio.sleep(warmup)
+        measuring = True
+        measured_from = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - measured_from
+    return samples, elapsed
+
+
+# ============= REPORTING =============
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    results = {}
+    for label, entries in sorted(samples.items()):
+        latencies = [seconds for seconds, _ in entries]
+        results[label] = {
+            "count": len(entries),
+            "errors": sum(1 for _, ok in entries if not ok),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "throughput_rps": len(entries) / elapsed
+        }
+    return results
+
+
+def print_report(results: dict, elapsed: float):
+    print(f"{'endpoint':32} {'count':>7} {'errors':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>9}")
+    for label, r in results.items():
+        print(f"{label:32} {r['count']:7d} {r['errors']:6d} "
+              f"{r['p50_ms']:7.2f}ms {r['p95_ms']:7.2f}ms {r['p99_ms']:7.2f}ms {r['throughput_rps']:9.1f}")
+    total = sum(r["count"] for r in results.values())
+    print("-" * 86)
+    print(f"Total: {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions vs the baseline: slower percentiles, lower throughput or new errors"""
+    regressions = []
+    for label, base in baseline.items():
+        current = results.get(label)
+        if current is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            limit = base[key] * (1 + tolerance)
+            if current[key] > limit and current[key] - base[key] > NOISE_FLOOR_MS:
+                regressions.append(f"{label}: {key} {current[key]:.2f} > {limit:.2f} (baseline {base[key]:.2f})")
+        floor = base["throughput_rps"] * (1 - tolerance)
+        if current["throughput_rps"] < floor:
+            regressions.append(f"{label}: throughput {current['throughput_rps']:.1f} < {floor:.1f} req/s")
+        base_rate = base["errors"] / max(base["count"], 1)
+        rate = current["errors"] / max(current["count"], 1)
+        if rate > base_rate:
+            regressions.append(f"{label}: error rate {rate:.2%} > baseline {base_rate:.2%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process API load benchmark")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=1.0, help="unmeasured seconds before measuring")
+    parser.add_argument("--slots", type=int, default=32, help="slot count (raised to --concurrency if lower)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights, e.g. slots=70,reserve=15,paybill=15")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="fail if results regress beyond this baseline JSON (or it is missing)")
+    parser.add_argument("--save-baseline", help="write these results as a baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    # Resolve file arguments before the benchmark moves into its temp directory
+    baseline_path = os.path.abspath(args.baseline)
+    save_path = os.path.abspath(args.save_baseline) if args.save_baseline else None
+    if not save_path and not os.path.exists(baseline_path):
+        # Checked up front: a CI run without its baseline must fail, not pass silently
+        print(f"❌ Baseline {baseline_path} not found (record one with --save-baseline)")
+        sys.exit(1)
+    mix = parse_mix(args.mix)
+    slot_count = max(args.slots, args.concurrency)
+
+    print("=" * 86)
+    print(f"API LOAD BENCHMARK (concurrency {args.concurrency}, {args.duration:g}s, {slot_count} slots, mix {args.mix})")
+    print("=" * 86)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir, slot_count)
+        try:
+            samples, elapsed = asyncio.run(run_load(
+                app_module.app, mix, args.concurrency, slot_count, args.duration, args.warmup, args.seed
+            ))
+        finally:
+            os.chdir(BACKEND_DIR)
+
+    results = summarize(samples, elapsed)
+    print()
+    print_report(results, elapsed)
+    print(f"Side effects: {BlynkStandIn.requests} Blynk calls, {FakeSMTPHandler.messages} emails, "
+          f"{StubTwilioClient.sent} WhatsApp messages")
+
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Baseline saved to {save_path}")
+
+    if save_path == baseline_path or not os.path.exists(baseline_path):
+        return
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for line in regressions:
+            print(f"   - {line}")
+        sys.exit(1)
+    print(f"\n✅ No regressions beyond {args.tolerance:.0%} of {baseline_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Database latency benchmark
+Compares per-call latency of the Database class with a fresh connection per
+call (the old behaviour) against the pooled WAL connections.
+
+Usage: python benchmark_db.py [iterations]
+"""
+import os
+import sys
+import tempfile
+import time
+from database import Database
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_workload(db, iterations):
+    """Time each Database call used on the hot paths; returns {method: [seconds]}"""
+    timings = {}
+
+    def timed(name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    for i in range(iterations):
+        now = int(time.time())
+        arrival = now + 3600
+        timed('reserve_slot', db.reserve_slot, 1, 'bench@example.com', '+910000000000', f'KA01B{i:04d}', arrival, 0)
+        timed('cancel_reservation', db.cancel_reservation, 1, 'bench@example.com')
+        db.reserve_slot(1, 'bench@example.com', '+910000000000', f'KA01B{i:04d}', arrival, 0)
+        timed('expire_reservation', db.expire_reservation, 1, arrival)
+        timed('occupy_slot', db.occupy_slot, 2, now - 60)
+        # pay-bill: vacate with the payer's details in the same transaction
+        timed('vacate_slot', db.vacate_slot, 2, now, 'bench@example.com', '+910000000000', f'KA01B{i:04d}')
+        timed('get_parking_history', db.get_parking_history, 50)
+        timed('get_revenue_stats', db.get_revenue_stats)
+    return timings
+
+
+def benchmark(pooled, iterations):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'), pooled=pooled)
+        try:
+            return run_workload(db, iterations)
+        finally:
+            db.close()
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    print("=" * 78)
+    print(f"DATABASE LATENCY BENCHMARK ({iterations} iterations)")
+    print("=" * 78)
+
+    before = benchmark(pooled=False, iterations=iterations)
+    after = benchmark(pooled=True, iterations=iterations)
+
+    print(f"{'method':32} {'unpooled p50':>12} {'pooled p50':>12} {'p95 before':>10} {'p95 after':>10}")
+    for method in before:
+        b, a = before[method], after[method]
+        print(f"{method:32} "
+              f"{percentile(b, 50) * 1e6:10.0f}us {percentile(a, 50) * 1e6:10.0f}us "
+              f"{percentile(b, 95) * 1e6:8.0f}us {percentile(a, 95) * 1e6:8.0f}us")
+
+    total_before = sum(sum(v) for v in before.values())
+    total_after = sum(sum(v) for v in after.values())
+    print("-" * 78)
+    print(f"Total: {total_before * 1000:.1f} ms -> {total_after * 1000:.1f} ms "
+          f"({total_before / total_after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,62 @@
 import requests
+from requests.adapters import HTTPAdapter
+import threading
 import time
 from typing import Optional
+from slot_registry import SlotRegistry
+from metrics import BLYNK_REQUEST_SECONDS, BLYNK_REQUEST_ERRORS
 
 class BlynkManager:
-    def __init__(self, auth_token: str, server: str = "blynk.cloud"):
+    # Pins per multi-pin request, keeps the query string a sane length
+    MAX_PINS_PER_REQUEST = 96
+    
+    def __init__(self, auth_token: str, server: str = "blynk.cloud", pool_size: int = 4,
+                 registry: SlotRegistry = None):
         self.auth_token = auth_token
-        self.base_url = f"https://{server}/external/api"
+        self.registry = registry or SlotRegistry.default(auth_token)
+        # `server` may be a bare host (HTTPS) or a full URL, e.g. a local stand-in
+        base = server if server.startswith("http") else f"https://{server}"
+        self.base_url = f"{base.rstrip('/')}/external/api"
+        
+        # Keep-alive session: one TLS handshake, then pooled connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "last_tick_latency_ms": None,
+            "avg_tick_latency_ms": None,
+            "ticks": 0
+        }
         
     def _get_url(self, endpoint: str) -> str:
         return f"{self.base_url}/{endpoint}"
     
-    def read_virtual_pin(self, pin: str) -> Optional[str]:
+    def _request(self, endpoint: str, operation: str, pin: str = ""):
+        with self._stats_lock:
+            self.stats["requests"] += 1
+        start = time.perf_counter()
+        try:
+            response = self.session.get(self._get_url(endpoint), timeout=5)
+        except Exception:
+            with self._stats_lock:
+                self.stats["errors"] += 1
+            BLYNK_REQUEST_ERRORS.inc(operation, pin)
+            raise
+        finally:
+            BLYNK_REQUEST_SECONDS.observe(time.perf_counter() - start, operation, pin)
+        if response.status_code != 200:
+            BLYNK_REQUEST_ERRORS.inc(operation, pin)
+        return response
+    
+    def read_virtual_pin(self, pin: str, token: str = None) -> Optional[str]:
         """Read value from virtual pin"""
         try:
-            url = self._get_url(f"get?token={self.auth_token}&{pin}")
-            response = requests.get(url, timeout=5)
+            response = self._request(f"get?token={token or self.auth_token}&{pin}", "get", pin)
             if response.status_code == 200:
                 return response.text
             return None
@@ -22,11 +64,27 @@ class BlynkManager:
             print(f"Error reading pin {pin}: {e}")
             return None
     
-    def write_virtual_pin(self, pin: str, value) -> bool:
+    def read_virtual_pins(self, pins: list, token: str = None) -> Optional[dict]:
+        """Read several virtual pins in one request -> {pin: value as str}"""
+        if len(pins) == 1:
+            value = self.read_virtual_pin(pins[0], token)
+            return None if value is None else {pins[0]: value}
+        try:
+            query = "&".join(pins)
+            response = self._request(f"get?token={token or self.auth_token}&{query}", "get", "batch")
+            if response.status_code != 200:
+                return None
+            # Multi-pin reads answer with a JSON object: {"V0": 1, "V3": "0", ...}
+            values = response.json()
+            return {pin: None if values.get(pin) is None else str(values.get(pin)) for pin in pins}
+        except Exception as e:
+            print(f"Error reading pins {','.join(pins)}: {e}")
+            return None
+    
+    def write_virtual_pin(self, pin: str, value, token: str = None) -> bool:
         """Write value to virtual pin"""
         try:
-            url = self._get_url(f"update?token={self.auth_token}&{pin}={value}")
-            response = requests.get(url, timeout=5)
+            response = self._request(f"update?token={token or self.auth_token}&{pin}={value}", "update", pin)
             return response.status_code == 200
         except Exception as e:
             print(f"Error writing pin {pin}: {e}")
@@ -34,50 +92,78 @@ class BlynkManager:
     
     def set_slot_reservation(self, slot_id: int, reserved: bool) -> bool:
         """Set reservation status for a slot"""
-        # Virtual pins for reservation: V3, V4, V5 for slots 1, 2, 3
-        pin = f"V{slot_id + 2}"
-        return self.write_virtual_pin(pin, 1 if reserved else 0)
+        slot = self.registry.get(slot_id)
+        return self.write_virtual_pin(slot.reserve_pin, 1 if reserved else 0,
+                                      self.registry.token_for(slot.device))
     
-    def get_slot_status(self, slot_id: int) -> Optional[dict]:
-        """Get status of a slot from Blynk"""
-        # Virtual pins for status: V0, V1, V2 for slots 1, 2, 3
-        status_pin = f"V{slot_id - 1}"
-        reserve_pin = f"V{slot_id + 2}"
-        entry_time_pin = f"V{slot_id + 5}"
-        
-        status = self.read_virtual_pin(status_pin)
-        reserved = self.read_virtual_pin(reserve_pin)
-        entry_time = self.read_virtual_pin(entry_time_pin)
-        
+    @staticmethod
+    def _parse_slot(slot_id: int, status, reserved, entry_time) -> Optional[dict]:
         if status is None:
             return None
-        
         return {
             'slot_id': slot_id,
-            'is_occupied': int(status) == 1 if status else False,
-            'is_reserved': int(reserved) == 1 if reserved else False,
-            'entry_time': int(entry_time) if entry_time and entry_time != '0' else None
+            'is_occupied': int(float(status)) == 1 if status else False,
+            'is_reserved': int(float(reserved)) == 1 if reserved else False,
+            'entry_time': int(float(entry_time)) if entry_time and entry_time != '0' else None
         }
     
+    def get_slot_status(self, slot_id: int) -> Optional[dict]:
+        """Get status of a slot from Blynk (one request for all three pins)"""
+        slot = self.registry.get(slot_id)
+        if slot is None:
+            return None
+        pins = [slot.status_pin, slot.reserve_pin, slot.entry_time_pin]
+        values = self.read_virtual_pins(pins, self.registry.token_for(slot.device))
+        if values is None:
+            return None
+        return self._parse_slot(slot_id, *(values[pin] for pin in pins))
+    
     def get_all_slots_status(self) -> list:
-        """Get status of all slots"""
+        """Get status of all slots with one multi-pin request per device (per pin chunk)"""
+        start = time.perf_counter()
         slots = []
-        for slot_id in [1, 2, 3]:
-            slot_status = self.get_slot_status(slot_id)
-            if slot_status:
-                slots.append(slot_status)
+        for device, configs in self.registry.by_device().items():
+            token = self.registry.token_for(device)
+            slots_per_request = max(1, self.MAX_PINS_PER_REQUEST // 3)
+            for i in range(0, len(configs), slots_per_request):
+                chunk = configs[i:i + slots_per_request]
+                pins = [pin for slot in chunk for pin in (slot.status_pin, slot.reserve_pin, slot.entry_time_pin)]
+                values = self.read_virtual_pins(pins, token)
+                if values is None:
+                    continue
+                for slot in chunk:
+                    slot_status = self._parse_slot(
+                        slot.slot_id, values[slot.status_pin], values[slot.reserve_pin], values[slot.entry_time_pin]
+                    )
+                    if slot_status:
+                        slots.append(slot_status)
+        
+        self._record_tick((time.perf_counter() - start) * 1000)
         return slots
     
+    def _record_tick(self, latency_ms: float):
+        with self._stats_lock:
+            self.stats["ticks"] += 1
+            self.stats["last_tick_latency_ms"] = round(latency_ms, 2)
+            previous = self.stats["avg_tick_latency_ms"]
+            # Exponential moving average so one slow tick doesn't hide the trend
+            self.stats["avg_tick_latency_ms"] = round(
+                latency_ms if previous is None else 0.8 * previous + 0.2 * latency_ms, 2
+            )
+    
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self.stats)
+    
     def reset_slot_timer(self, slot_id: int) -> bool:
         """Reset entry time for a slot"""
-        entry_time_pin = f"V{slot_id + 5}"
-        return self.write_virtual_pin(entry_time_pin, 0)
+        slot = self.registry.get(slot_id)
+        return self.write_virtual_pin(slot.entry_time_pin, 0, self.registry.token_for(slot.device))
     
     def log_event(self, message: str) -> bool:
         """Log event to Blynk terminal (if configured)"""
         try:
-            url = self._get_url(f"logEvent?token={self.auth_token}&code=parking_event")
-            response = requests.get(url, timeout=5)
+            response = self._request(f"logEvent?token={self.auth_token}&code=parking_event", "logEvent")
             return response.status_code == 200
         except Exception as e:
             print(f"Error logging event: {e}")
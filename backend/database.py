@@ -2,15 +2,141 @@ import sqlite3
 from datetime import datetime
 import json
 import time
+import threading
+from contextlib import contextmanager
+from slot_store import SlotStore
+from db_pool import ConnectionPool
+import revenue_rollups
+import event_log
+import leader_election
+import notification_outbox
+from tariff import TariffEngine, requote_history
+import slot_state
+from metrics import instrument_methods
+
+SLOT_COLUMNS = ('slot_id, is_occupied, is_reserved, vehicle_number, entry_time, '
+                'user_email, user_phone, arrival_time, reserved_duration')
+HISTORY_COLUMNS = ('id, slot_id, vehicle_number, entry_time, exit_time, duration_minutes, '
+                   'total_amount, user_email, user_phone, payment_status, created_at')
+MAX_PAGE_SIZE = 500
 
 class Database:
-    def __init__(self, db_name="parking_system.db"):
+    def __init__(self, db_name="parking_system.db", pooled=True, slot_ids=None, tariff=None, init=True):
         self.db_name = db_name
-        self.init_db()
+        self.slot_ids = list(slot_ids) if slot_ids else [1, 2, 3]
+        self.tariff = tariff or TariffEngine.default()
+        self.pool = ConnectionPool(db_name) if pooled else None
+        self.slot_store = SlotStore()
+        self.snapshot_every = event_log.SNAPSHOT_EVERY
+        self._batch = threading.local()  # set on the writer thread while a write batch is open
+        # Bumped after every committed parking_history change (ETags for history / revenue)
+        self.history_version = 0
+        self._version_lock = threading.Lock()
+        # What reload_if_changed() last saw (other processes' commits)
+        self._data_version = None
+        self._seen_event_seq = None
+        if init:
+            self.init_db()  # the API defers this to its lifespan startup
     
     def get_connection(self):
+        """Persistent per-thread connection (or a fresh one when pooling is off)"""
+        if self._in_batch():
+            return self._batch.conn
+        if self.pool:
+            return self.pool.get_connection()
         return sqlite3.connect(self.db_name)
     
+    def _release(self, conn):
+        """Close unpooled connections; pooled ones stay open for the next call"""
+        if not self.pool:
+            conn.close()
+    
+    def close(self):
+        if self.pool:
+            self.pool.close_all()
+    
+    # ============= TRANSACTIONS =============
+    # Write methods commit through these helpers so the same code can run on its
+    # own or as one operation inside a batch (see AsyncDatabase), where the
+    # batch owner issues a single COMMIT for many operations.
+    
+    def _in_batch(self):
+        return getattr(self._batch, 'conn', None) is not None
+    
+    def _commit(self, conn):
+        if not self._in_batch():
+            conn.commit()
+    
+    def _rollback(self, conn):
+        if not self._in_batch():
+            conn.rollback()
+    
+    def _begin_immediate(self, cursor):
+        if not self._in_batch():
+            cursor.execute('BEGIN IMMEDIATE')
+    
+    def _publish(self, slot):
+        """Put a written slot into the slot store; inside a batch, only once the batch commits"""
+        if self._in_batch():
+            self._batch.slots[slot['slot_id']] = slot
+        else:
+            self.slot_store.put(slot)
+    
+    def _enqueue(self, cursor, notify, *result):
+        """Queue the messages notify(*result) returns, [(channel, method, *args)], in this transaction"""
+        if notify is None:
+            return
+        for channel, method, *args in notify(*result):
+            notification_outbox.insert(cursor, channel, method, *args)
+    
+    def _history_changed(self):
+        """Call after committing a history write; inside a batch, bumps once the batch commits"""
+        if self._in_batch():
+            self._batch.history_changed = True
+            return
+        with self._version_lock:
+            self.history_version += 1
+    
+    @contextmanager
+    def write_batch(self):
+        """Run several write methods in one transaction with one commit (pooled only)"""
+        conn = self.pool.get_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        self._batch.conn = conn
+        self._batch.history_changed = False
+        self._batch.slots = {}  # slot_id -> slot written in this batch, published after COMMIT
+        try:
+            yield conn
+            conn.commit()
+            self._batch.conn = None
+            for slot in self._batch.slots.values():
+                self.slot_store.put(slot)
+            if self._batch.history_changed:
+                self._history_changed()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._batch.conn = None
+            self._batch.slots = {}
+            if conn.in_transaction:
+                conn.rollback()
+    
+    def run_in_savepoint(self, conn, method, *args, **kwargs):
+        """Run one write method inside the open batch; a failure undoes only its own changes"""
+        slots, history_changed = dict(self._batch.slots), self._batch.history_changed
+        conn.execute('SAVEPOINT batch_op')
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            conn.execute('ROLLBACK TO batch_op')
+            conn.execute('RELEASE batch_op')
+            # Forget whatever the failed operation queued for publishing
+            self._batch.slots, self._batch.history_changed = slots, history_changed
+            raise
+        conn.execute('RELEASE batch_op')
+        return result
+    
     def init_db(self):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -30,11 +156,10 @@ class Database:
             )
         ''')
         
-        # Migration: Add reserved_duration column if not exists
-        try:
+        # Migration: Add reserved_duration column to databases created before it existed
+        cursor.execute('PRAGMA table_info(slots)')
+        if 'reserved_duration' not in {row[1] for row in cursor.fetchall()}:
             cursor.execute('ALTER TABLE slots ADD COLUMN reserved_duration REAL DEFAULT 0')
-        except sqlite3.OperationalError:
-            pass # Column likely exists
         
         # Parking history table with payment_status
         cursor.execute('''
@@ -53,347 +178,620 @@ class Database:
             )
         ''')
         
-        # Initialize 3 slots if not exists
-        for slot_id in [1, 2, 3]:
-            cursor.execute('''
-                INSERT OR IGNORE INTO slots (slot_id, is_occupied, is_reserved)
-                VALUES (?, 0, 0)
-            ''', (slot_id,))
+        # Keyset pagination indexes: every page is an index range seek on (filters, id),
+        # or on (filters, exit_time, id) when the page is limited to a time range
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_status_id ON parking_history (payment_status, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_slot_id ON parking_history (slot_id, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_slot_status_id ON parking_history (slot_id, payment_status, id)')
+        cursor.execute('DROP INDEX IF EXISTS idx_history_exit_time')  # superseded by idx_history_exit_id
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_exit_id ON parking_history (exit_time, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_status_exit_id ON parking_history (payment_status, exit_time, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_history_slot_exit_id ON parking_history (slot_id, exit_time, id)')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_history_slot_status_exit_id
+            ON parking_history (slot_id, payment_status, exit_time, id)
+        ''')
+        
+        # Revenue rollups (kept in step with parking_history by every write below)
+        cursor.execute(revenue_rollups.CREATE_TABLE)
+        cursor.execute(revenue_rollups.CREATE_SETTINGS_TABLE)
+        
+        # Append-only slot event log; parking_history is its projection
+        for statement in event_log.CREATE_TABLES:
+            cursor.execute(statement)
+        
+        # Initialize configured slots if not exists
+        cursor.executemany('''
+            INSERT OR IGNORE INTO slots (slot_id, is_occupied, is_reserved)
+            VALUES (?, 0, 0)
+        ''', [(slot_id,) for slot_id in self.slot_ids])
         
         conn.commit()
-        conn.close()
+        
+        # First start with rollups, or buckets cut at another UTC offset than the
+        # tariff's: rebuild them from the existing history
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM revenue_rollups), EXISTS (SELECT 1 FROM parking_history)')
+        has_rollups, has_history = cursor.fetchone()
+        if (has_history and not has_rollups) or revenue_rollups.stored_offset(cursor) != self.tariff.utc_offset:
+            if has_history:
+                print("📊 Backfilling revenue rollups from parking history...")
+            revenue_rollups.backfill(conn, self.tariff.utc_offset)
+        
+        # Warm the in-memory slot store from the committed table
+        self._refresh_all_slots(cursor)
+        self._check_event_log(conn, cursor)
+        self._release(conn)
     
-    def get_slot(self, slot_id):
+    def _check_event_log(self, conn, cursor):
+        """Start the log on first run; otherwise replay it (bounded by the last snapshot)
+        and record a 'resync' event for any slot the table has changed behind its back"""
+        slots = self.slot_store.get_all()
+        if not event_log.is_started(cursor):
+            event_log.start(cursor, slots)
+            conn.commit()
+            print("🧾 Event log started")
+            return
+        state = event_log.replay(conn)
+        replayed = {slot['slot_id']: slot for slot in state['slots']}
+        drifted = [slot for slot in slots if replayed.get(slot['slot_id']) != slot]
+        for slot in drifted:
+            self._record(cursor, 'resync', slot)
+        conn.commit()
+        print(f"🧾 Event log: replayed {state['replayed']} events after snapshot #{state['snapshot_seq']}"
+              + (f", resynced {len(drifted)} slots" if drifted else ""))
+    
+    @staticmethod
+    def _row_to_slot(row):
+        return {
+            'slot_id': row[0],
+            'is_occupied': row[1],
+            'is_reserved': row[2],
+            'vehicle_number': row[3],
+            'entry_time': row[4],
+            'user_email': row[5],
+            'user_phone': row[6],
+            'arrival_time': row[7],
+            'reserved_duration': row[8] if row[8] is not None else 0
+        }
+    
+    def _refresh_all_slots(self, cursor):
+        cursor.execute(f'SELECT {SLOT_COLUMNS} FROM slots ORDER BY slot_id')
+        self.slot_store.load([self._row_to_slot(row) for row in cursor.fetchall()])
+    
+    def reload_if_changed(self):
+        """Pick up slot and history changes committed by other processes (uvicorn --workers).
+        
+        PRAGMA data_version on this thread's connection only moves when another
+        connection committed, so an idle database costs one pragma per call.
+        Call it from one thread; returns True if anything was reloaded.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM slots WHERE slot_id = ?', (slot_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return {
-                'slot_id': row[0],
-                'is_occupied': row[1],
-                'is_reserved': row[2],
-                'vehicle_number': row[3],
-                'entry_time': row[4],
-                'user_email': row[5],
-                'user_phone': row[6],
-                'arrival_time': row[7] if len(row) > 7 else None,
-                'reserved_duration': row[8] if len(row) > 8 else 0
-            }
-        return None
+        try:
+            cursor.execute('PRAGMA data_version')
+            data_version = cursor.fetchone()[0]
+            if data_version == self._data_version:
+                return False
+            self._data_version = data_version
+            cursor.execute(f'SELECT {SLOT_COLUMNS} FROM slots ORDER BY slot_id')
+            for row in cursor.fetchall():
+                self.slot_store.put(self._row_to_slot(row))  # no-op for unchanged slots
+            cursor.execute('''
+                SELECT MAX(seq), MAX(event IN ('bill', 'cancel', 'payment', 'history_cleared'))
+                FROM slot_events WHERE seq > ?
+            ''', (self._seen_event_seq or 0,))
+            last_seq, history_changed = cursor.fetchone()
+            if last_seq is not None:
+                if history_changed and self._seen_event_seq is not None:
+                    self._history_changed()
+                self._seen_event_seq = last_seq
+            return True
+        finally:
+            self._release(conn)
+    
+    def get_slot(self, slot_id):
+        """Read a slot from the in-memory slot store (no disk I/O)"""
+        return self.slot_store.get(slot_id)
     
     def get_all_slots(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM slots')
+        """Read all slots from the in-memory slot store (no disk I/O)"""
+        return self.slot_store.get_all()
+    
+    # ============= SLOT STATE MACHINE =============
+    # Each lifecycle event (see slot_state) is one guarded UPDATE ... RETURNING in
+    # one transaction with one commit. The returned row goes straight into the
+    # slot store; a request that lost a race writes nothing and raises
+    # InvalidTransition. Billing events also need the row as it was (RETURNING
+    # only has the new values), so they read it after BEGIN IMMEDIATE, under the
+    # same write lock as the update.
+    
+    def _transition(self, cursor, slot_id, event, assignments, params=(), extra_guard='', extra_params=()):
+        """Apply `event` to one slot; returns the new slot, or None if the guard did not match"""
+        cursor.execute(f'''
+            UPDATE slots SET {assignments}
+            WHERE slot_id = ? AND {slot_state.guard(event)}{extra_guard}
+            RETURNING {SLOT_COLUMNS}
+        ''', (*params, slot_id, *extra_params))
         rows = cursor.fetchall()
-        conn.close()
+        return self._row_to_slot(rows[0]) if rows else None
+    
+    def _invalid(self, slot_id, event):
+        """InvalidTransition describing the slot's current state"""
+        return slot_state.InvalidTransition(slot_id, event, slot_state.state_of(self.slot_store.get(slot_id)))
+    
+    def _locked_slot(self, cursor, slot_id, event):
+        """Take the write lock and read the slot as it is before `event`"""
+        self._begin_immediate(cursor)
+        cursor.execute(f'SELECT {SLOT_COLUMNS} FROM slots WHERE slot_id = ?', (slot_id,))
+        row = cursor.fetchone()
+        slot = self._row_to_slot(row) if row else None
+        slot_state.check(slot_id, event, slot)
+        return slot
+    
+    def _record(self, cursor, event, slot=None, data=None):
+        """Log an event (and project it onto parking_history) in the current transaction"""
+        seq = event_log.record(cursor, event, slot, data, self.tariff.utc_offset)
+        if seq % self.snapshot_every == 0:
+            cursor.execute(f'SELECT {SLOT_COLUMNS} FROM slots ORDER BY slot_id')
+            event_log.snapshot(cursor, seq, [self._row_to_slot(row) for row in cursor.fetchall()])
+        return seq
+    
+    def reserve_slot(self, slot_id, user_email, user_phone, vehicle_number, arrival_time=None, duration_hours=0,
+                     notify=None):
+        """free -> reserved; returns the reserved slot.
         
-        slots = []
-        for row in rows:
-            slots.append({
-                'slot_id': row[0],
-                'is_occupied': row[1],
-                'is_reserved': row[2],
-                'vehicle_number': row[3],
-                'entry_time': row[4],
-                'user_email': row[5],
-                'user_phone': row[6],
-                'arrival_time': row[7] if len(row) > 7 else None,
-                'reserved_duration': row[8] if len(row) > 8 else 0
-            })
-        return slots
-    
-    def reserve_slot(self, slot_id, user_email, user_phone, vehicle_number, arrival_time=None, duration_hours=0):
+        Write methods that take `notify` call it with their result before
+        committing and queue the outbox messages it returns in the same
+        transaction.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE slots 
-            SET is_reserved = 1, user_email = ?, user_phone = ?, vehicle_number = ?, arrival_time = ?, reserved_duration = ?
-            WHERE slot_id = ? AND is_occupied = 0 AND is_reserved = 0
-        ''', (user_email, user_phone, vehicle_number, arrival_time, duration_hours, slot_id))
+        try:
+            slot = self._transition(cursor, slot_id, 'reserve', '''
+                is_reserved = 1, user_email = ?, user_phone = ?, vehicle_number = ?, arrival_time = ?, reserved_duration = ?
+            ''', (user_email, user_phone, vehicle_number, arrival_time, duration_hours))
+            if slot is None:
+                raise self._invalid(slot_id, 'reserve')
+            self._record(cursor, 'reserve', slot)
+            self._enqueue(cursor, notify, slot)
+            self._commit(conn)
+        except Exception:
+            self._rollback(conn)
+            raise
+        finally:
+            self._release(conn)
+        self._publish(slot)
+        return slot
+    
+    def cancel_reservation(self, slot_id, user_email=None, notify=None):
+        """reserved -> free, billing the reserved hours (PENDING) if any were booked.
         
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return success
+        When `user_email` is given it must match the reservation's. Returns
+        (reservation, billing): the slot as it was before cancelling, and the
+        bill or None.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            reservation = self._locked_slot(cursor, slot_id, 'cancel')
+            if user_email and reservation['user_email'] and reservation['user_email'] != user_email:
+                raise slot_state.ReservationOwnerMismatch(slot_id)
+            
+            slot = self._transition(cursor, slot_id, 'cancel', '''
+                is_reserved = 0, user_email = NULL, user_phone = NULL, vehicle_number = NULL, arrival_time = NULL, reserved_duration = 0
+            ''')
+            
+            billing = None
+            data = None
+            reserved_hours = reservation['reserved_duration']
+            if reserved_hours > 0:
+                # Cancellation fee for the reserved duration (reservation rate of the tariff)
+                quote = self.tariff.quote_reservation(reserved_hours)
+                now = int(time.time())
+                billing = {
+                    'slot_id': slot_id,
+                    'vehicle_number': reservation['vehicle_number'],
+                    'entry_time': now,  # Virtual entry
+                    'exit_time': now,   # Virtual exit
+                    'duration_minutes': int(reserved_hours * 60),
+                    **quote,
+                    'user_email': reservation['user_email'],
+                    'user_phone': reservation['user_phone']
+                }
+                # Saved as a PENDING payment by the event's projection
+                data = {'history': self._history_row(billing)}
+            self._record(cursor, 'cancel', slot, data)
+            self._enqueue(cursor, notify, reservation, billing)
+            self._commit(conn)
+        except Exception:
+            self._rollback(conn)
+            raise
+        finally:
+            self._release(conn)
+        self._publish(slot)
+        if billing:
+            self._history_changed()
+        return reservation, billing
     
-    def cancel_reservation(self, slot_id):
+    def expire_reservation(self, slot_id, arrival_time, notify=None):
+        """reserved -> free, if the slot is still reserved for `arrival_time`.
+
+        Returns the reservation details (for notifications) or None if the slot was
+        cancelled / re-booked / occupied in the meantime.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
+        try:
+            reservation = self._locked_slot(cursor, slot_id, 'expire')
+            slot = self._transition(cursor, slot_id, 'expire', '''
+                is_reserved = 0, user_email = NULL, user_phone = NULL, vehicle_number = NULL, arrival_time = NULL,
+                reserved_duration = 0
+            ''', extra_guard=' AND arrival_time = ?', extra_params=(arrival_time,))
+            if slot is not None:
+                self._record(cursor, 'expire', slot)
+                self._enqueue(cursor, notify, reservation)
+            self._commit(conn)
+        except slot_state.InvalidTransition:
+            self._rollback(conn)
+            return None
+        except Exception:
+            self._rollback(conn)
+            raise
+        finally:
+            self._release(conn)
+        if slot is None:
+            return None
+        self._publish(slot)
+        return reservation
+    
+    def occupy_slot(self, slot_id, entry_time, fence=None):
+        """free / reserved -> occupied; returns the occupied slot.
         
-        # Get reservation details first to calculate bill
-        cursor.execute('SELECT user_email, user_phone, vehicle_number, reserved_duration FROM slots WHERE slot_id = ?', (slot_id,))
-        row = cursor.fetchone()
-        billing = None
+        `fence` is the sync leader's (lease name, token): the update only
+        applies while that token is current, else it raises FencedOut.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            if fence:
+                slot = self._transition(cursor, slot_id, 'occupy', 'is_occupied = 1, entry_time = ?', (entry_time,),
+                                        leader_election.FENCE_GUARD, fence)
+            else:
+                slot = self._transition(cursor, slot_id, 'occupy', 'is_occupied = 1, entry_time = ?', (entry_time,))
+            if slot is None:
+                if fence and not leader_election.holds(cursor, fence):
+                    raise leader_election.FencedOut(fence)
+                raise self._invalid(slot_id, 'occupy')
+            self._record(cursor, 'occupy', slot)
+            self._commit(conn)
+        except Exception:
+            self._rollback(conn)
+            raise
+        finally:
+            self._release(conn)
+        self._publish(slot)
+        return slot
+        
+    def vacate_slot(self, slot_id: int, exit_time: int, user_email=None, user_phone=None, vehicle_number=None,
+                    notify=None):
+        """occupied -> free: bill the session under the active tariff (PENDING history row).
         
-        if row and row[3] > 0: # If duration reserved > 0
-            reserved_hours = row[3]
-            vehicle_number = row[2]
-            user_email = row[0]
-            user_phone = row[1]
+        Payment details passed here (pay-bill) replace the slot's own in the
+        bill, in the same transaction. Returns the billing dict.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            session = self._locked_slot(cursor, slot_id, 'bill')
+            entry_time = session['entry_time']
+            vehicle_number = vehicle_number or session['vehicle_number']
+            user_email = user_email or session['user_email']
+            user_phone = user_phone or session['user_phone']
             
-            # Calculate cancellation fee (same as if they parked for that duration)
-            # Rate: 50 per 30s is crazy high for reservation? 
-            # Assuming hourly rate for reservation is more standard or using same rate?
-            # User said: "if the user reserved for one hour then payment should be show"
-            # Current rate: 50 per 30 SECONDS = 100/min = 6000/hour. This is very high.
-            # Assuming specific rate for reservation/cancellation bill.
-            # Let's assume hourly rate = 100 Rs fixed, OR stick to dynamic.
-            # If dynamic: 1 hour = 60 mins = 3600 secs = 120 intervals * 50 = 6000 Rs.
-            # I will assume standard high rate unless specified. 
-            # Actually, let's use a "Reservation Fee" logic. 
-            # maybe base_charge (30) + (duration_hours * 60 mins * something reasonable?)
-            # Let's use 100 Rs / hour for reservation fee to be sane.
-            reservation_rate_per_hour = 100.0
-            total_amount = 30.0 + (reserved_hours * reservation_rate_per_hour)
+            # Calculate duration in minutes
+            duration_minutes = (exit_time - entry_time) / 60
+            quote = self.tariff.quote(entry_time, exit_time)
             
+            slot = self._transition(cursor, slot_id, 'bill', '''
+                is_occupied = 0, is_reserved = 0, entry_time = NULL,
+                user_email = NULL, user_phone = NULL, vehicle_number = NULL, arrival_time = NULL, reserved_duration = 0
+            ''')
+            
+            # The bill event's projection saves the history row with PENDING payment status
+            self._record(cursor, 'bill', slot, {'history': {
+                'slot_id': slot_id, 'vehicle_number': vehicle_number, 'entry_time': entry_time,
+                'exit_time': exit_time, 'duration_minutes': duration_minutes,
+                'total_amount': quote['total_amount'], 'user_email': user_email, 'user_phone': user_phone
+            }})
             billing = {
                 'slot_id': slot_id,
                 'vehicle_number': vehicle_number,
-                'entry_time': int(time.time()), # Virtual entry
-                'exit_time': int(time.time()),   # Virtual exit
-                'duration_minutes': int(reserved_hours * 60),
-                'base_charge': 30.0,
-                'minute_charge': reserved_hours * reservation_rate_per_hour,
-                'total_amount': total_amount,
+                'entry_time': entry_time,
+                'exit_time': exit_time,
+                'duration_minutes': int(duration_minutes),
+                **quote,
                 'user_email': user_email,
                 'user_phone': user_phone
             }
-            
-            # Save as PENDING payment
-            cursor.execute('''
-                INSERT INTO parking_history 
-                (slot_id, vehicle_number, entry_time, exit_time, duration_minutes, total_amount, user_email, user_phone, payment_status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (slot_id, vehicle_number, int(time.time()), int(time.time()), int(reserved_hours * 60), total_amount, user_email, user_phone, 'PENDING'))
-
-        cursor.execute('''
-            UPDATE slots 
-            SET is_reserved = 0, user_email = NULL, user_phone = NULL, vehicle_number = NULL, arrival_time = NULL, reserved_duration = 0
-            WHERE slot_id = ?
-        ''', (slot_id,))
-        conn.commit()
-        conn.close()
+            self._enqueue(cursor, notify, billing)
+            self._commit(conn)
+        except Exception:
+            self._rollback(conn)
+            raise
+        finally:
+            self._release(conn)
+        self._publish(slot)
+        self._history_changed()
         return billing
     
-    def cancel_expired_reservations(self):
-        """Cancel reservations where arrival_time has passed"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        current_time = int(time.time())
+    @staticmethod
+    def _history_row(billing):
+        """parking_history fields of a billing dict"""
+        return {field: billing[field] for field in (
+            'slot_id', 'vehicle_number', 'entry_time', 'exit_time', 'duration_minutes',
+            'total_amount', 'user_email', 'user_phone'
+        )}
+    
+    @staticmethod
+    def _row_to_history(row):
+        return {
+            'id': row[0],
+            'slot_id': row[1],
+            'vehicle_number': row[2],
+            'entry_time': row[3],
+            'exit_time': row[4],
+            'duration_minutes': row[5],
+            'total_amount': row[6],
+            'user_email': row[7],
+            'user_phone': row[8],
+            'payment_status': row[9] or 'PENDING',
+            'created_at': row[10]
+        }
+    
+    def get_history_page(self, limit=50, cursor=None, slot_id=None, status=None, since=None, until=None):
+        """Keyset-paginated history, newest first.
         
-        cursor.execute('''
-            UPDATE slots 
-            SET is_reserved = 0, user_email = NULL, user_phone = NULL, vehicle_number = NULL, arrival_time = NULL
-            WHERE is_reserved = 1 AND arrival_time IS NOT NULL AND arrival_time < ?
-        ''', (current_time,))
+        since/until filter on exit_time (unix seconds). Without them pages are
+        ordered by id and `next_cursor` is an id; with them pages are ordered by
+        (exit_time, id) and `next_cursor` is "exit_time:id", so each page is a
+        seek on one of the composite indexes. Returns (rows, next_cursor).
+        Raises ValueError for a cursor that does not fit the query.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        by_time = since is not None or until is not None
+        clauses, params = [], []
+        if cursor is not None:
+            if by_time:
+                exit_time, _, last_id = str(cursor).partition(':')
+                if not last_id:
+                    raise ValueError("cursor for a since/until query must be 'exit_time:id'")
+                clauses.append('(exit_time, id) < (?, ?)')
+                params.extend([int(exit_time), int(last_id)])
+            else:
+                clauses.append('id < ?')
+                params.append(int(cursor))
+        if slot_id is not None:
+            clauses.append('slot_id = ?')
+            params.append(slot_id)
+        if status is not None:
+            clauses.append('payment_status = ?')
+            params.append(status)
+        if since is not None:
+            clauses.append('exit_time >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('exit_time < ?')
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
         
-        cancelled_count = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return cancelled_count
-    
-    def occupy_slot(self, slot_id, entry_time):
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE slots 
-            SET is_occupied = 1, entry_time = ?
-            WHERE slot_id = ?
-        ''', (entry_time, slot_id))
-        conn.commit()
-        conn.close()
+        db_cursor = conn.cursor()
+        # Fetch one extra row to know whether another page exists
+        db_cursor.execute(f'''
+            SELECT {HISTORY_COLUMNS} FROM parking_history
+            {where}
+            ORDER BY {'exit_time DESC, id DESC' if by_time else 'id DESC'}
+            LIMIT ?
+        ''', (*params, limit + 1))
+        rows = db_cursor.fetchall()
+        self._release(conn)
         
-    def vacate_slot(self, slot_id: int, exit_time: int):
-        """Vacate slot with real-time pricing: ₹30 base + ₹50 per 30 seconds"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        history = [self._row_to_history(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = history[-1]
+            next_cursor = f"{last['exit_time']}:{last['id']}" if by_time else last['id']
+        return history, next_cursor
+    
+    def iter_history(self, since=None, until=None, status=None, batch_size=1000):
+        """Yield history rows oldest-first from a server-side cursor, batch by batch.
         
-        # Get slot info
-        cursor.execute('''
-            SELECT entry_time, vehicle_number, user_email, user_phone 
-            FROM slots WHERE slot_id = ? AND is_occupied = 1
-        ''', (slot_id,))
+        Uses its own connection: streaming responses may resume the generator on a
+        different threadpool thread, and a long export should not tie up the pool.
+        """
+        clauses, params = [], []
+        if status is not None:
+            clauses.append('payment_status = ?')
+            params.append(status)
+        if since is not None:
+            clauses.append('exit_time >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('exit_time < ?')
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
         
-        slot = cursor.fetchone()
-        if not slot:
+        conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT {HISTORY_COLUMNS} FROM parking_history {where} ORDER BY id', params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [self._row_to_history(row) for row in rows]
+        finally:
             conn.close()
-            return None
-        
-        entry_time, vehicle_number, user_email, user_phone = slot
-        
-        # Calculate duration in minutes
-        duration_seconds = exit_time - entry_time
-        duration_minutes = duration_seconds / 60
-        
-        # Real-time pricing: ₹30 base + ₹50 per 30 seconds
-        base_charge = 30.0
-        rate_per_30_seconds = 50.0
-        
-        # Calculate number of 30-second intervals
-        intervals_30_sec = duration_seconds / 30
-        minute_charge = intervals_30_sec * rate_per_30_seconds
-        
-        total_amount = base_charge + minute_charge
-        
-        # Update slot
-        cursor.execute('''
-            UPDATE slots 
-            SET is_occupied = 0, is_reserved = 0, entry_time = NULL,
-                user_email = NULL, user_phone = NULL, vehicle_number = NULL, arrival_time = NULL
-            WHERE slot_id = ?
-        ''', (slot_id,))
-        
-        # Save to history with PENDING payment status
-        cursor.execute('''
-            INSERT INTO parking_history 
-            (slot_id, vehicle_number, entry_time, exit_time, duration_minutes, total_amount, user_email, user_phone, payment_status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (slot_id, vehicle_number, entry_time, exit_time, duration_minutes, total_amount, user_email, user_phone, 'PENDING'))
-        
-        conn.commit()
-        conn.close()
-        
-        return {
-            'slot_id': slot_id,
-            'vehicle_number': vehicle_number,
-            'entry_time': entry_time,
-            'exit_time': exit_time,
-            'duration_minutes': int(duration_minutes),
-            'base_charge': base_charge,
-            'minute_charge': minute_charge,
-            'total_amount': total_amount,
-            'user_email': user_email,
-            'user_phone': user_phone
-        }
-    
-    def update_occupied_slot_details(self, slot_id, user_email, user_phone, vehicle_number):
-        """Update occupied slot with user details for payment"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE slots
-            SET user_email = ?, user_phone = ?, vehicle_number = ?
-            WHERE slot_id = ? AND is_occupied = 1
-        ''', (user_email, user_phone, vehicle_number, slot_id))
-        
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return success
     
     def get_parking_history(self, limit=50):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM parking_history 
-            ORDER BY created_at DESC 
-            LIMIT ?
-        ''', (limit,))
-        rows = cursor.fetchall()
-        conn.close()
-        
-        history = []
-        for row in rows:
-            history.append({
-                'id': row[0],
-                'slot_id': row[1],
-                'vehicle_number': row[2],
-                'entry_time': row[3],
-                'exit_time': row[4],
-                'duration_minutes': row[5],
-                'total_amount': row[6],
-                'user_email': row[7],
-                'user_phone': row[8],
-                'payment_status': row[9] if len(row) > 9 else 'PENDING',
-                'created_at': row[10] if len(row) > 10 else None
-            })
+        history, _ = self.get_history_page(limit)
         return history
     
     def reset_all_slots(self):
         """Reset all slots to empty state - for database cleanup"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
+        cursor.execute(f'''
             UPDATE slots 
             SET is_occupied = 0, is_reserved = 0, vehicle_number = NULL,
-                entry_time = NULL, user_email = NULL, user_phone = NULL, arrival_time = NULL
+                entry_time = NULL, user_email = NULL, user_phone = NULL, arrival_time = NULL, reserved_duration = 0
+            RETURNING {SLOT_COLUMNS}
         ''')
-        conn.commit()
-        conn.close()
+        slots = [self._row_to_slot(row) for row in cursor.fetchall()]
+        for slot in slots:
+            self._record(cursor, 'reset', slot)
+        self._commit(conn)
+        self._release(conn)
+        for slot in slots:
+            self._publish(slot)
     
     def mark_payment_paid(self, history_id):
-        """Mark a payment as PAID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE parking_history 
-            SET payment_status = 'PAID'
-            WHERE id = ?
-        ''', (history_id,))
-        conn.commit()
-        conn.close()
+        """Mark a payment as PAID (and move it from PENDING to PAID in the rollups)"""
+        return self.settle_payments([history_id])[0]['status'] == 'PAID'
     
-    def get_pending_payments(self):
-        """Get all pending payments"""
+    def settle_payments(self, history_ids=None, vehicle_number=None, slot_id=None, before=None):
+        """Mark many payments PAID in one transaction.
+        
+        Takes explicit history IDs, or a filter over PENDING rows (vehicle, slot,
+        exit_time before). Returns [{'id', 'status'}] with status PAID, ALREADY_PAID
+        or NOT_FOUND; rollups are moved from PENDING to PAID in the same commit.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM parking_history 
-            WHERE payment_status = 'PENDING'
-            ORDER BY created_at DESC
-        ''')
-        rows = cursor.fetchall()
-        conn.close()
+        try:
+            # Take the write lock up front so nothing settles these rows between read and update
+            self._begin_immediate(cursor)
+            found = {}
+            if history_ids is None:
+                clauses, params = ["payment_status = 'PENDING'"], []
+                if vehicle_number is not None:
+                    clauses.append('vehicle_number = ?')
+                    params.append(vehicle_number)
+                if slot_id is not None:
+                    clauses.append('slot_id = ?')
+                    params.append(slot_id)
+                if before is not None:
+                    clauses.append('exit_time < ?')
+                    params.append(before)
+                cursor.execute(f'''
+                    SELECT id, payment_status, slot_id, exit_time, total_amount
+                    FROM parking_history WHERE {' AND '.join(clauses)} ORDER BY id
+                ''', params)
+                for row in cursor.fetchall():
+                    found[row[0]] = row
+                history_ids = list(found)
+            else:
+                history_ids = list(dict.fromkeys(int(i) for i in history_ids))
+                for start in range(0, len(history_ids), MAX_PAGE_SIZE):
+                    chunk = history_ids[start:start + MAX_PAGE_SIZE]
+                    cursor.execute(f'''
+                        SELECT id, payment_status, slot_id, exit_time, total_amount
+                        FROM parking_history WHERE id IN ({', '.join('?' for _ in chunk)})
+                    ''', chunk)
+                    for row in cursor.fetchall():
+                        found[row[0]] = row
+            
+            results, payments = [], []
+            for history_id in history_ids:
+                row = found.get(history_id)
+                if row is None:
+                    results.append({'id': history_id, 'status': 'NOT_FOUND'})
+                    continue
+                _, payment_status, row_slot, exit_time, total_amount = row
+                if payment_status == 'PAID':
+                    results.append({'id': history_id, 'status': 'ALREADY_PAID'})
+                    continue
+                results.append({'id': history_id, 'status': 'PAID', 'amount': total_amount})
+                payments.append([history_id, row_slot, exit_time, payment_status, total_amount])
+            
+            # The payment event's projection updates the rows and moves the rollups
+            if payments:
+                self._record(cursor, 'payment', data={'payments': payments})
+            self._commit(conn)
+        except Exception:
+            self._rollback(conn)
+            raise
+        finally:
+            self._release(conn)
+        if payments:
+            self._history_changed()
+        return results
+    
+    def get_pending_payments(self, limit=100, cursor=None, **filters):
+        """Get pending payments, one keyset page at a time -> (rows, next_cursor)"""
+        return self.get_history_page(limit, cursor, status='PENDING', **filters)
+    
+    def get_revenue_stats(self, since=None, until=None, group_by=None, status='PAID'):
+        """Revenue totals from the rollup tables (cost independent of history size).
         
-        history = []
-        for row in rows:
-            history.append({
-                'id': row[0],
-                'slot_id': row[1],
-                'vehicle_number': row[2],
-                'entry_time': row[3],
-                'exit_time': row[4],
-                'duration_minutes': row[5],
-                'total_amount': row[6],
-                'user_email': row[7],
-                'user_phone': row[8],
-                'payment_status': row[9],
-                'created_at': row[10]
-            })
-        return history
+        since/until are unix seconds on exit_time (hour resolution); group_by is
+        one of hour/day/month/slot (buckets in the tariff's local time); status
+        is PAID, PENDING or ALL.
+        """
+        statuses = ('PAID', 'PENDING') if status == 'ALL' else (status,)
+        conn = self.get_connection()
+        stats = revenue_rollups.query(conn, since, until, group_by, statuses, self.tariff.utc_offset)
+        self._release(conn)
+        return stats
     
-    def get_revenue_stats(self):
-        """Get total revenue statistics"""
+    def requote_history(self, tariff=None, since=None, until=None, status=None):
+        """What-if revenue for the history under `tariff` (defaults to the active one)"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Calculate total revenue from PAID sessions
-        cursor.execute('''
-            SELECT SUM(total_amount), COUNT(*) 
-            FROM parking_history 
-            WHERE payment_status = 'PAID'
-        ''')
-        row = cursor.fetchone()
-        conn.close()
-        
-        total_revenue = row[0] if row[0] else 0.0
-        total_sessions = row[1] if row[1] else 0
-        
-        return {
-            "total_revenue": total_revenue,
-            "total_sessions": total_sessions
-        }
+        result = requote_history(conn, tariff or self.tariff, since, until, status)
+        self._release(conn)
+        return result
+    
+    def get_events(self, since=None, until=None, slot_id=None, cursor=None, limit=100):
+        """Logged events in an `at` window, oldest first: returns (events, next_cursor)"""
+        conn = self.get_connection()
+        result = event_log.events(conn, since, until, slot_id, cursor, limit)
+        self._release(conn)
+        return result
+    
+    def replay_slots(self, at=None):
+        """All slots as they were at time `at`, replayed from the event log"""
+        conn = self.get_connection()
+        result = event_log.replay(conn, at)
+        self._release(conn)
+        return result
+    
+    def rebuild_history(self):
+        """Re-derive parking_history and the rollups from the event log (commits itself)"""
+        conn = self.get_connection()
+        applied = event_log.rebuild_history(conn, self.tariff.utc_offset)
+        self._release(conn)
+        self._history_changed()
+        return applied
+    
+    def rebuild_revenue_rollups(self):
+        """Recompute all rollups from parking_history (backfill)"""
+        conn = self.get_connection()
+        buckets = revenue_rollups.backfill(conn, self.tariff.utc_offset)
+        self._release(conn)
+        self._history_changed()
+        return buckets
     
     def clear_history(self):
         """Clear all parking history"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM parking_history')
+        self._record(cursor, 'history_cleared', data={})
         # Also reset sequence if desired, but not strictly necessary for history ID
         # cursor.execute("DELETE FROM sqlite_sequence WHERE name='parking_history'")
-        conn.commit()
-        conn.close()
\ No newline at end of file
+        self._commit(conn)
+        self._release(conn)
+        self._history_changed()
+
+
+# Per-method latency for /metrics
+instrument_methods(Database, exclude=('get_connection', 'close', 'write_batch', 'run_in_savepoint'))
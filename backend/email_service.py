@@ -1,44 +1,203 @@
 import smtplib
+import threading
+import time
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 
+class SMTPSessionPool:
+    """Small pool of logged-in SMTP sessions that are reused across sends.
+
+    Sessions idle longer than `noop_after` seconds are checked with NOOP before
+    reuse, sessions idle longer than `idle_timeout` are closed, and broken
+    sessions are replaced with a fresh connection.
+    """
+
+    def __init__(self, smtp_server: str, smtp_port: int, email: str, password: str,
+                 security: str = None, max_sessions: int = 2, idle_timeout: float = 60.0,
+                 noop_after: float = 10.0, timeout: float = 10.0):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.email = email
+        self.password = password
+        # 'ssl' (implicit TLS, port 465), 'starttls' or 'plain' (local test servers)
+        self.security = security or ('ssl' if smtp_port == 465 else 'starttls')
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.noop_after = noop_after
+        self.timeout = timeout
+        self._idle = []  # [(session, last_used)], most recently used last
+        self._open = 0
+        self._cond = threading.Condition()
+        self.stats = {"connects": 0, "reuses": 0, "reconnects": 0}
+
+    def _connect(self):
+        if self.security == 'ssl':
+            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+            if self.security == 'starttls':
+                server.starttls()
+        if self.password:
+            server.login(self.email, self.password)
+        self.stats["connects"] += 1
+        return server
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _is_alive(self, server) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                # Drop sessions that sat idle past the timeout
+                while self._idle and now - self._idle[0][1] > self.idle_timeout:
+                    stale, _ = self._idle.pop(0)
+                    self._open -= 1
+                    self._close(stale)
+                if self._idle:
+                    server, last_used = self._idle.pop()
+                    break
+                if self._open < self.max_sessions:
+                    self._open += 1
+                    server, last_used = None, now
+                    break
+                self._cond.wait()
+
+        if server is not None and (now - last_used <= self.noop_after or self._is_alive(server)):
+            self.stats["reuses"] += 1
+            return server
+        if server is not None:
+            self.stats["reconnects"] += 1
+            self._close(server)
+        try:
+            return self._connect()
+        except Exception:
+            self._discard()
+            raise
+
+    def release(self, server, broken: bool = False):
+        if broken:
+            self._close(server)
+            self._discard()
+            return
+        with self._cond:
+            self._idle.append((server, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def session(self):
+        server = self.acquire()
+        try:
+            yield server
+        except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError):
+            self.release(server, broken=True)
+            raise
+        except Exception:
+            self.release(server)
+            raise
+        else:
+            self.release(server)
+
+    def send(self, msg, retries: int = 1):
+        """Send one message, reconnecting once if the pooled session went away"""
+        for attempt in range(retries + 1):
+            try:
+                with self.session() as server:
+                    server.send_message(msg)
+                return
+            except (smtplib.SMTPServerDisconnected, OSError):
+                if attempt == retries:
+                    raise
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for server, _ in idle:
+            self._close(server)
+
+
 class EmailService:
-    def __init__(self, smtp_server: str, smtp_port: int, email: str, password: str):
+    def __init__(self, smtp_server: str, smtp_port: int, email: str, password: str,
+                 security: str = None, pool_size: int = 2, idle_timeout: float = 60.0):
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.email = email
         self.password = password
+        self.pool = SMTPSessionPool(smtp_server, smtp_port, email, password,
+                                    security=security, max_sessions=pool_size,
+                                    idle_timeout=idle_timeout)
+    
+    def _build_message(self, to_email: str, subject: str, html_content: str, sender: str = None):
+        msg = MIMEMultipart('alternative')
+        msg['From'] = sender or self.email
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(html_content, 'html'))
+        return msg
     
     def _send_email(self, to_email: str, subject: str, html_content: str) -> bool:
-        """Helper method to send email using SMTP_SSL"""
+        """Helper method to send email over a pooled SMTP session"""
         try:
-            msg = MIMEMultipart('alternative')
-            msg['From'] = self.email
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            msg.attach(MIMEText(html_content, 'html'))
-            
-            # Use SMTP_SSL for port 465 (Gmail defaults)
-            if self.smtp_port == 465:
-                # SSL connection
-                with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as server:
-                    server.login(self.email, self.password)
-                    server.send_message(msg)
-            else:
-                # TLS connection
-                with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                    server.starttls()
-                    server.login(self.email, self.password)
-                    server.send_message(msg)
-            
+            self.pool.send(self._build_message(to_email, subject, html_content))
             print(f"✅ Email sent to {to_email}: {subject}")
             return True
             
         except Exception as e:
             print(f"❌ Error sending email to {to_email}: {e}")
             return False
+    
+    def send_batch(self, messages: list) -> list:
+        """Send many (to_email, subject, html) messages over a single SMTP session.
+        
+        Returns one bool per message, in order.
+        """
+        results = [False] * len(messages)
+        pending = list(range(len(messages)))
+        # One reconnect is allowed if the session drops mid-batch
+        for _ in range(2):
+            if not pending:
+                break
+            try:
+                with self.pool.session() as server:
+                    while pending:
+                        index = pending[0]
+                        to_email, subject, html_content = messages[index]
+                        try:
+                            server.send_message(self._build_message(to_email, subject, html_content))
+                            results[index] = True
+                        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                            # The server rejected this message (recipient, sender, data): skip it
+                            print(f"❌ Error sending email to {to_email}: {e}")
+                        pending.pop(0)
+            except (smtplib.SMTPServerDisconnected, OSError) as e:
+                print(f"❌ Batch email session dropped: {e}")
+            except smtplib.SMTPException as e:
+                # Could not open a session at all (e.g. login refused): reconnecting will not help
+                print(f"❌ Batch email session error: {e}")
+                break
+        print(f"✅ Batch email: {sum(results)}/{len(messages)} sent")
+        return results
 
     def send_billing_email(self, to_email: str, billing_info: dict) -> bool:
         """Send billing email to user"""
@@ -83,8 +242,8 @@ class EmailService:
                     
                     <div style="margin-top: 20px; padding: 15px; background-color: #eff6ff; border-left: 4px solid #2563eb; border-radius: 4px;">
                         <p style="margin: 0; color: #1e40af;"><strong>Billing Details:</strong></p>
-                        <p style="margin: 5px 0; color: #475569;">Rate: ₹50 per minute</p>
-                        <p style="margin: 5px 0; color: #475569;">Minimum charge: ₹30</p>
+                        <p style="margin: 5px 0; color: #475569;">Rate: {billing_info.get('rate_description', '')}</p>
+                        <p style="margin: 5px 0; color: #475569;">Minimum charge: ₹{billing_info.get('base_charge', 0):.2f}</p>
                     </div>
                     
                     <p style="text-align: center; color: #64748b; margin-top: 30px; font-size: 14px;">
@@ -135,4 +294,56 @@ class EmailService:
             </body>
         </html>
         """
-        return self._send_email(to_email, subject, html)
\ No newline at end of file
+        return self._send_email(to_email, subject, html)
+
+    def _receipt_html(self, receipt: dict) -> str:
+        # History rows only keep the billed total, so the breakdown is optional
+        breakdown = ''
+        if receipt.get('base_charge') is not None:
+            breakdown += f"<p><strong>Base Charge:</strong> ₹{receipt['base_charge']:.2f}</p>"
+        if receipt.get('minute_charge') is not None:
+            breakdown += f"<p><strong>Minute Charge:</strong> ₹{receipt['minute_charge']:.2f}</p>"
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <body style="font-family: Arial; background: #f3f4f6;">
+            <div style="max-width: 600px; margin: 40px auto; background: white; border-radius: 16px; overflow: hidden;">
+                <div style="background: linear-gradient(135deg, #3b82f6, #8b5cf6); padding: 40px; text-align: center; color: white;">
+                    <h1>🚗 Parking Receipt</h1>
+                </div>
+                <div style="padding: 30px;">
+                    <h2>Parking Details</h2>
+                    <p><strong>Slot:</strong> {receipt['slot_number']}</p>
+                    <p><strong>Vehicle:</strong> {receipt['vehicle_number']}</p>
+                    <p><strong>Entry:</strong> {receipt['entry_time']}</p>
+                    <p><strong>Exit:</strong> {receipt['exit_time']}</p>
+                    <p><strong>Duration:</strong> {receipt['duration_minutes']} minutes</p>
+                    <hr>
+                    <h2>Billing</h2>
+                    {breakdown}
+                    <h1 style="color: #10b981;">Total: ₹{receipt['total_amount']:.2f}</h1>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+
+    def send_receipt_email(self, receipt: dict) -> bool:
+        """Send a parking receipt (EmailReceipt fields) to receipt['to_email']"""
+        subject = f"🚗 Parking Receipt - {receipt['vehicle_number']}"
+        try:
+            msg = self._build_message(receipt['to_email'], subject, self._receipt_html(receipt),
+                                      sender=f"Smart Parking System <{self.email}>")
+            self.pool.send(msg)
+            print(f"✅ Receipt sent to {receipt['to_email']}")
+            return True
+        except Exception as e:
+            print(f"❌ Email error: {e}")
+            return False
+
+    def send_receipt_batch(self, receipts: list) -> list:
+        """Send many receipts over one pooled SMTP session"""
+        return self.send_batch([
+            (r['to_email'], f"🚗 Parking Receipt - {r['vehicle_number']}", self._receipt_html(r))
+            for r in receipts
+        ])
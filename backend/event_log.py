@@ -0,0 +1,253 @@
+"""
+Append-only log of slot lifecycle events, with parking_history as a projection.
+
+Every transition (reserve, cancel, expire, occupy, bill, reset)
+and every payment is appended to slot_events in the same transaction as the
+change it describes, so a write batch of the async writer group-commits its
+events together. Slot events carry the slot row as it is after the event;
+billing and payment events carry the data parking_history is built from, and
+project() is the only code that writes parking_history and its rollups.
+
+Every SNAPSHOT_EVERY events a compact copy of all slots is stored, so
+rebuilding slot state (at startup, or as of any past time) reads one snapshot
+plus at most SNAPSHOT_EVERY events.
+
+    python event_log.py rebuild-history [db]   # re-derive parking_history from the log
+"""
+import json
+import sys
+import time
+
+import revenue_rollups
+
+SNAPSHOT_EVERY = 1000
+MAX_PAGE_SIZE = 1000
+
+CREATE_TABLES = ('''
+    CREATE TABLE IF NOT EXISTS slot_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        at REAL NOT NULL,
+        event TEXT NOT NULL,
+        slot_id INTEGER,
+        slot TEXT,
+        data TEXT
+    )
+''', '''
+    CREATE INDEX IF NOT EXISTS idx_slot_events_at ON slot_events (at)
+''', '''
+    CREATE INDEX IF NOT EXISTS idx_slot_events_slot ON slot_events (slot_id, seq)
+''', '''
+    CREATE TABLE IF NOT EXISTS slot_snapshots (
+        seq INTEGER PRIMARY KEY,
+        at REAL NOT NULL,
+        slots TEXT NOT NULL
+    )
+''')
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':')) if value is not None else None
+
+
+def _loads(value):
+    return json.loads(value) if value is not None else None
+
+
+# ============= WRITING =============
+
+def append(cursor, event, slot=None, data=None, slot_id=None, at=None) -> int:
+    """Append one event in the caller's transaction; returns its sequence number"""
+    cursor.execute(
+        'INSERT INTO slot_events (at, event, slot_id, slot, data) VALUES (?, ?, ?, ?, ?)',
+        (time.time() if at is None else at, event, slot['slot_id'] if slot else slot_id, _dumps(slot), _dumps(data))
+    )
+    return cursor.lastrowid
+
+
+def record(cursor, event, slot=None, data=None, offset=0) -> int:
+    """Project an event onto parking_history, then append it (same transaction)"""
+    if data is not None:
+        project(cursor, event, data, offset=offset)
+    return append(cursor, event, slot, data)
+
+
+def snapshot(cursor, seq, slots, at=None):
+    """Store all slots as of event `seq` (compact: one field list, then rows)"""
+    fields = list(slots[0]) if slots else []
+    payload = {'fields': fields, 'rows': [[slot[field] for field in fields] for slot in slots]}
+    cursor.execute(
+        'INSERT OR REPLACE INTO slot_snapshots (seq, at, slots) VALUES (?, ?, ?)',
+        (seq, time.time() if at is None else at, _dumps(payload))
+    )
+
+
+def is_started(cursor) -> bool:
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM slot_events)')
+    return bool(cursor.fetchone()[0])
+
+
+def start(cursor, slots):
+    """First event of a new log: remembers which history rows predate it, plus a snapshot"""
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM parking_history')
+    seq = append(cursor, 'log_started', data={'history_baseline_id': cursor.fetchone()[0]})
+    snapshot(cursor, seq, slots)
+    return seq
+
+
+# ============= PROJECTION =============
+
+def project(cursor, event, data, rollups=True, offset=0):
+    """Apply an event to parking_history (and the revenue rollups, bucketed at UTC offset `offset`).
+
+    Fills in data['history']['id'] for new rows, so a rebuild reproduces the IDs.
+    """
+    if event in ('bill', 'cancel') and data.get('history'):
+        row = data['history']
+        cursor.execute('''
+            INSERT INTO parking_history
+            (id, slot_id, vehicle_number, entry_time, exit_time, duration_minutes, total_amount, user_email, user_phone, payment_status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'PENDING')
+        ''', (row.get('id'), row['slot_id'], row['vehicle_number'], row['entry_time'], row['exit_time'],
+              row['duration_minutes'], row['total_amount'], row['user_email'], row['user_phone']))
+        row['id'] = cursor.lastrowid
+        if rollups:
+            revenue_rollups.apply(cursor, row['slot_id'], row['exit_time'], 'PENDING', row['total_amount'],
+                                  offset=offset)
+    elif event == 'payment':
+        # [history_id, slot_id, exit_time, previous_status, amount]
+        payments = data['payments']
+        cursor.executemany("UPDATE parking_history SET payment_status = 'PAID' WHERE id = ?",
+                           [(payment[0],) for payment in payments])
+        if rollups:
+            changes = []
+            for _, slot_id, exit_time, previous_status, amount in payments:
+                changes.append((slot_id, exit_time, previous_status or 'PENDING', -(amount or 0.0), -1))
+                changes.append((slot_id, exit_time, 'PAID', amount, 1))
+            revenue_rollups.apply_many(cursor, changes, offset)
+    elif event == 'history_cleared':
+        cursor.execute('DELETE FROM parking_history')
+        if rollups:
+            cursor.execute('DELETE FROM revenue_rollups')
+
+
+def rebuild_history(conn, offset=0) -> int:
+    """Re-derive parking_history and the rollups from the log; returns events applied.
+
+    Rows older than the log (up to its history baseline) are kept as they are.
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute("SELECT data FROM slot_events WHERE event = 'log_started' ORDER BY seq LIMIT 1")
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return 0
+        cursor.execute('DELETE FROM parking_history WHERE id > ?', (_loads(row[0])['history_baseline_id'],))
+        applied = 0
+        cursor.execute('''
+            SELECT event, data FROM slot_events
+            WHERE event IN ('bill', 'cancel', 'payment', 'history_cleared') ORDER BY seq
+        ''')
+        writer = conn.cursor()
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for event, data in rows:
+                data = _loads(data) or {}
+                project(writer, event, data, rollups=False)
+                applied += 1
+        # Recomputes the rollups and commits them together with the rebuilt rows
+        revenue_rollups.backfill(conn, offset)
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
+
+
+# ============= READING =============
+
+def _row_to_event(row):
+    return {
+        'seq': row[0],
+        'at': row[1],
+        'event': row[2],
+        'slot_id': row[3],
+        'slot': _loads(row[4]),
+        'data': _loads(row[5])
+    }
+
+
+def events(conn, since=None, until=None, slot_id=None, after_seq=None, limit=100):
+    """Events in [since, until) oldest first, keyset-paginated: returns (events, next_cursor)"""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    clauses, params = [], []
+    if after_seq is not None:
+        clauses.append('seq > ?')
+        params.append(after_seq)
+    if since is not None:
+        clauses.append('at >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('at < ?')
+        params.append(until)
+    if slot_id is not None:
+        clauses.append('slot_id = ?')
+        params.append(slot_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT seq, at, event, slot_id, slot, data FROM slot_events
+        {where} ORDER BY seq LIMIT ?
+    ''', (*params, limit + 1))
+    rows = cursor.fetchall()
+    result = [_row_to_event(row) for row in rows[:limit]]
+    return result, (result[-1]['seq'] if len(rows) > limit else None)
+
+
+def replay(conn, at=None):
+    """Slot state as of time `at` (default: now) from the nearest snapshot plus later events.
+
+    Returns {'slots': [...], 'snapshot_seq', 'last_seq', 'replayed'}.
+    """
+    cursor = conn.cursor()
+    if at is None:
+        cursor.execute('SELECT seq, slots FROM slot_snapshots ORDER BY seq DESC LIMIT 1')
+    else:
+        cursor.execute('SELECT seq, slots FROM slot_snapshots WHERE at <= ? ORDER BY seq DESC LIMIT 1', (at,))
+    row = cursor.fetchone()
+    if row is None:
+        return {'slots': [], 'snapshot_seq': None, 'last_seq': None, 'replayed': 0}
+    snapshot_seq, payload = row[0], _loads(row[1])
+    slots = {values[0]: dict(zip(payload['fields'], values)) for values in payload['rows']}
+
+    if at is None:
+        cursor.execute('SELECT seq, slot FROM slot_events WHERE seq > ? AND slot IS NOT NULL ORDER BY seq', (snapshot_seq,))
+    else:
+        cursor.execute('''
+            SELECT seq, slot FROM slot_events WHERE seq > ? AND at <= ? AND slot IS NOT NULL ORDER BY seq
+        ''', (snapshot_seq, at))
+    replayed, last_seq = 0, snapshot_seq
+    for seq, slot in cursor.fetchall():
+        slot = _loads(slot)
+        slots[slot['slot_id']] = slot
+        replayed += 1
+        last_seq = seq
+    return {
+        'slots': [slots[slot_id] for slot_id in sorted(slots)],
+        'snapshot_seq': snapshot_seq,
+        'last_seq': last_seq,
+        'replayed': replayed
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild-history':
+        print(__doc__)
+        sys.exit(1)
+    import sqlite3
+    connection = sqlite3.connect(sys.argv[2] if len(sys.argv) > 2 else 'parking_system.db')
+    started = time.perf_counter()
+    count = rebuild_history(connection)
+    print(f"✓ Rebuilt parking_history from {count} events in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,50 @@
+import csv
+import io
+import json
+import zlib
+
+EXPORT_FIELDS = ['id', 'slot_id', 'vehicle_number', 'entry_time', 'exit_time', 'duration_minutes',
+                 'total_amount', 'user_email', 'user_phone', 'payment_status', 'created_at']
+
+MEDIA_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    yield buffer.getvalue()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+def _ndjson_chunks(batches):
+    for batch in batches:
+        yield ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in batch)
+
+def export_stream(batches, fmt: str = 'csv', compress: bool = False):
+    """Turn history row batches into a byte stream (CSV or NDJSON, optionally gzip).
+
+    Only one batch is held in memory at a time, whatever the total row count.
+    """
+    chunks = _csv_chunks(batches) if fmt == 'csv' else _ndjson_chunks(batches)
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    first = True
+    for chunk in chunks:
+        data = gzip.compress(chunk.encode('utf-8'))
+        if first:
+            # Flush the header chunk right away so the first byte isn't held back
+            data += gzip.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield gzip.flush()
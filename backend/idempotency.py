@@ -0,0 +1,271 @@
+"""
+Idempotency-Key support for mutating requests (POST / PUT / PATCH / DELETE).
+
+A client that retries a request with the same Idempotency-Key gets the first
+response back instead of running the handler again, so a retried reserve or
+pay-bill does not repeat the DB work, the Blynk calls or the notifications.
+
+- completed responses live in a bounded in-memory TTL/LRU cache (a replay is a
+  dict lookup) and in the idempotency_keys table, which survives restarts and
+  is shared by every worker on the same database
+- a key is claimed in SQLite before the handler runs; a duplicate arriving
+  while the first is still running waits for it (same process) or gets 409
+  (another process)
+- 5xx responses and handler crashes release the key, so the retry runs again
+- reusing a key for a different request (method, path or body) gets 422
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+MUTATING_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+
+
+class CachedResponse:
+    __slots__ = ("fingerprint", "status", "headers", "body", "expires_at")
+
+    def __init__(self, fingerprint, status, headers, body, expires_at):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """Stored responses by key: in-memory LRU in front of a SQLite table.
+
+    The in-memory part is only touched from the event loop; the SQLite
+    methods are blocking and meant for a worker thread.
+    """
+
+    def __init__(self, db, ttl: float = 24 * 3600, capacity: int = 2048,
+                 max_body: int = 64 * 1024, claim_timeout: float = 60.0, purge_every: int = 500):
+        self.db = db
+        self.ttl = ttl
+        self.capacity = capacity
+        self.max_body = max_body
+        self.claim_timeout = claim_timeout
+        self.purge_every = purge_every
+        self._cache = OrderedDict()
+        self._saved_since_purge = 0
+        self.stats = {"replayed": 0, "stored": 0, "released": 0, "conflicts": 0, "mismatches": 0}
+
+    def init_table(self):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                created_at REAL NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys (created_at)')
+        conn.commit()
+        self.purge_expired()
+
+    # ============= MEMORY =============
+
+    def get_cached(self, key) -> Optional[CachedResponse]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.time():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def remember(self, key, entry: CachedResponse):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    # ============= SQLITE =============
+
+    def claim(self, key, fingerprint) -> Optional[CachedResponse]:
+        """Take the key for a new request: None if claimed, else the existing entry.
+
+        An existing entry with status None is still in flight elsewhere. Expired
+        entries and claims older than claim_timeout (a crashed worker) are taken over.
+        """
+        now = time.time()
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO idempotency_keys (key, fingerprint, created_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE
+            SET fingerprint = excluded.fingerprint, status = NULL, headers = NULL, body = NULL,
+                created_at = excluded.created_at
+            WHERE created_at < ? OR (status IS NULL AND created_at < ?)
+            RETURNING key
+        ''', (key, fingerprint, now, now - self.ttl, now - self.claim_timeout))
+        claimed = bool(cursor.fetchall())
+        if claimed:
+            conn.commit()
+            return None
+        cursor.execute('SELECT fingerprint, status, headers, body, created_at FROM idempotency_keys WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        conn.commit()
+        if row is None:
+            return None
+        fingerprint, status, headers, body, created_at = row
+        return CachedResponse(fingerprint, status, json.loads(headers) if headers else [], body or b"",
+                              created_at + self.ttl)
+
+    def complete(self, key, entry: CachedResponse):
+        conn = self.db.get_connection()
+        conn.execute('''
+            UPDATE idempotency_keys SET status = ?, headers = ?, body = ?, created_at = ?
+            WHERE key = ?
+        ''', (entry.status, json.dumps(entry.headers), entry.body, entry.expires_at - self.ttl, key))
+        conn.commit()
+        self._saved_since_purge += 1
+        if self._saved_since_purge >= self.purge_every:
+            self.purge_expired()
+
+    def release(self, key):
+        """Forget an unfinished claim so the next attempt runs the handler"""
+        conn = self.db.get_connection()
+        conn.execute('DELETE FROM idempotency_keys WHERE key = ? AND status IS NULL', (key,))
+        conn.commit()
+
+    def purge_expired(self) -> int:
+        self._saved_since_purge = 0
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (time.time() - self.ttl,))
+        conn.commit()
+        return cursor.rowcount
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, cached=len(self._cache), capacity=self.capacity, ttl_seconds=self.ttl)
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware replaying stored responses for repeated Idempotency-Keys"""
+
+    def __init__(self, app, store: IdempotencyStore):
+        self.app = app
+        self.store = store
+        self._in_flight = {}  # key -> asyncio.Event, requests running in this process
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in MUTATING_METHODS:
+            await self.app(scope, receive, send)
+            return
+        key = None
+        for name, value in scope["headers"]:
+            if name == HEADER:
+                key = value.decode("latin-1").strip()
+                break
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, {"detail": f"Idempotency-Key longer than {MAX_KEY_LENGTH} characters"})
+            return
+
+        # The body is part of the fingerprint, so read it all and replay it to the app
+        messages, body = [], b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        fingerprint = hashlib.sha256(
+            b"\n".join([scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body])
+        ).hexdigest()
+
+        # Same key already running in this process: wait for it, then replay
+        while key in self._in_flight:
+            await self._in_flight[key].wait()
+        cached = self.store.get_cached(key)
+        if cached is None:
+            self._in_flight[key] = asyncio.Event()
+            try:
+                cached = await run_in_threadpool(self.store.claim, key, fingerprint)
+                if cached is None:
+                    await self._run(key, fingerprint, scope, messages, receive, send)
+                    return
+                if cached.status is not None:
+                    self.store.remember(key, cached)
+            finally:
+                self._in_flight.pop(key).set()
+
+        if cached.fingerprint != fingerprint:
+            self.store.stats["mismatches"] += 1
+            await _send_json(send, 422, {"detail": "Idempotency-Key was already used for a different request"})
+        elif cached.status is None:
+            self.store.stats["conflicts"] += 1
+            await _send_json(send, 409, {"detail": "A request with this Idempotency-Key is still in progress"})
+        else:
+            self.store.stats["replayed"] += 1
+            headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in cached.headers]
+            headers.append((b"idempotent-replayed", b"true"))
+            await send({"type": "http.response.start", "status": cached.status, "headers": headers})
+            await send({"type": "http.response.body", "body": cached.body})
+
+    async def _run(self, key, fingerprint, scope, messages, receive, send):
+        """Run the handler once for a claimed key and store what it answered"""
+        replay = list(messages)
+
+        async def replay_receive():
+            if replay:
+                return replay.pop(0)
+            return await receive()
+
+        status, headers, chunks, size = None, [], [], 0
+
+        async def capture_send(message):
+            nonlocal status, headers, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in message.get("headers", [])]
+            elif message["type"] == "http.response.body" and size <= self.store.max_body:
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                chunks.append(chunk)
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except Exception:
+            self.store.stats["released"] += 1
+            await run_in_threadpool(self.store.release, key)
+            raise
+
+        if status is None or status >= 500 or size > self.store.max_body:
+            # Nothing worth replaying (or too big to keep): let the next attempt run
+            self.store.stats["released"] += 1
+            await run_in_threadpool(self.store.release, key)
+            return
+        entry = CachedResponse(fingerprint, status, headers, b"".join(chunks), time.time() + self.store.ttl)
+        self.store.remember(key, entry)
+        self.store.stats["stored"] += 1
+        await run_in_threadpool(self.store.complete, key, entry)
+
+
+async def _send_json(send, status: int, payload: dict):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,40 @@
+import threading
+import time
+
+class LazyService:
+    """Builds a service on first use instead of at import.
+
+    Truthiness says whether the service is configured without building it, so
+    existing `if email_service:` checks keep working; the first attribute
+    access constructs the real object (once, thread-safe) and delegates to it.
+    """
+
+    def __init__(self, name: str, factory, enabled: bool = True):
+        self._name = name
+        self._factory = factory
+        self._enabled = enabled
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return self._enabled
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._instance is not None
+
+    def resolve(self):
+        instance = self._instance
+        if instance is None:
+            if not self._enabled:
+                raise RuntimeError(f"{self._name} is not configured")
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    self._instance = self._factory()
+                    print(f"✓ {self._name} initialized ({(time.perf_counter() - start) * 1000:.0f} ms)")
+                instance = self._instance
+        return instance
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
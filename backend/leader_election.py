@@ -0,0 +1,185 @@
+"""
+Single-leader election among processes sharing one SQLite database.
+
+With `uvicorn --workers N` every worker runs the lifespan, so without this
+each one would poll Blynk. Instead, every worker tries to take a lease row
+(name, holder, token, expires_at) in the shared database every ttl / 3
+seconds:
+
+- the holder renews it before it expires; anyone else can only take it
+  once it has expired, so exactly one process leads at a time
+- each takeover increments the fencing token, and writes made on the
+  leader's behalf carry it (FENCE_GUARD): a leader that stalled past its
+  lease and was replaced cannot write with its old token
+- a leader that cannot renew in time steps down on its own clock, and a
+  graceful shutdown hands the lease over at once
+
+A crashed leader is replaced within ttl + ttl / 3 seconds.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+CREATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        token INTEGER NOT NULL,
+        acquired_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    )
+'''
+
+# Appended to a write's WHERE clause with params (name, token): the write only
+# matches while that token is still the current one
+FENCE_GUARD = ' AND EXISTS (SELECT 1 FROM leases WHERE name = ? AND token = ?)'
+
+
+class FencedOut(Exception):
+    """A write carried a fencing token that a newer leader has superseded"""
+
+    def __init__(self, fence):
+        self.fence = fence
+        super().__init__(f"Lease '{fence[0]}' token {fence[1]} is no longer current")
+
+
+def holds(cursor, fence) -> bool:
+    """Whether `fence` (name, token) is still current, in the caller's transaction"""
+    cursor.execute('SELECT token FROM leases WHERE name = ?', (fence[0],))
+    row = cursor.fetchone()
+    return row is not None and row[0] == fence[1]
+
+
+class LeaderElection:
+    """Keeps trying to hold the lease `name`; `fence` is (name, token) while leading"""
+
+    def __init__(self, db, name: str, ttl: float = 5.0, on_elected=None, on_demoted=None):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        self.heartbeat = ttl / 3
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.on_elected = on_elected  # callback(token) after this process took the lease
+        self.on_demoted = on_demoted  # callback() after it lost or gave up the lease
+        self._token = None
+        self._deadline = 0.0  # monotonic time the lease runs out unless renewed
+        self._stop = threading.Event()
+        self._thread = None
+        self.current_holder = None
+        self.stats = {"elections": 0, "renewals": 0, "demotions": 0, "errors": 0}
+
+    @property
+    def is_leader(self) -> bool:
+        return self._token is not None and time.monotonic() < self._deadline
+
+    @property
+    def fence(self):
+        """(name, token) to pass with fenced writes, or None when not leading"""
+        token = self._token
+        return (self.name, token) if token is not None and time.monotonic() < self._deadline else None
+
+    def start(self):
+        if self._thread:
+            return
+        conn = self.db.get_connection()
+        conn.execute(CREATE_TABLE)
+        conn.commit()
+        self._stop.clear()
+        self._tick()  # decide right away instead of one heartbeat after startup
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+        print(f"👑 Leader election for '{self.name}' started "
+              f"({'leader' if self.is_leader else 'follower of ' + str(self.current_holder)})")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop heartbeating and hand the lease over immediately if we hold it"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._token is not None:
+            try:
+                conn = self.db.get_connection()
+                conn.execute('UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ?', (self.name, self.holder))
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Could not release lease '{self.name}': {e}")
+            self._demote()
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat):
+            self._tick()
+
+    def _tick(self):
+        started = time.monotonic()
+        try:
+            token = self._try_acquire()
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ Lease '{self.name}' heartbeat failed: {e}")
+            if self._token is not None and time.monotonic() >= self._deadline:
+                self._demote()
+            return
+        if token is None:
+            if self._token is not None:
+                self._demote()
+            return
+        # Measured from before the write, so our deadline never outlives the row's
+        self._deadline = started + self.ttl
+        if token == self._token:
+            self.stats["renewals"] += 1
+            return
+        self._token = token
+        self.stats["elections"] += 1
+        print(f"👑 Took lease '{self.name}' (token {token})")
+        if self.on_elected:
+            self.on_elected(token)
+
+    def _try_acquire(self):
+        """Renew our lease or take an expired one; returns the token, or None if someone else holds it"""
+        now = time.time()
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO leases (name, holder, token, acquired_at, expires_at) VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                token = CASE WHEN holder = excluded.holder THEN token ELSE token + 1 END,
+                acquired_at = CASE WHEN holder = excluded.holder THEN acquired_at ELSE excluded.acquired_at END,
+                holder = excluded.holder,
+                expires_at = excluded.expires_at
+            WHERE holder = excluded.holder OR expires_at < excluded.acquired_at
+            RETURNING token
+        ''', (self.name, self.holder, now, now + self.ttl))
+        rows = cursor.fetchall()
+        if rows:
+            conn.commit()
+            self.current_holder = self.holder
+            return rows[0][0]
+        cursor.execute('SELECT holder FROM leases WHERE name = ?', (self.name,))
+        row = cursor.fetchone()
+        conn.commit()
+        self.current_holder = row[0] if row else None
+        return None
+
+    def _demote(self):
+        self._token = None
+        self._deadline = 0.0
+        self.stats["demotions"] += 1
+        print(f"👋 No longer leader for '{self.name}'")
+        if self.on_demoted:
+            self.on_demoted()
+
+    def get_stats(self) -> dict:
+        fence = self.fence
+        return dict(
+            self.stats,
+            name=self.name,
+            holder=self.holder,
+            is_leader=fence is not None,
+            token=fence[1] if fence else None,
+            current_holder=self.current_holder,
+            lease_seconds=self.ttl
+        )
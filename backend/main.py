@@ -1,99 +1,267 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+# Taken before the heavy imports below, so module_init_ms includes their cost
+MODULE_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Request, Response, Depends, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from models import SlotCancellation
 from database import Database
-from blynk_manager import BlynkManager
-from whatsapp_service import WhatsAppService
-from email_service import EmailService
-import time
+from async_database import AsyncDatabase
+from notification_outbox import NotificationOutbox
+from sync_scheduler import AdaptivePollScheduler
+from sensor_debounce import SensorDebouncer
+from slot_stream import SlotStreamBroker
+from slot_registry import SlotRegistry
+from reservation_expiry import ReservationExpiryScheduler
+from history_export import export_stream, MEDIA_TYPES
+from tariff import TariffEngine
+from slot_state import InvalidTransition, ReservationOwnerMismatch
+from lazy_service import LazyService
+from idempotency import IdempotencyStore, IdempotencyMiddleware
+from leader_election import LeaderElection, FencedOut
+import metrics
+from profiling import RequestProfiler, ProfilingMiddleware, ThreadSampler, require_admin
+import json
 import os
 import threading
 from typing import List, Optional
 from dotenv import load_dotenv
 from pydantic import BaseModel
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Smart Parking System API")
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Initialize services
-db = Database()
+# ============= CONFIGURATION =============
+# Importing this module only reads configuration and builds cheap objects; the
+# database, background threads and external clients are started in lifespan()
+# or built on first use, so imports, reloads and extra workers stay fast.
 
-# Configure Blynk
-BLYNK_AUTH_TOKEN = os.getenv("BLYNK_AUTH_TOKEN")
-if not BLYNK_AUTH_TOKEN:
-    print("⚠️  WARNING: BLYNK_AUTH_TOKEN not found!")
-    BLYNK_AUTH_TOKEN = "YOUR_BLYNK_TOKEN"
-else:
-    print(f"✓ Blynk token loaded: {BLYNK_AUTH_TOKEN[:10]}...")
+BLYNK_AUTH_TOKEN = os.getenv("BLYNK_AUTH_TOKEN") or "YOUR_BLYNK_TOKEN"
+ENABLE_BLYNK_SYNC = os.getenv("ENABLE_BLYNK_SYNC", "true").lower() in ("1", "true", "yes")
 
-blynk = BlynkManager(BLYNK_AUTH_TOKEN)
-
-# Configure WhatsApp
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 WHATSAPP_FROM = "whatsapp:+14155238886"  # Default Twilio Sandbox Number
 
-whatsapp_service = None
-if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
-    whatsapp_service = WhatsAppService(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, WHATSAPP_FROM)
-    print("✓ WhatsApp service initialized")
-else:
-    print("⚠️  WhatsApp credentials not found")
-
-# Configure Email Service
 EMAIL_SENDER = os.getenv("EMAIL_SENDER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 465 # using SSL
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465")) # 465 = SSL
+SMTP_SECURITY = os.getenv("SMTP_SECURITY")  # ssl / starttls / plain (defaults from port)
+
+# Slot -> device/pin layout (SLOT_CONFIG=slots.json, defaults to the 3-slot prototype)
+slot_registry = SlotRegistry.load(os.getenv("SLOT_CONFIG", "slots.json"), BLYNK_AUTH_TOKEN)
 
-email_service = None
-if EMAIL_SENDER and EMAIL_PASSWORD:
-    email_service = EmailService(SMTP_SERVER, SMTP_PORT, EMAIL_SENDER, EMAIL_PASSWORD)
-    print("✓ Email service initialized")
-else:
-    print("⚠️  Email credentials not found")
+# Pricing (TARIFF_CONFIG=tariff.json, defaults to ₹30 base + ₹50 per 30 seconds)
+tariff = TariffEngine.load(os.getenv("TARIFF_CONFIG", "tariff.json"))
+
+# ============= SERVICES =============
+
+# Schema setup and the slot store warm-up run at startup, not at import
+db = Database(slot_ids=slot_registry.slot_ids, tariff=tariff, init=False)
+# Handlers go through adb: reads on reader threads, writes batched on one writer thread
+adb = AsyncDatabase(db, readers=int(os.getenv("DB_READERS", "4")))
+slot_stream = SlotStreamBroker(db.slot_store)
+
+def _build_blynk():
+    from blynk_manager import BlynkManager  # pulls in requests; built by the sync thread or first use
+    return BlynkManager(BLYNK_AUTH_TOKEN, os.getenv("BLYNK_SERVER", "blynk.cloud"), registry=slot_registry)
+
+blynk = LazyService("Blynk client", _build_blynk)
+
+def push_to_blynk(*calls):
+    """Blynk pin / event updates as a background task after the response, e.g.
+    ("set_slot_reservation", 1, True); each call is a blocking HTTP request"""
+    for name, *args in calls:
+        try:
+            getattr(blynk, name)(*args)
+        except Exception as e:
+            print(f"⚠️ Blynk {name} failed: {e}")  # pins are refreshed by the next write anyway
+
+def _build_whatsapp_service():
+    from whatsapp_service import WhatsAppService  # twilio is a heavy import; only pay it when sending
+    return WhatsAppService(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, WHATSAPP_FROM)
+
+def _build_email_service():
+    from email_service import EmailService
+    return EmailService(
+        SMTP_SERVER, SMTP_PORT, EMAIL_SENDER, EMAIL_PASSWORD,
+        security=SMTP_SECURITY,
+        pool_size=int(os.getenv("SMTP_POOL_SIZE", "2"))
+    )
+
+whatsapp_service = LazyService("WhatsApp service", _build_whatsapp_service,
+                               enabled=bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN))
+email_service = LazyService("Email service", _build_email_service,
+                            enabled=bool(EMAIL_SENDER and EMAIL_PASSWORD))
+
+# Notifications are queued in SQLite and delivered by background workers,
+# so slow SMTP / Twilio calls never block the request handlers.
+outbox = NotificationOutbox(
+    db,
+    {"email": email_service or None, "whatsapp": whatsapp_service or None, "blynk": blynk or None},
+    workers=int(os.getenv("NOTIFICATION_WORKERS", "2"))
+)
+
+# Outbox messages for each kind of write. They are passed as `notify` and queued
+# in the same transaction as the write, so a committed change always has them.
+def reservation_messages(slot):
+    messages = []
+    if whatsapp_service:
+        messages.append(("whatsapp", "send_reservation_message", slot['user_phone'], slot['slot_id'], slot['vehicle_number']))
+    if email_service:
+        messages.append(("email", "send_reservation_email", slot['user_email'], slot['slot_id'], slot['vehicle_number']))
+    return messages
+
+def billing_messages(billing, email=True):
+    messages = []
+    if email and email_service and billing.get('user_email'):
+        messages.append(("email", "send_billing_email", billing['user_email'], billing))
+    if whatsapp_service and billing.get('user_phone'):
+        messages.append(("whatsapp", "send_billing_message", billing['user_phone'], billing))
+    return messages
+
+def cancellation_messages(reservation, billing=None):
+    """Cancelled with reserved hours: the bill; otherwise (or expired): a cancellation notice"""
+    if billing:
+        return billing_messages(billing)
+    messages = []
+    if whatsapp_service and reservation.get('user_phone'):
+        messages.append(("whatsapp", "send_cancellation_message", reservation['user_phone'], reservation['slot_id']))
+    if email_service and reservation.get('user_email'):
+        messages.append(("email", "send_cancellation_email", reservation['user_email'], reservation['slot_id']))
+    return messages
+
+def vacate_messages(billing):
+    """Manual vacate: WhatsApp bill only"""
+    return billing_messages(billing, email=False)
+
+def expiry_messages(reservation):
+    """Expired: the cancellation notice plus the Blynk pin release, which goes through
+    the outbox too so an unreachable Blynk never stalls the expiry thread"""
+    slot_id = reservation['slot_id']
+    messages = cancellation_messages(reservation)
+    if blynk:
+        messages.append(("blynk", "set_slot_reservation", slot_id, False))
+        messages.append(("blynk", "log_event", f"Slot {slot_id} reservation expired"))
+    return messages
+
+def on_reservation_expired(slot):
+    """Reservation lapsed: its messages were queued with the expiry, deliver them now"""
+    outbox.wake()
+
+# Expires reservations exactly at arrival_time instead of on every GET /api/slots
+expiry_scheduler = ReservationExpiryScheduler(db, on_expired=on_reservation_expired, notify=expiry_messages)
+
+# Retried POSTs with the same Idempotency-Key get the stored response back
+idempotency = IdempotencyStore(db, ttl=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600))))
+
+# On-demand profiling (off until enabled through /api/admin/profiling)
+request_profiler = RequestProfiler()
+sync_sampler = ThreadSampler()
 
 
 # ============= BACKGROUND SYNC THREAD =============
+sync_scheduler = AdaptivePollScheduler(
+    min_interval=float(os.getenv("SYNC_MIN_INTERVAL", "0.5")),
+    base_interval=float(os.getenv("SYNC_BASE_INTERVAL", "2")),
+    max_interval=float(os.getenv("SYNC_MAX_INTERVAL", "30")),
+    active_window=float(os.getenv("SYNC_ACTIVE_WINDOW", "60"))
+)
+# A sensor reading must hold this long before it changes a slot (filters IR flaps)
+sensor_debouncer = SensorDebouncer(
+    confirm_occupied=float(os.getenv("SENSOR_CONFIRM_OCCUPIED_SECONDS", "3")),
+    confirm_free=float(os.getenv("SENSOR_CONFIRM_FREE_SECONDS", "10"))
+)
+# With several uvicorn workers only the lease holder polls Blynk; the others take over within seconds if it dies
+sync_leader = LeaderElection(db, "blynk-sync", ttl=float(os.getenv("SYNC_LEADER_LEASE_SECONDS", "5")))
+sync_stop = threading.Event()
+sync_thread = None  # started in lifespan() when ENABLE_BLYNK_SYNC is on
+
+# Every worker (leader, follower or sync disabled) picks up the other workers' commits this often
+SLOT_RELOAD_SECONDS = float(os.getenv("SLOT_RELOAD_SECONDS", "0.5"))
+reload_thread = None
+
+def reload_changed_slots():
+    """Background thread keeping the slot store and history ETags current across worker processes"""
+    while not sync_stop.wait(SLOT_RELOAD_SECONDS):
+        try:
+            db.reload_if_changed()
+        except Exception as e:
+            print(f"⚠️ Slot reload error: {e}")
+
 def sync_blynk_slots():
-    """Background thread to sync slots from Blynk every 2 seconds"""
+    """Background thread to sync slots from Blynk on an adaptive interval"""
     print("🚀 Background Sync Thread Started")
-    while True:
+    last_seen = {}  # slot_id -> (is_occupied, is_reserved) as last read from Blynk
+    leading = None  # fence of the lease we last polled under
+    while not sync_stop.is_set():
+        fence = sync_leader.fence
+        if fence is None:
+            # Another worker polls Blynk: stand by until the lease frees up
+            leading = None
+            sync_stop.wait(sync_leader.heartbeat)
+            continue
+        if fence != leading:
+            # Newly elected: readings from an earlier term are stale, start fresh
+            leading = fence
+            last_seen.clear()
+            for slot_id in slot_registry.slot_ids:
+                sensor_debouncer.reset(slot_id)
+        
+        changed = False
+        error = False
+        tick_start = time.perf_counter()
         try:
+            poll_time = sync_scheduler.begin_poll()
+            
             # Fetch statuses from Blynk (Hardware/Cloud)
             blynk_slots = blynk.get_all_slots_status()
-            
-            # Fetch local DB state
-            db_slots = db.get_all_slots()
+            if not blynk_slots:
+                error = True  # Blynk unreachable / bad response
             
             for b_slot in blynk_slots:
                 slot_id = b_slot['slot_id']
                 is_occupied_blynk = b_slot['is_occupied']
                 
-                # Find corresponding DB slot
-                db_slot = next((s for s in db_slots if s['slot_id'] == slot_id), None)
+                # Track sensor changes (drives the poll interval and detection lag)
+                state = (b_slot['is_occupied'], b_slot['is_reserved'])
+                previous = last_seen.get(slot_id)
+                last_seen[slot_id] = state
+                if previous is not None and previous != state:
+                    changed = True
+                    entry_time = b_slot.get('entry_time')
+                    happened_at = entry_time if is_occupied_blynk and entry_time and entry_time <= poll_time else None
+                    sync_scheduler.record_detection(poll_time, happened_at)
+                
+                # Act on confirmed changes only: a reading must hold for the confirm window
+                confirmed = sensor_debouncer.update(slot_id, is_occupied_blynk, poll_time, b_slot.get('entry_time'))
+                if confirmed is None:
+                    continue
+                
+                # Local state from the in-memory slot store (O(1), no disk I/O)
+                db_slot = db.get_slot(slot_id)
                 
                 if db_slot:
                     # Case 1: Detect Arrival (Blynk: Occupied, DB: Empty)
-                    if is_occupied_blynk and not db_slot['is_occupied']:
+                    if confirmed['is_occupied'] and not db_slot['is_occupied']:
                         print(f"🚗 [Sync] Slot {slot_id} Detected Vehicle via Sensor")
-                        entry_time = int(time.time())
-                        db.occupy_slot(slot_id, entry_time)
+                        entry_time = int(confirmed['since'])
+                        try:
+                            db.occupy_slot(slot_id, entry_time, fence=fence)
+                        except InvalidTransition:
+                            pass  # occupied through the API since the store was read
+                        except FencedOut:
+                            print(f"👋 [Sync] Lost the sync lease, not occupying slot {slot_id}")
+                            break
+                        except Exception:
+                            sensor_debouncer.reset(slot_id)  # confirm again and retry on a later poll
+                            raise
                     
                     # Case 2: Detect Departure (Blynk: Empty, DB: Occupied) -> IGNORE HERE
                     # We do NOT auto-vacate on sensor clear because we need to generate BILL/Payment.
@@ -107,13 +275,120 @@ def sync_blynk_slots():
                     # But that complicates state. Let's stick to reliable Occupancy detection.
 
         except Exception as e:
+            error = True
             print(f"⚠️ Sync Error: {e}")
+        metrics.SYNC_TICK_SECONDS.observe(time.perf_counter() - tick_start)
         
-        time.sleep(2)  # Wait 2 seconds before next poll
+        # Short interval while the lot is busy, exponential backoff when idle / erroring
+        sync_scheduler.record_poll(changed, error)
+        sync_scheduler.wait(sync_stop)
+
+# ============= LIFESPAN =============
 
-# Start the background thread
-sync_thread = threading.Thread(target=sync_blynk_slots, daemon=True)
-sync_thread.start()
+startup_stats = {"module_init_ms": None, "startup_ms": None, "ready_at": None}
+
+def startup():
+    """Create the schema, warm caches and start background work"""
+    global sync_thread, reload_thread
+    started = time.perf_counter()
+    
+    if BLYNK_AUTH_TOKEN == "YOUR_BLYNK_TOKEN":
+        print("⚠️  WARNING: BLYNK_AUTH_TOKEN not found!")
+    print(f"{'✓' if whatsapp_service else '⚠️ '} WhatsApp {'configured' if whatsapp_service else 'credentials not found'}")
+    print(f"{'✓' if email_service else '⚠️ '} Email {'configured' if email_service else 'credentials not found'}")
+    
+    db.init_db()
+    idempotency.init_table()
+    adb.start()
+    outbox.start()
+    expiry_scheduler.start()
+    
+    sync_stop.clear()
+    reload_thread = threading.Thread(target=reload_changed_slots, name="slot-reload", daemon=True)
+    reload_thread.start()
+    
+    if ENABLE_BLYNK_SYNC:
+        sync_leader.start()
+        sync_thread = threading.Thread(target=sync_blynk_slots, name="blynk-sync", daemon=True)
+        sync_thread.start()
+    else:
+        print("⏸️  Blynk sync disabled (ENABLE_BLYNK_SYNC=false)")
+    
+    startup_stats["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    startup_stats["ready_at"] = time.time()
+    print(f"✅ Startup complete in {startup_stats['startup_ms']} ms")
+
+def shutdown():
+    """Stop background work, let in-flight jobs finish, then close connections"""
+    started = time.perf_counter()
+    sync_stop.set()
+    if sync_thread is not None:
+        sync_thread.join(timeout=10)
+        sync_leader.stop()  # hands the lease to another worker right away
+    if reload_thread is not None:
+        reload_thread.join(timeout=5)
+    expiry_scheduler.stop()
+    outbox.stop()
+    adb.stop()
+    if email_service.is_initialized:
+        email_service.pool.close_all()
+    if blynk.is_initialized:
+        blynk.session.close()
+    db.close()
+    print(f"👋 Shutdown complete in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(startup)
+    try:
+        yield
+    finally:
+        await run_in_threadpool(shutdown)
+
+app = FastAPI(title="Smart Parking System API", lifespan=lifespan)
+
+# Inside CORS, so replayed responses get fresh CORS headers
+app.add_middleware(IdempotencyMiddleware, store=idempotency)
+
+# CORS middleware
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Per-route latency histograms for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+
+startup_stats["module_init_ms"] = round((time.perf_counter() - MODULE_STARTED) * 1000, 1)
+
+
+# ============= CONDITIONAL RESPONSES =============
+# Strong ETags from in-memory version counters (slot_store.version for slots,
+# db.history_version for history and revenue), so a matching If-None-Match is
+# answered with 304 before touching SQLite or serializing anything. The epoch
+# keeps a restarted process, whose counters start over, from matching old tags.
+
+ETAG_EPOCH = f"{os.getpid():x}.{time.time_ns():x}"
+
+def make_etag(kind: str, version: int) -> str:
+    return f'"{kind}-{ETAG_EPOCH}-{version}"'
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 response if the client already holds `etag`, else None"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    if header.strip() != "*" and etag not in (tag.strip().removeprefix("W/") for tag in header.split(",")):
+        return None
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"  # browsers revalidate instead of reusing blindly
 
 
 # ============= ROUTES =============
@@ -123,7 +398,10 @@ async def root():
     return {
         "message": "Smart Parking System API", 
         "status": "running",
-        "version": "3.0 - Optimized"
+        "version": "3.0 - Optimized",
+        "startup": startup_stats,
+        "blynk_sync": sync_thread is not None and sync_thread.is_alive(),
+        "sync_leader": sync_leader.is_leader
     }
 
 # ============= MODELS =============
@@ -135,8 +413,8 @@ class EmailReceipt(BaseModel):
     entry_time: str
     exit_time: str
     duration_minutes: int
-    base_charge: float
-    minute_charge: float
+    base_charge: Optional[float] = None
+    minute_charge: Optional[float] = None
     total_amount: float
 
 class SlotReservation(BaseModel):
@@ -160,99 +438,118 @@ class SlotCancellation(BaseModel):
     slot_id: int
     email_id: str
 
+class SettlePaymentsRequest(BaseModel):
+    history_ids: Optional[List[int]] = None  # explicit rows, or settle PENDING rows matching the filter
+    vehicle_number: Optional[str] = None
+    slot_id: Optional[int] = None
+    before: Optional[int] = None  # exit_time upper bound (Unix timestamp)
+
+class RequestProfilingConfig(BaseModel):
+    sample_rate: float  # 0.0 - 1.0, 0 disables
+    path_prefix: Optional[str] = None
+
+class RequoteRequest(BaseModel):
+    tariff: Optional[dict] = None  # tariff table to evaluate; the active tariff if omitted
+    since: Optional[int] = None
+    until: Optional[int] = None
+    status: Optional[str] = None
+
 # ============= EMAIL ENDPOINT =============
 
 @app.post("/api/send-receipt")
 async def send_receipt(receipt: EmailReceipt):
-    """Send parking receipt via email"""
-    try:
-        sender_email = os.getenv("EMAIL_SENDER")
-        sender_password = os.getenv("EMAIL_PASSWORD")
-        
-        if not sender_email or not sender_password:
-            return {
-                "success": False, 
-                "message": "Email service not configured"
-            }
-        
-        message = MIMEMultipart("alternative")
-        message["Subject"] = f"🚗 Parking Receipt - {receipt.vehicle_number}"
-        message["From"] = f"Smart Parking System <{sender_email}>"
-        message["To"] = receipt.to_email
-        
-        html_body = f"""
-        <!DOCTYPE html>
-        <html>
-        <body style="font-family: Arial; background: #f3f4f6;">
-            <div style="max-width: 600px; margin: 40px auto; background: white; border-radius: 16px; overflow: hidden;">
-                <div style="background: linear-gradient(135deg, #3b82f6, #8b5cf6); padding: 40px; text-align: center; color: white;">
-                    <h1>🚗 Parking Receipt</h1>
-                </div>
-                <div style="padding: 30px;">
-                    <h2>Parking Details</h2>
-                    <p><strong>Slot:</strong> {receipt.slot_number}</p>
-                    <p><strong>Vehicle:</strong> {receipt.vehicle_number}</p>
-                    <p><strong>Entry:</strong> {receipt.entry_time}</p>
-                    <p><strong>Exit:</strong> {receipt.exit_time}</p>
-                    <p><strong>Duration:</strong> {receipt.duration_minutes} minutes</p>
-                    <hr>
-                    <h2>Billing</h2>
-                    <p><strong>Base Charge:</strong> ₹{receipt.base_charge:.2f}</p>
-                    <p><strong>Minute Charge:</strong> ₹{receipt.minute_charge:.2f}</p>
-                    <h1 style="color: #10b981;">Total: ₹{receipt.total_amount:.2f}</h1>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        message.attach(MIMEText(html_body, "html"))
-        
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(sender_email, sender_password)
-            server.sendmail(sender_email, receipt.to_email, message.as_string())
-        
+    """Send parking receipt via email (pooled SMTP session)"""
+    if not email_service:
+        return {
+            "success": False, 
+            "message": "Email service not configured"
+        }
+    
+    # Blocking SMTP I/O runs in the threadpool, not on the event loop
+    sent = await run_in_threadpool(email_service.send_receipt_email, receipt.model_dump())
+    if sent:
         return {"success": True, "message": "Receipt sent successfully"}
+    return {"success": False, "message": "Failed to send receipt"}
+
+@app.post("/api/send-receipts")
+async def send_receipts(receipts: List[EmailReceipt]):
+    """Send many receipts over a single SMTP session"""
+    if not email_service:
+        return {
+            "success": False, 
+            "message": "Email service not configured"
+        }
     
-    except Exception as e:
-        print(f"❌ Email error: {e}")
-        # Only return error if critical, otherwise log and continue
-        return {"success": False, "message": str(e)}
+    results = await run_in_threadpool(
+        email_service.send_receipt_batch, [r.model_dump() for r in receipts]
+    )
+    return {
+        "success": all(results),
+        "sent": sum(results),
+        "failed": len(results) - sum(results),
+        "results": [{"to_email": r.to_email, "sent": ok} for r, ok in zip(receipts, results)]
+    }
 
 
 # ============= SLOT ENDPOINTS =============
 
 @app.get("/api/slots")
-async def get_all_slots():
-    """Get all parking slots - OPTIMIZED: READS DB ONLY"""
+async def get_all_slots(request: Request, response: Response):
+    """Get all parking slots - OPTIMIZED: served from the in-memory slot store"""
+    cached = not_modified(request, make_etag("slots", db.slot_store.version))
+    if cached:
+        return cached
     try:
-        # Auto-cancel expired reservations
-        db.cancel_expired_reservations()
-        
-        # READ FROM DB ONLY - The Background Thread handles Sync!
-        slots = db.get_all_slots()
+        # READ-ONLY - the sync thread and the expiry scheduler handle all writes!
+        version, slots = db.slot_store.get_all_versioned()
+        response.headers["X-Slots-Version"] = str(version)
+        set_etag(response, make_etag("slots", version))
         
         return slots
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/slots/version")
+async def get_slots_version():
+    """Current slot state version - changes whenever any slot changes"""
+    return {"version": db.slot_store.version}
+
+@app.get("/api/slots/stream")
+async def stream_slots(request: Request):
+    """Server-Sent Events: full snapshot on connect, then slot deltas as they happen"""
+    return StreamingResponse(
+        slot_stream.stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/slots/stream/stats")
+async def get_stream_stats():
+    return {"success": True, "stats": slot_stream.get_stats()}
+
 @app.get("/api/slots/{slot_id}")
-async def get_slot(slot_id: int):
+async def get_slot(slot_id: int, request: Request, response: Response):
     """Get specific slot"""
-    if slot_id not in [1, 2, 3]:
+    if slot_id not in slot_registry:
         raise HTTPException(status_code=404, detail="Slot not found")
     
+    # Version first: a write landing in between only makes the tag older than the body
+    etag = make_etag("slots", db.slot_store.version)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
     try:
         slot = db.get_slot(slot_id)
+        set_etag(response, etag)
         # We can also trust DB here, no need to poll Blynk individually
         return slot
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/slots/reserve")
-async def reserve_slot(reservation: SlotReservation):
+async def reserve_slot(reservation: SlotReservation, background_tasks: BackgroundTasks):
     """Reserve a parking slot"""
-    if reservation.slot_id not in [1, 2, 3]:
+    if reservation.slot_id not in slot_registry:
         raise HTTPException(status_code=404, detail="Invalid slot ID")
     
     try:
@@ -262,46 +559,29 @@ async def reserve_slot(reservation: SlotReservation):
             if reservation.arrival_time < current_time:
                 raise HTTPException(status_code=400, detail="Cannot reserve slot for past time")
         
-        slot = db.get_slot(reservation.slot_id)
-        # Check DB first
-        if slot['is_occupied'] or slot['is_reserved']:
-            raise HTTPException(status_code=400, detail="Slot is not available")
-        
-        # Reserve with arrival_time
-        success = db.reserve_slot(
-            reservation.slot_id,
-            reservation.user_email,
-            reservation.user_phone,
-            reservation.vehicle_number,
-            reservation.arrival_time,
-            reservation.duration_hours
-        )
-        
-        if not success:
-            raise HTTPException(status_code=400, detail="Failed to reserve slot (Occupied/Reserved)")
-        
-        # Fire and forget Blynk update (or wait if critical)
+        # free -> reserved, checked and applied in one statement
         try:
-            blynk.set_slot_reservation(reservation.slot_id, True)
-            blynk.log_event(f"Slot {reservation.slot_id} reserved by {reservation.vehicle_number}")
-        except:
-            pass # Don't fail reservation if Blynk is flaky
-        
-        # Send WhatsApp confirmation
-        if whatsapp_service:
-            whatsapp_service.send_reservation_message(
-                reservation.user_phone, 
-                reservation.slot_id, 
-                reservation.vehicle_number
-            )
-            
-        # Send Email confirmation
-        if email_service:
-            email_service.send_reservation_email(
-                reservation.user_email,
+            await adb.reserve_slot(
                 reservation.slot_id,
-                reservation.vehicle_number
+                reservation.user_email,
+                reservation.user_phone,
+                reservation.vehicle_number,
+                reservation.arrival_time,
+                reservation.duration_hours,
+                notify=reservation_messages  # WhatsApp / email confirmation
             )
+        except InvalidTransition:
+            raise HTTPException(status_code=400, detail="Slot is not available")
+        outbox.wake()
+        
+        expiry_scheduler.schedule(reservation.slot_id, reservation.arrival_time)
+        
+        # Fire and forget Blynk update, off the event loop and after the response
+        background_tasks.add_task(
+            push_to_blynk,
+            ("set_slot_reservation", reservation.slot_id, True),
+            ("log_event", f"Slot {reservation.slot_id} reserved by {reservation.vehicle_number}")
+        )
         
         return {
             "success": True,
@@ -319,54 +599,33 @@ async def reserve_slot(reservation: SlotReservation):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/slots/cancel")
-async def cancel_reservation(cancellation: SlotCancellation):
+async def cancel_reservation(cancellation: SlotCancellation, background_tasks: BackgroundTasks):
     """Cancel slot reservation"""
-    if cancellation.slot_id not in [1, 2, 3]:
+    if cancellation.slot_id not in slot_registry:
         raise HTTPException(status_code=404, detail="Invalid slot ID")
     
     try:
-        slot = db.get_slot(cancellation.slot_id)
-        
-        if not slot['is_reserved']:
-            raise HTTPException(status_code=400, detail="Slot is not reserved")
-        
-        # Verify email
-        if slot.get('user_email') and slot['user_email'] != cancellation.email_id:
-            raise HTTPException(status_code=403, detail="Email does not match reservation")
-        
-        # Cancel in database
-        billing = db.cancel_reservation(cancellation.slot_id)
-        
-        # Update Blynk
+        # reserved -> free (email verified in the same transaction)
         try:
-            blynk.set_slot_reservation(cancellation.slot_id, False)
-        except:
-            pass
+            # Bill or cancellation notice queued with the cancel itself
+            slot, billing = await adb.cancel_reservation(cancellation.slot_id, cancellation.email_id,
+                                                         notify=cancellation_messages)
+        except ReservationOwnerMismatch:
+            raise HTTPException(status_code=403, detail="Email does not match reservation")
+        except InvalidTransition:
+            raise HTTPException(status_code=400, detail="Slot is not reserved")
+        outbox.wake()
         
         message = "Reservation cancelled successfully"
-        
+        event = f"Slot {cancellation.slot_id} reservation cancelled"
         if billing:
             message = "Reservation cancelled and bill generated"
-            try:
-                blynk.log_event(f"Slot {cancellation.slot_id} cancelled & billed: ₹{billing['total_amount']}")
-            except: pass
-            
-            # Send Billing Email
-            if email_service and billing.get('user_email'):
-                email_service.send_billing_email(billing['user_email'], billing)
-            # WhatsApp Bill
-            if whatsapp_service and billing.get('user_phone'):
-                whatsapp_service.send_billing_message(billing['user_phone'], billing)
-        else:
-            try:
-                blynk.log_event(f"Slot {cancellation.slot_id} reservation cancelled")
-            except: pass
-            
-            # Send standard cancellation notifications
-            if whatsapp_service and slot.get('user_phone'):
-                whatsapp_service.send_cancellation_message(slot['user_phone'], cancellation.slot_id)
-            if email_service and slot.get('user_email'):
-                email_service.send_cancellation_email(slot['user_email'], cancellation.slot_id)
+            event = f"Slot {cancellation.slot_id} cancelled & billed: ₹{billing['total_amount']}"
+        
+        # Update Blynk after the response
+        background_tasks.add_task(
+            push_to_blynk, ("set_slot_reservation", cancellation.slot_id, False), ("log_event", event)
+        )
         
         return {
             "success": True,
@@ -384,136 +643,335 @@ async def cancel_reservation(cancellation: SlotCancellation):
 @app.post("/api/slots/occupy/{slot_id}")
 async def occupy_slot(slot_id: int):
     """Mark slot as occupied (Manual Override)"""
-    if slot_id not in [1, 2, 3]:
+    if slot_id not in slot_registry:
         raise HTTPException(status_code=404, detail="Invalid slot ID")
     
     try:
         entry_time = int(time.time())
-        db.occupy_slot(slot_id, entry_time)
+        try:
+            await adb.occupy_slot(slot_id, entry_time)
+        except InvalidTransition:
+            raise HTTPException(status_code=400, detail="Slot is already occupied")
         return {
             "success": True,
             "message": "Slot marked as occupied",
             "slot_id": slot_id,
             "entry_time": entry_time
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/slots/vacate/{slot_id}")
-async def vacate_slot(slot_id: int):
+async def vacate_slot(slot_id: int, background_tasks: BackgroundTasks):
     """Vacate slot and generate bill"""
-    if slot_id not in [1, 2, 3]:
+    if slot_id not in slot_registry:
         raise HTTPException(status_code=404, detail="Invalid slot ID")
     try:
         exit_time = int(time.time())
-        billing = db.vacate_slot(slot_id, exit_time)
-        
-        if not billing:
+        try:
+            # WhatsApp bill queued with the bill itself
+            billing = await adb.vacate_slot(slot_id, exit_time, notify=vacate_messages)
+        except InvalidTransition:
             raise HTTPException(status_code=400, detail="No active parking session")
+        outbox.wake()
         
-        blynk.reset_slot_timer(slot_id)
-        blynk.set_slot_reservation(slot_id, False)
-        blynk.log_event(f"Slot {slot_id} vacated - Bill: ₹{billing['total_amount']}")
-        
-        if whatsapp_service and billing.get('user_phone'):
-            whatsapp_service.send_billing_message(billing['user_phone'], billing)
+        background_tasks.add_task(
+            push_to_blynk,
+            ("reset_slot_timer", slot_id),
+            ("set_slot_reservation", slot_id, False),
+            ("log_event", f"Slot {slot_id} vacated - Bill: ₹{billing['total_amount']}")
+        )
         
         return {
             "success": True, 
             "message": "Slot vacated successfully",
             "billing": billing
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/slots/pay-bill/{slot_id}")
-async def pay_bill_for_occupied_slot(slot_id: int, data: PayBillRequest):
+async def pay_bill_for_occupied_slot(slot_id: int, data: PayBillRequest, background_tasks: BackgroundTasks):
     """Collect payment details for occupied slot and vacate it"""
-    if slot_id not in [1, 2, 3]:
+    if slot_id not in slot_registry:
         raise HTTPException(status_code=404, detail="Invalid slot ID")
     
     try:
-        slot = db.get_slot(slot_id)
-        if not slot or not slot['is_occupied']:
-            raise HTTPException(status_code=400, detail="Slot is not occupied")
-        
-        # Update slot with user details
-        success = db.update_occupied_slot_details(
-            slot_id, data.user_email, data.user_phone, data.vehicle_number
-        )
-        if not success:
-            raise HTTPException(status_code=400, detail="Failed to update slot details")
-        
-        # Vacate
+        # occupied -> free with the payer's details on the bill: one transaction
         exit_time = int(time.time())
-        billing = db.vacate_slot(slot_id, exit_time)
-        
-        if not billing:
-            raise HTTPException(status_code=400, detail="Failed to vacate slot")
-        
-        # Send Receipt
         try:
-             if email_service:
-                 email_service.send_billing_email(data.user_email, billing)
-        except Exception as e:
-            print(f"⚠️ Receipt email error: {e}")
-        
-        blynk.reset_slot_timer(slot_id)
-        blynk.set_slot_reservation(slot_id, False)
+            # Receipt (email / WhatsApp) queued with the bill itself
+            billing = await adb.vacate_slot(
+                slot_id, exit_time, data.user_email, data.user_phone, data.vehicle_number,
+                notify=billing_messages
+            )
+        except InvalidTransition:
+            raise HTTPException(status_code=400, detail="Slot is not occupied")
+        outbox.wake()
         
-        if whatsapp_service and data.user_phone:
-            whatsapp_service.send_billing_message(data.user_phone, billing)
+        background_tasks.add_task(push_to_blynk, ("reset_slot_timer", slot_id), ("set_slot_reservation", slot_id, False))
         
         return {
             "success": True,
             "message": "Payment successful",
             "billing": billing
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/history")
-async def get_parking_history(limit: int = 50):
+async def get_parking_history(request: Request, response: Response,
+                              limit: int = 50, cursor: Optional[str] = None, slot_id: Optional[int] = None,
+                              status: Optional[str] = None, since: Optional[int] = None, until: Optional[int] = None):
+    """Keyset-paginated history: pass back `next_cursor` as `cursor` for the next page"""
+    etag = make_etag("history", db.history_version)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
     try:
-        return {"success": True, "history": db.get_parking_history(limit)}
+        history, next_cursor = await adb.get_history_page(limit, cursor, slot_id, status, since, until)
+        set_etag(response, etag)
+        return {"success": True, "history": history, "count": len(history), "next_cursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/history/export")
+async def export_history(format: str = "csv", gzip: bool = False, status: Optional[str] = None,
+                         since: Optional[int] = None, until: Optional[int] = None):
+    """Stream the full history as CSV or NDJSON with flat memory use (gzip=true to compress)"""
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    
+    headers = {"Content-Disposition": f'attachment; filename="parking_history.{format}{".gz" if gzip else ""}"'}
+    media_type = MEDIA_TYPES[format]
+    if gzip:
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export_stream(db.iter_history(since, until, status), format, gzip),
+        media_type=media_type,
+        headers=headers
+    )
+
 @app.get("/api/history/pending")
-async def get_pending_payments():
+async def get_pending_payments(limit: int = 100, cursor: Optional[str] = None, slot_id: Optional[int] = None,
+                               since: Optional[int] = None, until: Optional[int] = None):
     try:
-        return {"success": True, "pending": db.get_pending_payments()}
+        pending, next_cursor = await adb.get_pending_payments(limit, cursor, slot_id=slot_id, since=since, until=until)
+        return {"success": True, "pending": pending, "count": len(pending), "next_cursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/history/revenue")
-async def get_revenue_stats():
+async def get_revenue_stats(request: Request, response: Response,
+                            since: Optional[int] = None, until: Optional[int] = None,
+                            group_by: Optional[str] = None, status: str = "PAID"):
+    """Revenue from the rollup tables; optional exit_time range and group_by hour/day/month/slot"""
+    if group_by not in (None, "hour", "day", "month", "slot"):
+        raise HTTPException(status_code=400, detail="group_by must be hour, day, month or slot")
+    if status not in ("PAID", "PENDING", "ALL"):
+        raise HTTPException(status_code=400, detail="status must be PAID, PENDING or ALL")
+    etag = make_etag("history", db.history_version)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
     try:
-        return {"success": True, "stats": db.get_revenue_stats()}
+        stats = await adb.get_revenue_stats(since, until, group_by, status)
+        set_etag(response, etag)
+        return {"success": True, "stats": stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ============= TARIFF =============
+
+@app.get("/api/tariff")
+async def get_tariff():
+    """Active tariff table"""
+    return {"success": True, "tariff": tariff.config, "description": tariff.describe()}
+
+@app.post("/api/tariff/requote")
+async def requote_history(request: RequoteRequest):
+    """What-if revenue: re-price the history under another tariff (nothing is written)"""
+    try:
+        candidate = TariffEngine(request.tariff) if request.tariff else tariff
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid tariff: {e}")
+    try:
+        result = await adb.requote_history(candidate, request.since, request.until, request.status)
+        return {"success": True, "requote": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/history/clear")
 async def clear_history():
     try:
-        db.clear_history()
+        await adb.clear_history()
         return {"success": True, "message": "History cleared successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/history/mark-paid")
+async def settle_payments(request: SettlePaymentsRequest):
+    """Bulk settlement: mark a list of IDs, or every PENDING row matching a filter, as PAID"""
+    filters = (request.vehicle_number, request.slot_id, request.before)
+    if request.history_ids is None and all(f is None for f in filters):
+        raise HTTPException(status_code=400, detail="Provide history_ids or at least one filter")
+    try:
+        if request.history_ids is not None:
+            results = await adb.settle_payments(request.history_ids)
+        else:
+            results = await adb.settle_payments(None, *filters)
+        settled = [r for r in results if r["status"] == "PAID"]
+        return {
+            "success": True,
+            "settled": len(settled),
+            "already_paid": sum(1 for r in results if r["status"] == "ALREADY_PAID"),
+            "not_found": sum(1 for r in results if r["status"] == "NOT_FOUND"),
+            "amount": sum((r["amount"] or 0.0 for r in settled), 0.0),
+            "results": results
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/history/mark-paid/{history_id}")
 async def mark_payment_paid(history_id: int):
     try:
-        db.mark_payment_paid(history_id)
+        await adb.mark_payment_paid(history_id)
         return {"success": True, "message": "Payment marked as paid"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ============= EVENT LOG =============
+
+@app.get("/api/events")
+async def get_slot_events(since: Optional[float] = None, until: Optional[float] = None, slot_id: Optional[int] = None,
+                          cursor: Optional[int] = None, limit: int = 100):
+    """Slot lifecycle events in [since, until), oldest first; pass `next_cursor` back as `cursor`"""
+    try:
+        events, next_cursor = await adb.get_events(since, until, slot_id, cursor, limit)
+        return {"success": True, "events": events, "count": len(events), "next_cursor": next_cursor}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/events/replay")
+async def replay_slot_events(at: Optional[float] = None):
+    """Slot states as of `at` (unix seconds, default now), rebuilt from the nearest snapshot and the log"""
+    try:
+        return {"success": True, **await adb.replay_slots(at)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/admin/events/rebuild-history", dependencies=[Depends(require_admin)])
+async def rebuild_history_from_events():
+    """Re-derive parking_history and the revenue rollups from the event log"""
+    try:
+        started = time.perf_counter()
+        applied = await run_in_threadpool(db.rebuild_history)
+        return {"success": True, "events_applied": applied,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ============= METRICS =============
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (text exposition format)"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+# ============= PROFILING (ADMIN) =============
+
+@app.get("/api/admin/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling_status():
+    return {"success": True, "requests": request_profiler.get_stats(), "sync": sync_sampler.get_stats()}
+
+@app.post("/api/admin/profiling/requests", dependencies=[Depends(require_admin)])
+async def configure_request_profiling(config: RequestProfilingConfig):
+    """Start / stop sampling requests with cProfile (takes effect immediately)"""
+    request_profiler.configure(config.sample_rate, config.path_prefix)
+    return {"success": True, "requests": request_profiler.get_stats()}
+
+@app.get("/api/admin/profiling/requests", dependencies=[Depends(require_admin)])
+async def download_request_profile(reset: bool = False):
+    """Aggregated pstats of the sampled requests (python -m pstats / snakeviz)"""
+    data = request_profiler.dump(reset)
+    if data is None:
+        raise HTTPException(status_code=404, detail="No requests profiled yet")
+    return Response(
+        content=data, media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="requests-{int(time.time())}.pstats"'}
+    )
+
+@app.post("/api/admin/profiling/sync", dependencies=[Depends(require_admin)])
+async def start_sync_profile(seconds: float = 10.0, interval_ms: float = 5.0):
+    """Sample the Blynk sync thread's stack for `seconds` (max 300)"""
+    if not 0 < seconds <= 300 or not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 300], interval_ms in [1, 1000]")
+    if not sync_sampler.start(sync_thread, seconds, interval_ms / 1000):
+        raise HTTPException(status_code=409, detail="A capture is already running or the sync thread is not alive")
+    return {"success": True, "sync": sync_sampler.get_stats()}
+
+@app.get("/api/admin/profiling/sync", dependencies=[Depends(require_admin)])
+async def download_sync_profile():
+    """Last sync-thread capture as a speedscope profile (https://www.speedscope.app)"""
+    if sync_sampler.running:
+        raise HTTPException(status_code=409, detail="Capture still running")
+    result = sync_sampler.result()
+    if result is None:
+        raise HTTPException(status_code=404, detail="No capture available")
+    return Response(
+        content=json.dumps(result), media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="blynk-sync-{int(time.time())}.speedscope.json"'}
+    )
+
+@app.get("/api/blynk/stats")
+async def get_blynk_stats():
+    """Outbound Blynk request counts and per-sync-tick latency"""
+    return {"success": True, "stats": blynk.get_stats()}
+
+@app.get("/api/sync/metrics")
+async def get_sync_metrics():
+    """Current Blynk poll interval, detection-lag distribution, sensor debouncing and the poller lease"""
+    return {"success": True, "metrics": sync_scheduler.get_metrics(), "sensors": sensor_debouncer.get_stats(),
+            "leader": sync_leader.get_stats()}
+
+@app.get("/api/reservations/expiry/stats")
+async def get_expiry_stats():
+    """Pending reservation timers and expiry counts"""
+    return {"success": True, "stats": expiry_scheduler.get_stats()}
+
+@app.get("/api/idempotency/stats")
+async def get_idempotency_stats():
+    """Replayed / stored responses and conflicts for Idempotency-Key requests"""
+    return {"success": True, "stats": idempotency.get_stats()}
+
+@app.get("/api/database/stats")
+async def get_database_stats():
+    """Write batching: operations, batches and average batch size"""
+    return {"success": True, "stats": adb.get_stats()}
+
+@app.get("/api/notifications/stats")
+async def get_notification_stats():
+    """Outbox queue depth and delivery latency"""
+    try:
+        return {"success": True, "stats": outbox.get_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/database/reset-slots")
 async def reset_all_slots():
     try:
-        db.reset_all_slots()
+        await adb.reset_all_slots()
         return {"success": True, "message": "All slots reset"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,259 @@
+"""
+Minimal Prometheus metrics: counters and histograms rendered in the
+text exposition format at /metrics.
+
+Recording is a dict lookup, a bisect and a few additions under an uncontended
+lock (around a microsecond), so instrumentation stays on in production.
+"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+
+# Seconds; covers in-memory reads (~10us) up to slow network calls (10s)
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry or REGISTRY).register(self)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        suffix = "" if self.name.endswith("_total") else "_total"
+        return [(suffix, _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                # per-bucket counts (last one is +Inf), then sum and count
+                series = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *labelvalues):
+        """Context manager observing the elapsed seconds of the block"""
+        return _Timer(self, labelvalues)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        samples = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound) if bound == float("inf") else repr(bound)}"'
+                samples.append(("_bucket", _format_labels(self.labelnames, key, le), cumulative))
+            samples.append(("_sum", _format_labels(self.labelnames, key), series[-2]))
+            samples.append(("_count", _format_labels(self.labelnames, key), series[-1]))
+        return samples
+
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ============= APPLICATION METRICS =============
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "parking_http_request_duration_seconds",
+    "Time from request to response headers, per route template",
+    ["method", "route", "status"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "parking_db_query_duration_seconds", "Database method latency", ["method"]
+)
+DB_QUERY_ERRORS = Counter(
+    "parking_db_query_errors_total", "Database methods that raised", ["method"]
+)
+BLYNK_REQUEST_SECONDS = Histogram(
+    "parking_blynk_request_duration_seconds",
+    "Blynk HTTP API latency per operation and pin ('batch' for multi-pin reads)",
+    ["operation", "pin"]
+)
+BLYNK_REQUEST_ERRORS = Counter(
+    "parking_blynk_request_errors_total",
+    "Failed Blynk HTTP API calls (transport errors and non-200 responses)",
+    ["operation", "pin"]
+)
+SYNC_TICK_SECONDS = Histogram(
+    "parking_sync_tick_duration_seconds", "Duration of one Blynk sync loop iteration"
+)
+SYNC_DETECTION_LAG_SECONDS = Histogram(
+    "parking_sync_detection_lag_seconds",
+    "Delay between a sensor change and the poll that detected it",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+)
+SENSOR_FLAPS_SUPPRESSED = Counter(
+    "parking_sensor_flaps_suppressed_total",
+    "Sensor readings that reverted before the debounce window confirmed them",
+    ["direction"]
+)
+NOTIFICATION_SEND_SECONDS = Histogram(
+    "parking_notification_send_duration_seconds", "Notification delivery latency", ["channel", "method"]
+)
+NOTIFICATION_FAILURES = Counter(
+    "parking_notification_failures_total", "Failed notification delivery attempts", ["channel", "method"]
+)
+
+
+def instrument_methods(cls, histogram=DB_QUERY_SECONDS, errors=DB_QUERY_ERRORS, exclude=()):
+    """Time every public method of `cls`, labelled with the method name.
+
+    Generator methods are left alone: their work happens after they return.
+    """
+    for name, function in list(vars(cls).items()):
+        if name.startswith("_") or name in exclude:
+            continue
+        if not inspect.isfunction(function) or inspect.isgeneratorfunction(function):
+            continue
+        setattr(cls, name, _timed(function, name, histogram, errors))
+    return cls
+
+
+def _timed(function, name, histogram, errors):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            errors.inc(name)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start, name)
+    return wrapper
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency up to the response headers.
+
+    Routes are labelled by their template (/api/slots/{slot_id}), so label
+    cardinality stays bounded; unmatched paths share one label. Measuring to
+    the headers keeps long-lived streams (SSE, exports) from skewing latency.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def _route_label(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return getattr(route, "path", "unmatched")
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {
+                getattr(r, "endpoint", None): r.path for r in scope["app"].routes if hasattr(r, "path")
+            }
+        return self._route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        recorded = False
+
+        async def send_wrapper(message):
+            nonlocal recorded
+            if message["type"] == "http.response.start" and not recorded:
+                recorded = True
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - start, scope["method"], self._route_label(scope), str(message["status"])
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not recorded:
+                HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], self._route_label(scope), "500")
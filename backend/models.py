@@ -47,8 +47,8 @@ class EmailReceipt(BaseModel):
     entry_time: str
     exit_time: str
     duration_minutes: int
-    base_charge: float
-    minute_charge: float
+    base_charge: Optional[float] = None
+    minute_charge: Optional[float] = None
     total_amount: float
 
 class SlotReservation(BaseModel):
@@ -0,0 +1,244 @@
+import json
+import random
+import threading
+import time
+from metrics import NOTIFICATION_SEND_SECONDS, NOTIFICATION_FAILURES
+
+OUTBOX_PENDING = 'PENDING'
+OUTBOX_SENDING = 'SENDING'
+OUTBOX_SENT = 'SENT'
+OUTBOX_DEAD = 'DEAD'
+
+def insert(cursor, channel: str, method: str, *args) -> int:
+    """Queue a send in the caller's transaction, so it commits (or rolls back) with the change it reports"""
+    now = time.time()
+    cursor.execute('''
+        INSERT INTO notification_outbox (channel, method, payload, status, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (channel, method, json.dumps(args), OUTBOX_PENDING, now, now))
+    return cursor.lastrowid
+
+
+class NotificationOutbox:
+    """SQLite-backed outbox for email / WhatsApp sends, drained by background workers.
+
+    Slot and billing writes queue their messages with insert() in their own
+    transaction (Database's `notify` hook) and then call wake(); a bounded
+    pool of worker threads delivers the messages with exponential backoff and
+    moves messages that keep failing to the DEAD state.
+    """
+
+    def __init__(self, db, senders: dict, workers: int = 2, max_attempts: int = 5,
+                 base_delay: float = 2.0, max_delay: float = 300.0, claim_timeout: float = 300.0,
+                 sent_retention: int = 7 * 24 * 3600):
+        self.db = db
+        self.senders = senders  # channel -> service object, e.g. {'email': EmailService}
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.claim_timeout = claim_timeout
+        self.sent_retention = sent_retention
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def init_table(self):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                method TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'PENDING',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                sent_at REAL,
+                last_error TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_outbox_status_due
+            ON notification_outbox (status, next_attempt_at)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_outbox_status_sent
+            ON notification_outbox (status, sent_at)
+        ''')
+        conn.commit()
+
+    def enqueue(self, channel: str, method: str, *args) -> int:
+        """Persist a send request on its own, e.g. enqueue('email', 'send_billing_email', to, billing)"""
+        conn = self.db.get_connection()
+        message_id = insert(conn.cursor(), channel, method, *args)
+        conn.commit()
+        self.wake()
+        return message_id
+
+    def wake(self):
+        """Have an idle worker look for due messages now instead of at its next poll"""
+        self._wakeup.set()
+
+    # ============= WORKERS =============
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self.init_table()
+        self._requeue_in_flight()
+        for i in range(self.worker_count):
+            thread = threading.Thread(target=self._worker, name=f"outbox-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"📬 Notification outbox started ({self.worker_count} workers)")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _requeue_in_flight(self):
+        """Messages whose claim expired (worker/process died mid-send) go back to the queue"""
+        conn = self.db.get_connection()
+        conn.execute('''
+            UPDATE notification_outbox SET status = ?
+            WHERE status = ? AND next_attempt_at < ?
+        ''', (OUTBOX_PENDING, OUTBOX_SENDING, time.time()))
+        conn.commit()
+
+    def _claim(self):
+        """Atomically take the oldest due message (safe across threads and processes)"""
+        now = time.time()
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        # next_attempt_at doubles as the claim expiry while a message is SENDING
+        cursor.execute('''
+            UPDATE notification_outbox
+            SET status = ?, attempts = attempts + 1, next_attempt_at = ?
+            WHERE id = (
+                SELECT id FROM notification_outbox
+                WHERE status = ? AND next_attempt_at <= ?
+                ORDER BY next_attempt_at
+                LIMIT 1
+            ) AND status = ?
+            RETURNING id, channel, method, payload, attempts
+        ''', (OUTBOX_SENDING, now + self.claim_timeout, OUTBOX_PENDING, now, OUTBOX_PENDING))
+        row = cursor.fetchone()
+        conn.commit()
+        return row
+
+    def _worker(self):
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                row = self._claim()
+            except Exception as e:
+                print(f"⚠️ Outbox claim error: {e}")
+                row = None
+
+            if row:
+                self._deliver(*row)
+                continue
+
+            if time.time() - last_purge > 3600:
+                last_purge = time.time()
+                self._housekeeping()
+
+            # Nothing due: sleep until a new message arrives or a retry becomes due
+            self._wakeup.wait(1.0)
+            self._wakeup.clear()
+
+    def _deliver(self, message_id, channel, method, payload, attempts):
+        error = None
+        start = time.perf_counter()
+        try:
+            sender = self.senders.get(channel)
+            if sender is None:
+                raise RuntimeError(f"channel '{channel}' is not configured")
+            if not getattr(sender, method)(*json.loads(payload)):
+                error = f"{method} returned failure"
+        except Exception as e:
+            error = str(e)
+        NOTIFICATION_SEND_SECONDS.observe(time.perf_counter() - start, channel, method)
+        if error is not None:
+            NOTIFICATION_FAILURES.inc(channel, method)
+
+        conn = self.db.get_connection()
+        if error is None:
+            conn.execute('''
+                UPDATE notification_outbox SET status = ?, sent_at = ?, last_error = NULL
+                WHERE id = ?
+            ''', (OUTBOX_SENT, time.time(), message_id))
+        elif attempts >= self.max_attempts:
+            print(f"☠️ Outbox message {message_id} ({channel}.{method}) dead-lettered: {error}")
+            conn.execute('''
+                UPDATE notification_outbox SET status = ?, last_error = ?
+                WHERE id = ?
+            ''', (OUTBOX_DEAD, error, message_id))
+        else:
+            # Exponential backoff with jitter: 2s, 4s, 8s ... capped at max_delay
+            delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+            delay *= random.uniform(0.8, 1.2)
+            conn.execute('''
+                UPDATE notification_outbox SET status = ?, next_attempt_at = ?, last_error = ?
+                WHERE id = ?
+            ''', (OUTBOX_PENDING, time.time() + delay, error, message_id))
+        conn.commit()
+
+    def _housekeeping(self):
+        """Drop old SENT rows and recover messages whose claim expired"""
+        try:
+            self._requeue_in_flight()
+            conn = self.db.get_connection()
+            conn.execute('''
+                DELETE FROM notification_outbox WHERE status = ? AND sent_at < ?
+            ''', (OUTBOX_SENT, time.time() - self.sent_retention))
+            conn.commit()
+        except Exception as e:
+            print(f"⚠️ Outbox housekeeping error: {e}")
+
+    # ============= STATS =============
+
+    def get_stats(self, latency_window: int = 1000) -> dict:
+        """Queue depth per status and delivery latency of the most recent sends"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) FROM notification_outbox GROUP BY status')
+        depth = {status: 0 for status in (OUTBOX_PENDING, OUTBOX_SENDING, OUTBOX_SENT, OUTBOX_DEAD)}
+        depth.update(dict(cursor.fetchall()))
+
+        cursor.execute('''
+            SELECT MIN(created_at) FROM notification_outbox WHERE status IN (?, ?)
+        ''', (OUTBOX_PENDING, OUTBOX_SENDING))
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute('''
+            SELECT sent_at - created_at FROM notification_outbox
+            WHERE status = ? ORDER BY sent_at DESC LIMIT ?
+        ''', (OUTBOX_SENT, latency_window))
+        latencies = sorted(row[0] for row in cursor.fetchall())
+
+        def pct(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))], 3)
+
+        return {
+            "queue_depth": depth[OUTBOX_PENDING] + depth[OUTBOX_SENDING],
+            "by_status": depth,
+            "oldest_pending_age_seconds": round(time.time() - oldest, 3) if oldest else 0,
+            "delivery_latency_seconds": {
+                "samples": len(latencies),
+                "p50": pct(50),
+                "p95": pct(95),
+                "p99": pct(99),
+                "max": round(latencies[-1], 3) if latencies else None
+            },
+            "workers": len(self._threads)
+        }
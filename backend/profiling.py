@@ -0,0 +1,249 @@
+"""
+On-demand profiling, switched on and off at runtime through admin endpoints.
+
+- RequestProfiler: cProfile a random sample of HTTP requests, aggregated into
+  one pstats file (load with `python -m pstats file` or snakeviz).
+- ThreadSampler: time-boxed stack sampling of another thread (the Blynk sync
+  loop) via sys._current_frames(), exported as a speedscope JSON profile.
+
+Both are off by default and cost one comparison per request while off.
+"""
+import cProfile
+import hmac
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency: profiling endpoints need X-Admin-Token == ADMIN_TOKEN (disabled if unset)"""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+# ============= REQUEST PROFILING =============
+
+class RequestProfiler:
+    """cProfile a fraction of requests into one aggregated pstats.
+
+    Only one request is profiled at a time (cProfile is per-interpreter on
+    newer Pythons), so a sampled request that overlaps another is skipped.
+    Requests run on the event loop, so a profile also includes whatever other
+    coroutines ran while the sampled request was awaiting. It only sees the
+    loop thread: database work that handlers hand to AsyncDatabase runs on
+    its reader / writer threads and shows up as time spent awaiting.
+    """
+
+    def __init__(self):
+        self.sample_rate = 0.0
+        self.path_prefix = "/api/"
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = None
+        self.profiled = 0
+        self.skipped = 0
+
+    def configure(self, sample_rate: float, path_prefix: str = None):
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        if path_prefix is not None:
+            self.path_prefix = path_prefix
+
+    def should_sample(self, path: str) -> bool:
+        return self.sample_rate > 0 and path.startswith(self.path_prefix) and random.random() < self.sample_rate
+
+    def begin(self) -> Optional[cProfile.Profile]:
+        if not self._busy.acquire(blocking=False):
+            self.skipped += 1
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) already owns the hook
+            self._busy.release()
+            self.skipped += 1
+            return None
+        return profile
+
+    def end(self, profile: cProfile.Profile):
+        profile.disable()
+        self._busy.release()
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.profiled += 1
+
+    def dump(self, reset: bool = False) -> Optional[bytes]:
+        """Aggregated profile in the pstats file format, or None if nothing was sampled"""
+        with self._lock:
+            if self._stats is None:
+                return None
+            data = marshal.dumps(self._stats.stats)
+            if reset:
+                self._stats = None
+                self.profiled = 0
+            return data
+
+    def get_stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "path_prefix": self.path_prefix,
+            "profiled_requests": self.profiled,
+            "skipped_requests": self.skipped
+        }
+
+
+class ProfilingMiddleware:
+    """ASGI middleware handing sampled requests to a RequestProfiler.
+
+    Profiling stops when the response starts, so a streamed body (SSE, history
+    export) is not profiled for as long as the client stays connected.
+    """
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_sample(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        profile = self.profiler.begin()
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+        ended = False
+
+        async def send_and_stop(message):
+            nonlocal ended
+            if message["type"] == "http.response.start" and not ended:
+                ended = True
+                self.profiler.end(profile)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_stop)
+        finally:
+            if not ended:
+                self.profiler.end(profile)
+
+
+# ============= THREAD SAMPLING =============
+
+class ThreadSampler:
+    """Samples the stack of one thread every `interval` seconds for `duration`.
+
+    Runs in its own thread and only reads frames, so the target keeps running
+    unmodified; cost to the target is the GIL hand-off per sample.
+    """
+
+    MAX_DEPTH = 128
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._result = None
+        self.target_name = None
+        self.started_at = None
+        self.ends_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, target: threading.Thread, duration: float, interval: float = 0.005) -> bool:
+        """Begin a capture; False if one is already running or the target is gone"""
+        with self._lock:
+            if self.running or target is None or not target.is_alive():
+                return False
+            self._result = None
+            self.target_name = target.name
+            self.started_at = time.time()
+            self.ends_at = self.started_at + duration
+            self._thread = threading.Thread(
+                target=self._run, args=(target.ident, target.name, duration, interval),
+                name="profiling-sampler", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def _run(self, ident, name, duration, interval):
+        frames, frame_index = [], {}
+        samples, weights = [], []
+        last_stack = None
+        start = time.perf_counter()
+        deadline = start + duration
+        last = start
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            frame = sys._current_frames().get(ident)
+            if frame is None:
+                break  # target thread exited
+            stack = []
+            while frame is not None and len(stack) < self.MAX_DEPTH:
+                code = frame.f_code
+                key = (code.co_name, code.co_filename, code.co_firstlineno)
+                index = frame_index.get(key)
+                if index is None:
+                    index = frame_index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                stack.append(index)
+                frame = frame.f_back
+            stack.reverse()  # speedscope wants root first
+            # Merge consecutive identical stacks into one weighted sample
+            if stack == last_stack:
+                weights[-1] += now - last
+            else:
+                samples.append(stack)
+                weights.append(now - last)
+                last_stack = stack
+            last = now
+            time.sleep(interval)
+
+        elapsed = time.perf_counter() - start
+        result = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"thread {name}",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": elapsed,
+                "samples": samples,
+                "weights": weights
+            }],
+            "name": f"{name} ({elapsed:.1f}s)",
+            "exporter": "smart-parking profiling.ThreadSampler"
+        }
+        with self._lock:
+            self._result = result
+
+    def result(self) -> Optional[dict]:
+        with self._lock:
+            return self._result
+
+    def get_stats(self) -> dict:
+        result = self.result()
+        return {
+            "running": self.running,
+            "target": self.target_name,
+            "started_at": self.started_at,
+            "ends_at": self.ends_at,
+            "samples": len(result["profiles"][0]["samples"]) if result else 0,
+            "ready": result is not None
+        }
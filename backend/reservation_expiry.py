@@ -0,0 +1,103 @@
+import heapq
+import threading
+import time
+
+class ReservationExpiryScheduler:
+    """Fires reservation expiry exactly when `arrival_time` passes.
+
+    Deadlines live in a min-heap keyed on arrival_time and a single thread
+    sleeps until the earliest one. Entries for reservations that were cancelled
+    or re-booked are not removed eagerly: the conditional expire in the
+    database simply matches nothing when they come due.
+    """
+
+    def __init__(self, db, on_expired=None, notify=None):
+        self.db = db
+        self.on_expired = on_expired  # callback(slot_dict) after a reservation lapsed
+        self.notify = notify  # outbox messages for a lapsed reservation, queued with the expiry itself
+        self._heap = []
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.stats = {"scheduled": 0, "expired": 0, "stale": 0}
+
+    def schedule(self, slot_id: int, arrival_time: int):
+        if arrival_time is None:
+            return
+        with self._cond:
+            heapq.heappush(self._heap, (arrival_time, slot_id))
+            self.stats["scheduled"] += 1
+            # Wake the timer thread only if this is now the earliest deadline
+            if self._heap[0] == (arrival_time, slot_id):
+                self._cond.notify()
+
+    def rebuild(self):
+        """Re-arm timers for every open reservation (after a restart)"""
+        with self._cond:
+            self._heap = [
+                (slot['arrival_time'], slot['slot_id'])
+                for slot in self.db.get_all_slots()
+                if slot['is_reserved'] and slot['arrival_time'] is not None
+            ]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+        return len(self._heap)
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop = False
+        count = self.rebuild()
+        self._thread = threading.Thread(target=self._run, name="reservation-expiry", daemon=True)
+        self._thread.start()
+        print(f"⏰ Reservation expiry scheduler started ({count} pending)")
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _next_due(self):
+        """Block until a deadline passes; returns [(arrival_time, slot_id)] or None on stop"""
+        with self._cond:
+            while not self._stop:
+                now = time.time()
+                if self._heap and self._heap[0][0] < now:
+                    due = []
+                    while self._heap and self._heap[0][0] < now:
+                        due.append(heapq.heappop(self._heap))
+                    return due
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
+            return None
+
+    def _run(self):
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+            for arrival_time, slot_id in due:
+                try:
+                    slot = self.db.expire_reservation(slot_id, arrival_time, notify=self.notify)
+                except Exception as e:
+                    print(f"⚠️ Reservation expiry error (slot {slot_id}): {e}")
+                    continue
+                if slot is None:
+                    self.stats["stale"] += 1
+                    continue
+                self.stats["expired"] += 1
+                print(f"⏰ Slot {slot_id} reservation expired")
+                if self.on_expired:
+                    try:
+                        self.on_expired(slot)
+                    except Exception as e:
+                        print(f"⚠️ Reservation expiry callback error (slot {slot_id}): {e}")
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            pending = len(self._heap)
+            next_deadline = self._heap[0][0] if self._heap else None
+        return dict(self.stats, pending=pending, next_deadline=next_deadline)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Revenue rollups - per slot x hour/day/month x payment status aggregates of
+parking_history, maintained in the same transaction as every history write.
+
+Buckets are cut on exit_time in the lot's local time: `offset` is the
+tariff's UTC offset in seconds (TariffEngine.utc_offset), so a day bucket
+runs from local midnight to local midnight. bucket_start values are still
+unix seconds. Range queries are answered at one-hour resolution by covering
+the range with as few month, day and hour buckets as possible, so their cost
+does not grow with the size of parking_history.
+
+Usage: python revenue_rollups.py backfill [database_file]   (offset from TARIFF_CONFIG)
+"""
+import os
+import sys
+from datetime import datetime, timezone
+
+GRANULARITIES = ('hour', 'day', 'month')
+HOUR = 3600
+DAY = 86400
+
+CREATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS revenue_rollups (
+        granularity TEXT NOT NULL,
+        payment_status TEXT NOT NULL,
+        bucket_start INTEGER NOT NULL,
+        slot_id INTEGER NOT NULL,
+        total_amount REAL NOT NULL DEFAULT 0,
+        session_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularity, payment_status, bucket_start, slot_id)
+    ) WITHOUT ROWID
+'''
+
+# The offset the stored buckets were cut with; a different one needs a backfill
+CREATE_SETTINGS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS revenue_rollup_settings (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        utc_offset INTEGER NOT NULL
+    )
+'''
+
+
+def month_start(ts: int, offset: int = 0) -> int:
+    dt = datetime.fromtimestamp(ts + offset, tz=timezone.utc)
+    return int(dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp()) - offset
+
+
+def next_month(ts: int, offset: int = 0) -> int:
+    dt = datetime.fromtimestamp(month_start(ts, offset) + offset, tz=timezone.utc)
+    if dt.month == 12:
+        dt = dt.replace(year=dt.year + 1, month=1)
+    else:
+        dt = dt.replace(month=dt.month + 1)
+    return int(dt.timestamp()) - offset
+
+
+def bucket_start(granularity: str, ts: int, offset: int = 0) -> int:
+    if granularity == 'hour':
+        return ts - (ts + offset) % HOUR
+    if granularity == 'day':
+        return ts - (ts + offset) % DAY
+    return month_start(ts, offset)
+
+
+def stored_offset(cursor):
+    """Offset the current rollups were built with (None before the first backfill)"""
+    cursor.execute('SELECT utc_offset FROM revenue_rollup_settings WHERE id = 1')
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def apply(cursor, slot_id, exit_time, payment_status, amount, sessions=1, offset=0):
+    """Add (or with negative values, remove) one history row's contribution"""
+    apply_many(cursor, [(slot_id, exit_time, payment_status, amount, sessions)], offset)
+
+
+def apply_many(cursor, changes, offset=0):
+    """Apply many (slot_id, exit_time, payment_status, amount, sessions) deltas,
+    merged per bucket first so each bucket is upserted once.
+    """
+    deltas = {}
+    for slot_id, exit_time, payment_status, amount, sessions in changes:
+        ts = int(exit_time or 0)
+        for granularity in GRANULARITIES:
+            key = (granularity, payment_status, bucket_start(granularity, ts, offset), slot_id)
+            total = deltas.setdefault(key, [0.0, 0])
+            total[0] += amount or 0.0
+            total[1] += sessions
+    cursor.executemany('''
+        INSERT INTO revenue_rollups (granularity, payment_status, bucket_start, slot_id, total_amount, session_count)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (granularity, payment_status, bucket_start, slot_id) DO UPDATE SET
+            total_amount = total_amount + excluded.total_amount,
+            session_count = session_count + excluded.session_count
+    ''', [(*key, amount, sessions) for key, (amount, sessions) in deltas.items()])
+
+
+def backfill(conn, offset=0):
+    """Rebuild every rollup from parking_history in one transaction"""
+    cursor = conn.cursor()
+    cursor.execute(CREATE_SETTINGS_TABLE)
+    cursor.execute('DELETE FROM revenue_rollups')
+    # exit_time shifted to local time; bucket starts are shifted back to unix seconds
+    local = f'(COALESCE(exit_time, 0) + {int(offset)})'
+    buckets = {
+        'hour': f'COALESCE(exit_time, 0) - {local} % {HOUR}',
+        'day': f'COALESCE(exit_time, 0) - {local} % {DAY}',
+        'month': f"CAST(strftime('%s', {local}, 'unixepoch', 'start of month') AS INTEGER) - {int(offset)}",
+    }
+    for granularity, expression in buckets.items():
+        cursor.execute(f'''
+            INSERT INTO revenue_rollups (granularity, payment_status, bucket_start, slot_id, total_amount, session_count)
+            SELECT ?, COALESCE(payment_status, 'PENDING'), {expression}, slot_id,
+                   COALESCE(SUM(total_amount), 0), COUNT(*)
+            FROM parking_history
+            GROUP BY 2, 3, 4
+        ''', (granularity,))
+    cursor.execute('''
+        INSERT INTO revenue_rollup_settings (id, utc_offset) VALUES (1, ?)
+        ON CONFLICT (id) DO UPDATE SET utc_offset = excluded.utc_offset
+    ''', (int(offset),))
+    conn.commit()
+    cursor.execute("SELECT COUNT(*) FROM revenue_rollups WHERE granularity = 'month'")
+    return cursor.fetchone()[0]
+
+
+def cover(since: int, until: int, coarsest: str = 'month', offset: int = 0) -> list:
+    """Split [since, until) into (granularity, start, end) runs of whole buckets,
+    using the coarsest bucket (up to `coarsest`) that fits at each step.
+
+    since is rounded down and until rounded up to the (local) hour.
+    """
+    allowed = GRANULARITIES[:GRANULARITIES.index(coarsest) + 1]
+    since = bucket_start('hour', since, offset)
+    until = until if (until + offset) % HOUR == 0 else bucket_start('hour', until, offset) + HOUR
+    ranges = []
+    t = since
+    while t < until:
+        if 'month' in allowed and t == month_start(t, offset) and next_month(t, offset) <= until:
+            granularity, step_end = 'month', next_month(t, offset)
+        elif 'day' in allowed and (t + offset) % DAY == 0 and t + DAY <= until:
+            granularity, step_end = 'day', t + DAY
+        else:
+            granularity, step_end = 'hour', t + HOUR
+        if ranges and ranges[-1][0] == granularity and ranges[-1][2] == t:
+            ranges[-1] = (granularity, ranges[-1][1], step_end)
+        else:
+            ranges.append((granularity, t, step_end))
+        t = step_end
+    return ranges
+
+
+def query(conn, since=None, until=None, group_by=None, statuses=('PAID',), offset=0):
+    """Totals (and optional groups) for the time range from the rollup tables.
+
+    Every group_by reads the same decomposition of the range, so the totals
+    agree whatever the grouping; grouping by hour/day/month only keeps the
+    decomposition from using buckets coarser than the groups. `offset` must
+    be the one the rollups were built with.
+    """
+    cursor = conn.cursor()
+    status_sql = ', '.join('?' for _ in statuses)
+    by_time = group_by in GRANULARITIES
+
+    if since is None and until is None:
+        ranges = [(group_by if by_time else 'month', None, None)]
+    else:
+        ranges = cover(int(since or 0), int(until if until is not None else datetime.now(timezone.utc).timestamp() + 1),
+                       coarsest=group_by if by_time else 'month', offset=offset)
+
+    per_slot, per_bucket = {}, {}
+    for granularity, start, end in ranges:
+        clauses, params = ['granularity = ?', f'payment_status IN ({status_sql})'], [granularity, *statuses]
+        if start is not None:
+            clauses.append('bucket_start >= ? AND bucket_start < ?')
+            params.extend([start, end])
+        cursor.execute(f'''
+            SELECT bucket_start, slot_id, SUM(total_amount), SUM(session_count)
+            FROM revenue_rollups WHERE {' AND '.join(clauses)}
+            GROUP BY bucket_start, slot_id
+        ''', params)
+        for bucket, slot_id, amount, sessions in cursor.fetchall():
+            for totals in (per_slot.setdefault(slot_id, [0.0, 0]),
+                           per_bucket.setdefault(bucket_start(group_by, bucket, offset) if by_time else None, [0.0, 0])):
+                totals[0] += amount or 0.0
+                totals[1] += sessions or 0
+
+    stats = {
+        "total_revenue": sum((t[0] for t in per_slot.values()), 0.0),
+        "total_sessions": sum(t[1] for t in per_slot.values())
+    }
+    if group_by == 'slot':
+        stats["group_by"] = 'slot'
+        stats["groups"] = [
+            {"slot_id": slot_id, "total_revenue": per_slot[slot_id][0], "total_sessions": per_slot[slot_id][1]}
+            for slot_id in sorted(per_slot)
+        ]
+    elif by_time:
+        stats["group_by"] = group_by
+        stats["groups"] = [
+            {"bucket_start": bucket, "total_revenue": per_bucket[bucket][0], "total_sessions": per_bucket[bucket][1]}
+            for bucket in sorted(per_bucket)
+        ]
+    return stats
+
+
+if __name__ == "__main__":
+    import sqlite3
+    from tariff import TariffEngine
+
+    if len(sys.argv) < 2 or sys.argv[1] != "backfill":
+        print(__doc__)
+        sys.exit(1)
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "parking_system.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(CREATE_TABLE)
+    offset = TariffEngine.load(os.getenv("TARIFF_CONFIG", "tariff.json")).utc_offset
+    print(f"Backfilling revenue rollups in {db_path} (UTC{offset / 3600:+g}h buckets)...")
+    buckets = backfill(conn, offset)
+    conn.close()
+    print(f"✅ Rollups rebuilt ({buckets} monthly buckets)")
@@ -0,0 +1,93 @@
+import threading
+from metrics import SENSOR_FLAPS_SUPPRESSED
+
+# Blynk entry times this far past the poll are still accepted (device clock drift)
+CLOCK_SKEW = 5.0
+
+class _SlotSensor:
+    __slots__ = ("confirmed", "candidate", "candidate_since", "last_free_at", "flaps")
+
+    def __init__(self):
+        self.confirmed = None        # debounced state (None until the first confirmation)
+        self.candidate = None        # raw state that differs from `confirmed`, not yet held long enough
+        self.candidate_since = None  # first poll that read the candidate
+        self.last_free_at = None     # last poll that read the slot free
+        self.flaps = 0
+
+
+class SensorDebouncer:
+    """Per-slot debouncing with hysteresis for the raw IR readings from Blynk.
+
+    A new reading only becomes the slot's state once every poll has read it for
+    `confirm_occupied` seconds (car arriving) or `confirm_free` seconds (car
+    leaving). A reading that reverts before that, such as a passing pedestrian,
+    a reflective bumper or a car moving in the bay, counts as a suppressed flap
+    and causes no DB write.
+    """
+
+    def __init__(self, confirm_occupied: float = 3.0, confirm_free: float = 10.0):
+        self.confirm_occupied = confirm_occupied
+        self.confirm_free = confirm_free
+        self._slots = {}
+        self._lock = threading.Lock()
+        self.stats = {"readings": 0, "confirmed_changes": 0, "suppressed_flaps": 0}
+
+    def update(self, slot_id: int, is_occupied: bool, poll_time: float, entry_time: float = None):
+        """Feed one poll's reading; returns the newly confirmed state or None.
+
+        The result is {'slot_id', 'is_occupied', 'since'}. For an arrival, `since`
+        is the hardware entry time from Blynk if it is plausible (after the last
+        free reading, not in the future), else the first poll that saw the car.
+        """
+        is_occupied = bool(is_occupied)
+        with self._lock:
+            self.stats["readings"] += 1
+            sensor = self._slots.get(slot_id)
+            if sensor is None:
+                sensor = self._slots[slot_id] = _SlotSensor()
+            previous_free_at = sensor.last_free_at
+            if not is_occupied:
+                sensor.last_free_at = poll_time
+
+            if is_occupied == sensor.confirmed:
+                if sensor.candidate is not None:
+                    # Went back before it was confirmed
+                    sensor.candidate = None
+                    sensor.flaps += 1
+                    self.stats["suppressed_flaps"] += 1
+                    SENSOR_FLAPS_SUPPRESSED.inc("free" if sensor.confirmed else "occupied")
+                return None
+
+            if sensor.candidate != is_occupied:
+                sensor.candidate = is_occupied
+                sensor.candidate_since = poll_time
+            window = self.confirm_occupied if is_occupied else self.confirm_free
+            if poll_time - sensor.candidate_since < window:
+                return None
+
+            sensor.confirmed = is_occupied
+            sensor.candidate = None
+            self.stats["confirmed_changes"] += 1
+            since = sensor.candidate_since
+            if is_occupied and entry_time:
+                if (previous_free_at is None or entry_time >= previous_free_at) and entry_time <= poll_time + CLOCK_SKEW:
+                    since = min(entry_time, poll_time)
+            return {"slot_id": slot_id, "is_occupied": is_occupied, "since": since}
+
+    def reset(self, slot_id: int):
+        """Forget a slot's confirmed state, so its next stable reading is reported again"""
+        with self._lock:
+            sensor = self._slots.get(slot_id)
+            if sensor is not None:
+                sensor.confirmed = None
+                sensor.candidate = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(
+                self.stats,
+                confirm_occupied_seconds=self.confirm_occupied,
+                confirm_free_seconds=self.confirm_free,
+                pending=sorted(slot_id for slot_id, sensor in self._slots.items() if sensor.candidate is not None),
+                flaps_by_slot={slot_id: sensor.flaps for slot_id, sensor in sorted(self._slots.items()) if sensor.flaps}
+            )
@@ -0,0 +1,112 @@
+import json
+import os
+from typing import NamedTuple, Optional
+
+DEFAULT_DEVICE = "default"
+
+class SlotConfig(NamedTuple):
+    slot_id: int
+    device: str
+    status_pin: str
+    reserve_pin: str
+    entry_time_pin: str
+
+
+class SlotRegistry:
+    """Maps every parking slot to its Blynk device and virtual pins.
+
+    Loaded from a JSON file (see slots.example.json); without one it falls back
+    to the original 3-slot layout (status V0-V2, reserve V3-V5, entry V6-V8).
+    Lookups are dict-based, so validating a slot ID is O(1) at any lot size.
+    """
+
+    def __init__(self, slots: list, devices: dict):
+        self.devices = dict(devices)  # device name -> Blynk auth token
+        self._slots = {}
+        used_pins = set()
+        for slot in slots:
+            if slot.slot_id in self._slots:
+                raise ValueError(f"Duplicate slot_id {slot.slot_id} in slot config")
+            if slot.device not in self.devices:
+                raise ValueError(f"Slot {slot.slot_id} uses unknown device '{slot.device}'")
+            for pin in (slot.status_pin, slot.reserve_pin, slot.entry_time_pin):
+                if (slot.device, pin) in used_pins:
+                    raise ValueError(f"Pin {pin} on device '{slot.device}' is assigned twice")
+                used_pins.add((slot.device, pin))
+            self._slots[slot.slot_id] = slot
+        self.slot_ids = sorted(self._slots)
+        self._by_device = {}
+        for slot_id in self.slot_ids:
+            slot = self._slots[slot_id]
+            self._by_device.setdefault(slot.device, []).append(slot)
+
+    def __contains__(self, slot_id) -> bool:
+        return slot_id in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def get(self, slot_id: int) -> Optional[SlotConfig]:
+        return self._slots.get(slot_id)
+
+    def by_device(self) -> dict:
+        """{device: [SlotConfig, ...]} in slot order, for batched per-device reads"""
+        return self._by_device
+
+    def token_for(self, device: str) -> str:
+        return self.devices[device]
+
+    # ============= LOADING =============
+
+    @classmethod
+    def default(cls, auth_token: str, count: int = 3):
+        """The original single-device layout used by parking_system.ino"""
+        slots = [
+            SlotConfig(slot_id, DEFAULT_DEVICE, f"V{slot_id - 1}", f"V{slot_id - 1 + count}", f"V{slot_id - 1 + 2 * count}")
+            for slot_id in range(1, count + 1)
+        ]
+        return cls(slots, {DEFAULT_DEVICE: auth_token})
+
+    @classmethod
+    def from_dict(cls, config: dict, default_token: str = None):
+        devices = {}
+        for name, device in config.get("devices", {DEFAULT_DEVICE: {}}).items():
+            token = device.get("token") or os.getenv(device.get("token_env", "BLYNK_AUTH_TOKEN")) or default_token
+            devices[name] = token
+
+        slots = []
+        for entry in config.get("slots", []):
+            slots.append(SlotConfig(
+                int(entry["slot_id"]),
+                entry.get("device", DEFAULT_DEVICE),
+                entry["status_pin"],
+                entry["reserve_pin"],
+                entry["entry_time_pin"]
+            ))
+
+        # Ranges describe large blocks of consecutive slots without listing each one, e.g.
+        # {"first_slot": 4, "count": 80, "device": "level2",
+        #  "status_pin_start": 0, "reserve_pin_start": 80, "entry_time_pin_start": 160}
+        for block in config.get("ranges", []):
+            first = int(block["first_slot"])
+            for offset in range(int(block["count"])):
+                slots.append(SlotConfig(
+                    first + offset,
+                    block.get("device", DEFAULT_DEVICE),
+                    f"V{int(block['status_pin_start']) + offset}",
+                    f"V{int(block['reserve_pin_start']) + offset}",
+                    f"V{int(block['entry_time_pin_start']) + offset}"
+                ))
+        return cls(slots, devices)
+
+    @classmethod
+    def load(cls, path: str = None, default_token: str = None):
+        """Load from `path` if it exists, otherwise use the default 3-slot layout"""
+        if path and os.path.exists(path):
+            with open(path) as f:
+                registry = cls.from_dict(json.load(f), default_token)
+            print(f"✓ Slot registry loaded from {path}: {len(registry)} slots")
+            return registry
+        if path:
+            print(f"⚠️  Slot config {path} not found, using default 3-slot layout")
+        return cls.default(default_token)
@@ -0,0 +1,74 @@
+"""
+Slot lifecycle as an explicit state machine:
+
+    free --reserve--> reserved --occupy--> occupied --bill--> free
+    free --occupy--> occupied               (arrival without a booking)
+    reserved --cancel / expire--> free      (cancel bills the reserved hours)
+
+"Billed" is the parking_history row the bill event writes; the slot itself
+goes back to free in the same transaction.
+
+Database applies each event as one guarded UPDATE ... RETURNING inside one
+transaction: the WHERE clause is "slot is in one of the allowed states", so
+checking and changing the slot is a single atomic statement, and a request
+that loses a race changes nothing and raises InvalidTransition.
+"""
+
+FREE = 'free'
+RESERVED = 'reserved'
+OCCUPIED = 'occupied'
+
+# SQL predicate for "the slot row is in this state"
+STATE_GUARDS = {
+    FREE: 'is_occupied = 0 AND is_reserved = 0',
+    RESERVED: 'is_occupied = 0 AND is_reserved = 1',
+    OCCUPIED: 'is_occupied = 1',
+}
+
+# event -> (states it may start from, state it ends in)
+TRANSITIONS = {
+    'reserve': ((FREE,), RESERVED),
+    'cancel': ((RESERVED,), FREE),
+    'expire': ((RESERVED,), FREE),
+    'occupy': ((FREE, RESERVED), OCCUPIED),
+    'bill': ((OCCUPIED,), FREE),
+}
+
+
+class InvalidTransition(Exception):
+    """The slot is not in a state the event can start from"""
+
+    def __init__(self, slot_id, event, state):
+        self.slot_id = slot_id
+        self.event = event
+        self.state = state
+        super().__init__(f"Slot {slot_id} is {state or 'unknown'}, cannot {event}")
+
+
+class ReservationOwnerMismatch(InvalidTransition):
+    """Cancel requested with an email that does not match the reservation"""
+
+    def __init__(self, slot_id):
+        super().__init__(slot_id, 'cancel', RESERVED)
+        self.args = (f"Slot {slot_id} is reserved under a different email",)
+
+
+def state_of(slot) -> str:
+    if slot is None:
+        return None
+    if slot['is_occupied']:
+        return OCCUPIED
+    return RESERVED if slot['is_reserved'] else FREE
+
+
+def guard(event) -> str:
+    """WHERE clause fragment matching the states `event` may start from"""
+    sources = TRANSITIONS[event][0]
+    return '(' + ' OR '.join(f'({STATE_GUARDS[state]})' for state in sources) + ')'
+
+
+def check(slot_id, event, slot):
+    """Raise InvalidTransition unless `slot` (a slot dict) may take `event`"""
+    state = state_of(slot)
+    if state not in TRANSITIONS[event][0]:
+        raise InvalidTransition(slot_id, event, state)
@@ -0,0 +1,72 @@
+import threading
+
+
+class SlotStore:
+    """In-memory copy of the slots table, kept current write-through by Database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._version = 0
+        self._snapshot = []
+        self._snapshot_version = -1
+        self._listeners = []
+
+    @property
+    def version(self) -> int:
+        """Monotonically increasing counter, bumped on every slot change"""
+        return self._version
+
+    def add_listener(self, callback):
+        """Register callback(version, changed_slots) invoked after every change"""
+        self._listeners.append(callback)
+
+    def _notify(self, version, changed):
+        for callback in self._listeners:
+            try:
+                callback(version, changed)
+            except Exception as e:
+                print(f"⚠️ Slot store listener error: {e}")
+
+    def load(self, slots: list):
+        """Replace the whole store (used on startup / after bulk writes)"""
+        with self._lock:
+            self._slots = {slot['slot_id']: dict(slot) for slot in slots}
+            self._version += 1
+            version = self._version
+            changed = [dict(self._slots[slot_id]) for slot_id in sorted(self._slots)]
+        self._notify(version, changed)
+
+    def put(self, slot: dict):
+        """Write-through a single slot row after it was committed to SQLite"""
+        with self._lock:
+            if self._slots.get(slot['slot_id']) == slot:
+                return  # Nothing actually changed
+            self._slots[slot['slot_id']] = dict(slot)
+            self._version += 1
+            version = self._version
+        self._notify(version, [dict(slot)])
+
+    def get(self, slot_id: int):
+        slot = self._slots.get(slot_id)
+        return dict(slot) if slot else None
+
+    def get_all_versioned(self):
+        """(version, slots) read atomically, for snapshots sent to stream clients"""
+        with self._lock:
+            version = self._version
+            snapshot = self._current_snapshot()
+        return version, [dict(slot) for slot in snapshot]
+
+    def get_all(self) -> list:
+        """Return all slots ordered by slot_id, rebuilt only when the version moved"""
+        with self._lock:
+            snapshot = self._current_snapshot()
+        return [dict(slot) for slot in snapshot]
+
+    def _current_snapshot(self):
+        # Caller holds self._lock
+        if self._snapshot_version != self._version:
+            self._snapshot = [self._slots[slot_id] for slot_id in sorted(self._slots)]
+            self._snapshot_version = self._version
+        return self._snapshot
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+
+class _Subscriber:
+    __slots__ = ("queue", "needs_snapshot")
+
+    def __init__(self, max_queue: int):
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.needs_snapshot = False
+
+
+class SlotStreamBroker:
+    """Fans slot-store changes out to Server-Sent Events clients.
+
+    The slot store is the single change source: every committed slot write
+    (sync thread or API handler) calls publish() once, the event is encoded
+    once and handed to the event loop with a single call_soon_threadsafe, and
+    the loop copies it into each client's bounded queue. A client that falls
+    behind has its queue dropped and is sent a fresh snapshot instead, so one
+    slow browser never holds up the others or grows memory without bound.
+    """
+
+    def __init__(self, slot_store, max_queue: int = 64, heartbeat: float = 15.0):
+        self.slot_store = slot_store
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self._subscribers = set()
+        self._loop = None
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "overflows": 0}
+        slot_store.add_listener(self.publish)
+
+    @staticmethod
+    def _encode(event: str, version: int, slots: list) -> str:
+        data = json.dumps({"version": version, "slots": slots}, separators=(",", ":"))
+        return f"event: {event}\nid: {version}\ndata: {data}\n\n"
+
+    # ============= PRODUCER SIDE (any thread) =============
+
+    def publish(self, version: int, changed: list):
+        loop = self._loop
+        if loop is None or not self._subscribers:
+            return
+        message = self._encode("delta", version, changed)
+        try:
+            loop.call_soon_threadsafe(self._fan_out, message)
+        except RuntimeError:
+            pass  # Event loop already closed (shutdown)
+
+    def _fan_out(self, message: str):
+        self.stats["published"] += 1
+        for sub in self._subscribers:
+            if sub.needs_snapshot:
+                continue
+            try:
+                sub.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Backpressure: drop this client's backlog, resync with a snapshot
+                self.stats["overflows"] += 1
+                sub.needs_snapshot = True
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.queue.put_nowait(None)
+
+    # ============= CONSUMER SIDE (event loop) =============
+
+    def _subscribe(self) -> _Subscriber:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.get_running_loop()
+        sub = _Subscriber(self.max_queue)
+        self._subscribers.add(sub)
+        return sub
+
+    def _snapshot(self) -> str:
+        version, slots = self.slot_store.get_all_versioned()
+        return self._encode("snapshot", version, slots)
+
+    async def stream(self, request):
+        """Async generator of SSE frames: a snapshot, then deltas"""
+        sub = self._subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            yield self._snapshot()
+            while True:
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if sub.needs_snapshot:
+                    sub.needs_snapshot = False
+                    yield self._snapshot()
+                    continue
+                if message is not None:
+                    yield message
+        finally:
+            self._subscribers.discard(sub)
+
+    def get_stats(self) -> dict:
+        return dict(self.stats, subscribers=len(self._subscribers))
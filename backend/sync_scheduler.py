@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+from collections import deque
+from metrics import SYNC_DETECTION_LAG_SECONDS
+
+class AdaptivePollScheduler:
+    """Decides how long the Blynk sync loop sleeps between polls.
+
+    - a detected change drops the interval to `min_interval` and keeps it there
+      for `active_window` seconds (rush hour reacts fast)
+    - quiet polls after that grow the interval by `backoff` up to `max_interval`
+    - Blynk errors back off exponentially from `base_interval`
+    - every sleep is jittered by +/- `jitter` so several workers drift apart
+    """
+
+    def __init__(self, min_interval: float = 0.5, base_interval: float = 2.0,
+                 max_interval: float = 30.0, backoff: float = 2.0,
+                 active_window: float = 60.0, jitter: float = 0.2, lag_samples: int = 1000):
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.active_window = active_window
+        self.jitter = jitter
+        self.interval = base_interval
+        self.last_change_at = None
+        self.last_poll_at = None
+        self._previous_poll_at = None
+        self.consecutive_errors = 0
+        self.counters = {"polls": 0, "changes": 0, "errors": 0}
+        self._lags = deque(maxlen=lag_samples)
+        self._lock = threading.Lock()
+
+    def record_poll(self, changed: bool, error: bool = False, now: float = None) -> float:
+        """Update the interval from the outcome of one poll and return it"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self.counters["polls"] += 1
+            self.last_poll_at = now
+            if error:
+                self.counters["errors"] += 1
+                self.consecutive_errors += 1
+                self.interval = min(self.max_interval,
+                                    self.base_interval * self.backoff ** self.consecutive_errors)
+                return self.interval
+
+            self.consecutive_errors = 0
+            if changed:
+                self.counters["changes"] += 1
+                self.last_change_at = now
+                self.interval = self.min_interval
+            elif self.last_change_at is not None and now - self.last_change_at < self.active_window:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.max_interval,
+                                    max(self.interval, self.base_interval / self.backoff) * self.backoff)
+            return self.interval
+
+    def record_detection(self, poll_time: float, happened_at: float = None):
+        """Record how long after a change the poll that found it ran.
+
+        `happened_at` is the hardware timestamp when Blynk provides one; otherwise
+        the change happened after the previous poll, so the gap since that poll
+        is recorded as the (upper-bound) lag.
+        """
+        with self._lock:
+            reference = happened_at if happened_at else self._previous_poll_at
+            if reference is not None:
+                lag = max(0.0, poll_time - reference)
+                self._lags.append(lag)
+                SYNC_DETECTION_LAG_SECONDS.observe(lag)
+
+    def begin_poll(self):
+        """Call right before polling; remembers when the previous poll ran"""
+        with self._lock:
+            self._previous_poll_at = self.last_poll_at
+        return time.time()
+
+    def next_sleep(self) -> float:
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def wait(self, stop_event: threading.Event) -> bool:
+        """Sleep for the jittered interval; returns True if stop was requested"""
+        return stop_event.wait(self.next_sleep())
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            lags = sorted(self._lags)
+            metrics = dict(self.counters)
+            metrics.update({
+                "current_interval_seconds": round(self.interval, 3),
+                "consecutive_errors": self.consecutive_errors,
+                "last_change_at": self.last_change_at,
+                "last_poll_at": self.last_poll_at,
+            })
+
+        def pct(p):
+            if not lags:
+                return None
+            return round(lags[min(len(lags) - 1, int(p / 100 * len(lags)))], 3)
+
+        metrics["detection_lag_seconds"] = {
+            "samples": len(lags),
+            "p50": pct(50),
+            "p95": pct(95),
+            "p99": pct(99),
+            "max": round(lags[-1], 3) if lags else None
+        }
+        return metrics
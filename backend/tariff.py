@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Tariff engine - prices parking sessions and reservation fees from a tariff
+table instead of inline constants.
+
+A tariff has a base charge, time-of-day bands (per-minute rates), an optional
+grace period, a per-24h cap and a per-session cap. Pricing works on NumPy
+arrays, so a single session and a million historical sessions go through the
+same code path.
+
+Usage: python tariff.py requote <tariff.json> [database_file] [--since TS] [--until TS]
+"""
+import json
+import os
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+
+DAY = 86400
+
+# Reproduces the original pricing: ₹30 base + ₹50 per 30 seconds while parked,
+# ₹30 + ₹100 per reserved hour for cancelled reservations.
+DEFAULT_TARIFF = {
+    "name": "standard",
+    "currency": "₹",
+    "base_charge": 30.0,
+    "rate_per_minute": 100.0,
+    "bands": [],
+    "grace_seconds": 0,
+    "billing_increment_seconds": 0,
+    "daily_cap": None,
+    "max_charge": None,
+    "reservation": {"base_charge": 30.0, "rate_per_hour": 100.0}
+}
+
+
+def _parse_clock(value) -> int:
+    """'HH:MM' (or seconds) -> seconds since midnight; '24:00' is allowed as an end"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    hours, minutes = value.split(":")
+    return int(hours) * 3600 + int(minutes) * 60
+
+
+class TariffEngine:
+    """Vectorised pricing for parking sessions.
+
+    The time charge is the integral of the per-minute rate over the session.
+    Rates for one day are folded into a cumulative charge curve, so pricing a
+    session is two np.interp lookups plus whole days, however many bands exist.
+    """
+
+    def __init__(self, config: dict = None):
+        config = dict(DEFAULT_TARIFF, **(config or {}))
+        self.config = config
+        self.name = config["name"]
+        self.currency = config["currency"]
+        self.base_charge = float(config["base_charge"])
+        self.default_rate = float(config["rate_per_minute"])
+        self.grace_seconds = int(config["grace_seconds"] or 0)
+        self.increment = int(config["billing_increment_seconds"] or 0)
+        self.daily_cap = None if config["daily_cap"] is None else float(config["daily_cap"])
+        self.max_charge = None if config["max_charge"] is None else float(config["max_charge"])
+        reservation = dict(DEFAULT_TARIFF["reservation"], **(config.get("reservation") or {}))
+        self.reservation_base = float(reservation["base_charge"])
+        self.reservation_rate = float(reservation["rate_per_hour"])
+        offset = config.get("utc_offset_minutes")
+        self.utc_offset = int(offset) * 60 if offset is not None else time.localtime().tm_gmtoff
+
+        self.bands = []
+        for band in config["bands"]:
+            start, end = _parse_clock(band["start"]), _parse_clock(band["end"])
+            if not (0 <= start <= DAY and 0 <= end <= DAY) or start == end:
+                raise ValueError(f"Invalid tariff band {band['start']}-{band['end']}")
+            self.bands.append((start, end, float(band["rate_per_minute"])))
+        self._build_curve()
+
+    def _build_curve(self):
+        """Cumulative time charge from local midnight, sampled at every band edge"""
+        edges = {0, DAY}
+        for start, end, _ in self.bands:
+            edges.update((start % DAY, end % DAY))
+        knots = sorted(edges)
+
+        cumulative = [0.0]
+        for left, right in zip(knots, knots[1:]):
+            cumulative.append(cumulative[-1] + self._rate_at(left) / 60.0 * (right - left))
+        self._knots = np.array(knots, dtype=np.float64)
+        self._cumulative = np.array(cumulative, dtype=np.float64)
+        self.day_charge = cumulative[-1]
+
+    def _rate_at(self, second: int) -> float:
+        """Per-minute rate in force at `second` past midnight (later bands win)"""
+        rate = self.default_rate
+        for start, end, band_rate in self.bands:
+            inside = start <= second < end if start < end else (second >= start or second < end)
+            if inside:
+                rate = band_rate
+        return rate
+
+    def _charge_until(self, local_seconds):
+        """Time charge accrued from local midnight of day 0 until each timestamp"""
+        days, offset = np.divmod(local_seconds, DAY)
+        return days, np.interp(offset, self._knots, self._cumulative)
+
+    def _time_charge(self, start, end):
+        start_days, start_charge = self._charge_until(start)
+        end_days, end_charge = self._charge_until(end)
+        return (end_days - start_days) * self.day_charge + end_charge - start_charge
+
+    # ============= PRICING =============
+
+    def quote_many(self, entry_times, exit_times):
+        """Price arrays of sessions in one pass -> (time_charge, total_amount) arrays"""
+        entry = np.asarray(entry_times, dtype=np.float64) + self.utc_offset
+        exit_ = np.asarray(exit_times, dtype=np.float64) + self.utc_offset
+        duration = np.maximum(exit_ - entry, 0.0)
+        if self.increment:
+            duration = np.ceil(duration / self.increment) * self.increment
+        exit_ = entry + duration
+
+        if self.daily_cap is None:
+            time_charge = self._time_charge(entry, exit_)
+        else:
+            # Each whole 24h of the session costs at most the cap, as does the remainder
+            full_days = np.floor(duration / DAY)
+            remainder_start = entry + full_days * DAY
+            time_charge = (full_days * min(self.day_charge, self.daily_cap)
+                           + np.minimum(self._time_charge(remainder_start, exit_), self.daily_cap))
+
+        total = time_charge + self.base_charge
+        if self.max_charge is not None:
+            total = np.minimum(total, self.max_charge)
+            time_charge = np.maximum(total - self.base_charge, 0.0)
+        if self.grace_seconds:
+            free = duration <= self.grace_seconds
+            total = np.where(free, 0.0, total)
+            time_charge = np.where(free, 0.0, time_charge)
+        return time_charge, total
+
+    def quote(self, entry_time: int, exit_time: int) -> dict:
+        """Breakdown for one parking session (keys match the billing dicts)"""
+        time_charge, total = self.quote_many([entry_time], [exit_time])
+        total = float(total[0])
+        return {
+            'base_charge': self.base_charge if total > 0 else 0.0,
+            'minute_charge': float(time_charge[0]),
+            'total_amount': total,
+            'rate_description': self.describe()
+        }
+
+    def quote_reservations(self, reserved_hours):
+        return self.reservation_base + np.asarray(reserved_hours, dtype=np.float64) * self.reservation_rate
+
+    def quote_reservation(self, reserved_hours: float) -> dict:
+        """Fee for a cancelled reservation of `reserved_hours`"""
+        return {
+            'base_charge': self.reservation_base,
+            'minute_charge': reserved_hours * self.reservation_rate,
+            'total_amount': float(self.quote_reservations(reserved_hours)),
+            'rate_description': f"{self.currency}{self.reservation_rate:g} per reserved hour"
+        }
+
+    def describe(self) -> str:
+        """Human-readable rate line for bills"""
+        if not self.bands:
+            return f"{self.currency}{self.default_rate:g} per minute"
+        parts = [f"{self.currency}{self.default_rate:g}/min"]
+        for start, end, rate in self.bands:
+            parts.append(f"{self.currency}{rate:g}/min {start // 3600:02d}:{start % 3600 // 60:02d}"
+                         f"-{end // 3600:02d}:{end % 3600 // 60:02d}")
+        return ", ".join(parts)
+
+    # ============= LOADING =============
+
+    @classmethod
+    def default(cls):
+        return cls(DEFAULT_TARIFF)
+
+    @classmethod
+    def load(cls, path: str = None):
+        """Load from `path` if it exists, otherwise use the default tariff"""
+        if path and os.path.exists(path):
+            with open(path) as f:
+                tariff = cls(json.load(f))
+            print(f"✓ Tariff '{tariff.name}' loaded from {path}")
+            return tariff
+        return cls.default()
+
+
+# ============= BATCH RE-QUOTE =============
+
+def requote_history(conn, tariff: TariffEngine, since: Optional[int] = None, until: Optional[int] = None,
+                    status: Optional[str] = None) -> dict:
+    """What-if revenue: price every matching history row under `tariff`.
+
+    Rows written by cancel_reservation (entry_time == exit_time) are re-priced
+    as reservation fees from their reserved duration.
+    """
+    started = time.perf_counter()
+    clauses, params = [], []
+    if status is not None:
+        clauses.append('payment_status = ?')
+        params.append(status)
+    if since is not None:
+        clauses.append('exit_time >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('exit_time < ?')
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT slot_id, COALESCE(entry_time, 0), COALESCE(exit_time, 0),
+               COALESCE(duration_minutes, 0), COALESCE(total_amount, 0)
+        FROM parking_history {where}
+    ''', params)
+    rows = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 5)
+    slot_ids, entry, exit_, minutes, current = rows.T
+
+    reservation = (entry == exit_) & (minutes > 0)
+    _, requoted = tariff.quote_many(entry, exit_)
+    requoted = np.where(reservation, tariff.quote_reservations(minutes / 60.0), requoted)
+
+    slots = {}
+    if len(rows):
+        slot_index = slot_ids.astype(np.int64)
+        current_by_slot = np.bincount(slot_index, weights=current)
+        requoted_by_slot = np.bincount(slot_index, weights=requoted)
+        sessions_by_slot = np.bincount(slot_index)
+        for slot_id in np.nonzero(sessions_by_slot)[0]:
+            slots[int(slot_id)] = {
+                "sessions": int(sessions_by_slot[slot_id]),
+                "current_revenue": float(current_by_slot[slot_id]),
+                "requoted_revenue": float(requoted_by_slot[slot_id])
+            }
+
+    current_total = float(current.sum())
+    requoted_total = float(requoted.sum())
+    return {
+        "tariff": tariff.name,
+        "sessions": int(len(rows)),
+        "current_revenue": current_total,
+        "requoted_revenue": requoted_total,
+        "difference": requoted_total - current_total,
+        "by_slot": slots,
+        "elapsed_seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+if __name__ == "__main__":
+    import sqlite3
+
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] != "requote":
+        print(__doc__)
+        sys.exit(1)
+
+    def take(flag):
+        if flag in args:
+            index = args.index(flag)
+            value = int(args[index + 1])
+            del args[index:index + 2]
+            return value
+        return None
+
+    since, until = take("--since"), take("--until")
+    tariff = TariffEngine.load(args[1])
+    db_path = args[2] if len(args) > 2 else "parking_system.db"
+    conn = sqlite3.connect(db_path)
+    result = requote_history(conn, tariff, since, until)
+    conn.close()
+    print(f"📊 {result['sessions']} sessions re-quoted under '{result['tariff']}' in {result['elapsed_seconds']}s")
+    print(f"   Current:  {tariff.currency}{result['current_revenue']:.2f}")
+    print(f"   Requoted: {tariff.currency}{result['requoted_revenue']:.2f} ({result['difference']:+.2f})")
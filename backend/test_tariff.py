@@ -0,0 +1,88 @@
+"""
+Pricing checks for the tariff engine
+Fixed sessions with the exact rupee amounts they must be billed, so a change
+to the default tariff, bands, caps or grace period cannot slip through.
+
+Usage: python test_tariff.py   (or: python -m pytest test_tariff.py)
+"""
+from tariff import TariffEngine, DEFAULT_TARIFF
+
+MIDNIGHT = 1_700_006_400  # a UTC midnight; the tariffs below use utc_offset_minutes = 0
+HOUR = 3600
+
+BANDED = {
+    "name": "banded",
+    "base_charge": 20.0,
+    "rate_per_minute": 2.0,
+    "bands": [
+        {"start": "08:00", "end": "20:00", "rate_per_minute": 5.0},
+        {"start": "22:00", "end": "06:00", "rate_per_minute": 1.0}
+    ],
+    "utc_offset_minutes": 0
+}
+
+
+def amount(tariff, start, end):
+    return round(tariff.quote(start, end)['total_amount'], 2)
+
+
+def test_default_matches_original_pricing():
+    """₹30 base + ₹50 per 30 seconds parked, ₹30 + ₹100 per reserved hour"""
+    tariff = TariffEngine(dict(DEFAULT_TARIFF, utc_offset_minutes=0))
+    assert amount(tariff, MIDNIGHT, MIDNIGHT) == 30.0
+    assert amount(tariff, MIDNIGHT, MIDNIGHT + 30) == 80.0
+    assert amount(tariff, MIDNIGHT, MIDNIGHT + 60) == 130.0
+    assert amount(tariff, MIDNIGHT + 13 * HOUR, MIDNIGHT + 13 * HOUR + 150) == 280.0
+    assert amount(tariff, MIDNIGHT, MIDNIGHT + HOUR) == 6030.0
+    assert tariff.quote(MIDNIGHT, MIDNIGHT + 60)['base_charge'] == 30.0
+    assert tariff.quote_reservation(0)['total_amount'] == 30.0
+    assert tariff.quote_reservation(0.5)['total_amount'] == 80.0
+    assert tariff.quote_reservation(2)['total_amount'] == 230.0
+
+
+def test_bands():
+    tariff = TariffEngine(BANDED)
+    # 07:00-09:00: 60 min at ₹2 + 60 min at ₹5
+    assert amount(tariff, MIDNIGHT + 7 * HOUR, MIDNIGHT + 9 * HOUR) == 440.0
+    # 21:00-23:00 crosses into the overnight band: 60 min at ₹2 + 60 min at ₹1
+    assert amount(tariff, MIDNIGHT + 21 * HOUR, MIDNIGHT + 23 * HOUR) == 200.0
+    # 23:00-07:00 wraps past midnight: 7 h at ₹1 (22:00-06:00 band) + 1 h at ₹2
+    assert amount(tariff, MIDNIGHT + 23 * HOUR, MIDNIGHT + 31 * HOUR) == 560.0
+
+
+def test_daily_cap():
+    tariff = TariffEngine(dict(BANDED, daily_cap=1000.0))
+    # A full day would be ₹4560; capped at ₹1000, plus 00:00-01:00 at ₹1/min
+    assert amount(tariff, MIDNIGHT, MIDNIGHT + 25 * HOUR) == 1080.0
+    # Below the cap the cap changes nothing
+    assert amount(tariff, MIDNIGHT + 7 * HOUR, MIDNIGHT + 9 * HOUR) == 440.0
+
+
+def test_max_charge():
+    tariff = TariffEngine(dict(BANDED, max_charge=500.0))
+    assert amount(tariff, MIDNIGHT + 8 * HOUR, MIDNIGHT + 10 * HOUR) == 500.0
+    assert amount(tariff, MIDNIGHT + 7 * HOUR, MIDNIGHT + 9 * HOUR) == 440.0
+
+
+def test_grace_period():
+    tariff = TariffEngine(dict(BANDED, grace_seconds=300))
+    quote = tariff.quote(MIDNIGHT, MIDNIGHT + 300)
+    assert quote['total_amount'] == 0.0 and quote['base_charge'] == 0.0
+    # Past the grace period the whole stay is billed: ₹20 + 6 min at ₹1
+    assert amount(tariff, MIDNIGHT, MIDNIGHT + 360) == 26.0
+
+
+def test_billing_increment():
+    tariff = TariffEngine(dict(BANDED, billing_increment_seconds=900))
+    # 61 s rounds up to a 15 minute block at ₹1
+    assert amount(tariff, MIDNIGHT, MIDNIGHT + 61) == 35.0
+    assert amount(tariff, MIDNIGHT, MIDNIGHT + 900) == 35.0
+
+
+if __name__ == "__main__":
+    checks = [test_default_matches_original_pricing, test_bands, test_daily_cap,
+              test_max_charge, test_grace_period, test_billing_increment]
+    for check in checks:
+        check()
+        print(f"✅ {check.__name__}")
+    print(f"All {len(checks)} tariff checks passed")
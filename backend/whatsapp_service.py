@@ -26,8 +26,8 @@ class WhatsAppService:
 *Exit Time:* {exit_time}
 *Duration:* {billing_info['duration_minutes']} minutes
 
-*Rate:* ₹50 per minute
-*Minimum Charge:* ₹30
+*Rate:* {billing_info.get('rate_description', '')}
+*Minimum Charge:* ₹{billing_info.get('base_charge', 0):.2f}
 
 *Total Amount: ₹{billing_info['total_amount']:.2f}*
 
@@ -1,5 +1,6 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { QRCodeSVG } from 'qrcode.react';
+import { parkingAPI } from '../services/api';
 import '../PaymentModal.css';
 
 const PaymentModal = ({ billing, onClose, onPaymentComplete }) => {
@@ -7,25 +8,28 @@ const PaymentModal = ({ billing, onClose, onPaymentComplete }) => {
   const [userEmail, setUserEmail] = useState(billing.user_email || '');
   const [emailError, setEmailError] = useState('');
   const [loading, setLoading] = useState(false);
+  const [rateDescription, setRateDescription] = useState(billing.rate_description || '');
+
+  useEffect(() => {
+    if (billing.rate_description) return;
+    parkingAPI.getTariff()
+      .then((data) => setRateDescription(data.description))
+      .catch((error) => console.error('Error fetching tariff:', error));
+  }, [billing.rate_description]);
 
   const calculateBilling = () => {
     const entryTime = billing.entry_time || 0;
     const exitTime = billing.exit_time || Math.floor(Date.now() / 1000);
     const durationMinutes = billing.duration_minutes || Math.floor((exitTime - entryTime) / 60);
     
-    const baseCharge = 30;
-    const durationSeconds = durationMinutes * 60;
-    const intervals30Sec = Math.ceil(durationSeconds / 30);
-    const minuteCharge = intervals30Sec * 50;
-    const totalAmount = baseCharge + minuteCharge;
-
+    // Amounts are the backend tariff's; history rows only carry the total
     return {
       entry_time: entryTime,
       exit_time: exitTime,
       duration_minutes: durationMinutes,
-      base_charge: baseCharge,
-      minute_charge: minuteCharge,
-      total_amount: totalAmount,
+      base_charge: billing.base_charge,
+      minute_charge: billing.minute_charge,
+      total_amount: billing.total_amount,
       slot_id: billing.slot_id || 0,
       vehicle_number: billing.vehicle_number || 'N/A',
     };
@@ -129,26 +133,32 @@ const PaymentModal = ({ billing, onClose, onPaymentComplete }) => {
 
                 <div className="billing-breakdown">
                   <h3>Pricing Breakdown</h3>
-                  <div className="breakdown-row">
-                    <span>Base Charge</span>
-                    <span>{formatCurrency(bill.base_charge)}</span>
-                  </div>
-                  <div className="breakdown-row">
-                    <span>Time Charge ({bill.duration_minutes} min)</span>
-                    <span>{formatCurrency(bill.minute_charge)}</span>
-                  </div>
+                  {bill.base_charge != null && (
+                    <div className="breakdown-row">
+                      <span>Base Charge</span>
+                      <span>{formatCurrency(bill.base_charge)}</span>
+                    </div>
+                  )}
+                  {bill.minute_charge != null && (
+                    <div className="breakdown-row">
+                      <span>Time Charge ({bill.duration_minutes} min)</span>
+                      <span>{formatCurrency(bill.minute_charge)}</span>
+                    </div>
+                  )}
                   <div className="breakdown-total">
                     <span>Total Amount</span>
                     <span className="total-amount">{formatCurrency(bill.total_amount)}</span>
                   </div>
                 </div>
 
-                <div className="pricing-note">
-                  <div className="note-icon">💡</div>
-                  <div className="note-text">
-                    <strong>Pricing:</strong> ₹30 base + ₹50 per 30 seconds
+                {rateDescription && (
+                  <div className="pricing-note">
+                    <div className="note-icon">💡</div>
+                    <div className="note-text">
+                      <strong>Pricing:</strong> {rateDescription}
+                    </div>
                   </div>
-                </div>
+                )}
               </div>
 
               <div className="email-section">
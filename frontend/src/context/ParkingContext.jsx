@@ -30,11 +30,48 @@ export const ParkingProvider = ({ children }) => {
     }
   }, []);
 
-  const reserveSlot = async (reservationData) => {
+  // Live slot updates pushed by the backend; returns an unsubscribe function.
+  // Calls onError when EventSource is unavailable so callers can fall back to polling.
+  const subscribeSlots = useCallback((onError) => {
+    if (typeof EventSource === 'undefined') {
+      onError && onError();
+      return () => {};
+    }
+    const source = parkingAPI.streamSlots();
+    const mergeBySlotId = (current, changed) => {
+      const byId = new Map(current.map((slot) => [slot.slot_id, slot]));
+      changed.forEach((slot) => byId.set(slot.slot_id, slot));
+      return Array.from(byId.values()).sort((a, b) => a.slot_id - b.slot_id);
+    };
+
+    // Store version of the state we hold: every (re)connect starts with a snapshot,
+    // and a delta at or below it is older than that state and is dropped
+    let version = -1;
+
+    source.addEventListener('snapshot', (event) => {
+      const snapshot = JSON.parse(event.data);
+      version = snapshot.version;
+      setSlots(snapshot.slots);
+    });
+    source.addEventListener('delta', (event) => {
+      const { version: deltaVersion, slots: changed } = JSON.parse(event.data);
+      if (deltaVersion <= version) return;
+      version = deltaVersion;
+      setSlots((current) => mergeBySlotId(current, changed));
+    });
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        onError && onError();
+      }
+    };
+    return () => source.close();
+  }, []);
+
+  const reserveSlot = async (reservationData, idempotencyKey) => {
     setLoading(true);
     setError(null);
     try {
-      const result = await parkingAPI.reserveSlot(reservationData);
+      const result = await parkingAPI.reserveSlot(reservationData, idempotencyKey);
       await fetchSlots();
       return result;
     } catch (err) {
@@ -46,12 +83,12 @@ export const ParkingProvider = ({ children }) => {
     }
   };
 
-  const cancelReservation = async (slotId, emailId) => {
+  const cancelReservation = async (slotId, emailId, idempotencyKey) => {
     setLoading(true);
     setError(null);
     try {
       console.log('Cancelling reservation:', { slotId, emailId }); // Debug log
-      const result = await parkingAPI.cancelReservation(slotId, emailId);
+      const result = await parkingAPI.cancelReservation(slotId, emailId, idempotencyKey);
       await fetchSlots();
       return result;
     } catch (err) {
@@ -82,6 +119,7 @@ export const ParkingProvider = ({ children }) => {
     loading,
     error,
     fetchSlots,
+    subscribeSlots,
     reserveSlot,
     cancelReservation,
     syncSlots,
@@ -4,15 +4,29 @@ import { parkingAPI } from '../services/api';
 import Loader from '../components/Loader';
 
 const Dashboard = () => {
-  const { slots, loading, fetchSlots, syncSlots } = useParkingContext();
+  const { slots, loading, fetchSlots, subscribeSlots, syncSlots } = useParkingContext();
   const [totalRevenue, setTotalRevenue] = useState(0);
   const [totalSessions, setTotalSessions] = useState(0);
   const [loadingStats, setLoadingStats] = useState(false);
+  const [pricing, setPricing] = useState('');
 
   useEffect(() => {
     fetchSlots();
     fetchRevenue();
-  }, [fetchSlots]);
+    fetchTariff();
+    return subscribeSlots();
+  }, [fetchSlots, subscribeSlots]);
+
+  const fetchTariff = async () => {
+    try {
+      const data = await parkingAPI.getTariff();
+      if (data.success) {
+        setPricing(data.description);
+      }
+    } catch (error) {
+      console.error('Error fetching tariff:', error);
+    }
+  };
 
   const fetchRevenue = async () => {
     setLoadingStats(true);
@@ -148,7 +162,7 @@ const Dashboard = () => {
         </div>
         <div className="quick-stat-item">
           <span className="quick-stat-label">Pricing Rate</span>
-          <span className="quick-stat-value">₹30 + ₹50/30s</span>
+          <span className="quick-stat-value">{pricing || '—'}</span>
         </div>
       </div>
     </div>
@@ -44,14 +44,6 @@ const History = () => {
   const handlePaymentComplete = async (email) => {
     try {
       const durationMinutes = selectedBilling.duration_minutes || 0;
-      const baseCharge = 30;
-
-      // Calculate minute charge: ₹50 per 30 seconds
-      const durationSeconds = durationMinutes * 60;
-      const intervals30Sec = Math.ceil(durationSeconds / 30);
-      const minuteCharge = intervals30Sec * 50;
-
-      const totalAmount = baseCharge + minuteCharge;
 
       // Format timestamps properly
       const entryTime = selectedBilling.entry_time
@@ -84,9 +76,10 @@ const History = () => {
         entry_time: entryTime,
         exit_time: exitTime,
         duration_minutes: durationMinutes,
-        base_charge: baseCharge,
-        minute_charge: minuteCharge,
-        total_amount: totalAmount
+        // Billed amounts exactly as the backend tariff priced them
+        base_charge: selectedBilling.base_charge,
+        minute_charge: selectedBilling.minute_charge,
+        total_amount: selectedBilling.total_amount
       });
 
       // Mark as paid in backend
@@ -116,6 +109,23 @@ const History = () => {
     return hours > 0 ? `${hours}h ${mins}m` : `${mins}m`;
   };
 
+  // End-of-day reconciliation: settle every pending row shown in one request
+  const handleSettleAll = async () => {
+    const pendingIds = history
+      .filter(record => record.payment_status !== 'PAID')
+      .map(record => record.id);
+    if (pendingIds.length === 0) return;
+    if (window.confirm(`Mark ${pendingIds.length} pending payment(s) as paid?`)) {
+      try {
+        const result = await parkingAPI.settlePayments({ history_ids: pendingIds });
+        alert(`Settled ${result.settled} payment(s) totalling ₹${result.amount.toFixed(2)}`);
+        fetchHistory();
+      } catch (err) {
+        alert('Failed to settle payments');
+      }
+    }
+  };
+
   const handleResetHistory = async () => {
     if (window.confirm('Are you sure you want to delete ALL history? This cannot be undone.')) {
       try {
@@ -143,6 +153,7 @@ const History = () => {
   }
 
   const totalEarnings = calculateTotalEarnings();
+  const hasPending = history.some(record => record.payment_status !== 'PAID');
 
   return (
     <div className="history-page">
@@ -164,6 +175,23 @@ const History = () => {
           >
             🗑️ Reset History
           </button>
+          <button
+            className="btn"
+            onClick={handleSettleAll}
+            disabled={!hasPending}
+            style={{
+              backgroundColor: '#10b981',
+              color: 'white',
+              border: 'none',
+              padding: '8px 12px',
+              borderRadius: '6px',
+              marginRight: '15px',
+              cursor: hasPending ? 'pointer' : 'not-allowed',
+              opacity: hasPending ? 1 : 0.6
+            }}
+          >
+            ✅ Settle All Pending
+          </button>
           <div className="earnings-display">
             <span className="earnings-label">Total Earnings</span>
             <span className="earnings-amount">₹{totalEarnings.toFixed(2)}</span>
@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useParkingContext } from '../context/ParkingContext';
-import { parkingAPI } from '../services/api';
+import { parkingAPI, newIdempotencyKey } from '../services/api';
 import SlotCard from '../components/SlotCard';
 import ReservationModal from '../components/ReservationModal';
 import Loader from '../components/Loader';
@@ -9,7 +9,7 @@ import PayBillModal from '../components/PayBillModal';
 import PaymentResultModal from '../components/PaymentResultModal';
 
 const Slots = () => {
-  const { slots, loading, fetchSlots, reserveSlot, cancelReservation } = useParkingContext();
+  const { slots, loading, fetchSlots, subscribeSlots, reserveSlot, cancelReservation } = useParkingContext();
   const [showReservationModal, setShowReservationModal] = useState(false);
   const [showCancelModal, setShowCancelModal] = useState(false);
   const [showPayBillModal, setShowPayBillModal] = useState(false);
@@ -19,31 +19,52 @@ const Slots = () => {
   const [selectedSlot, setSelectedSlot] = useState(null);
   const [successMessage, setSuccessMessage] = useState('');
   const [errorMessage, setErrorMessage] = useState('');
+  // Idempotency key of the reserve / cancel / pay-bill action in progress
+  const [actionKey, setActionKey] = useState(null);
 
   useEffect(() => {
     fetchSlots();
 
-    // Auto-refresh every 30 seconds to cancel expired reservations
-    const interval = setInterval(() => {
-      fetchSlots(true);
-    }, 30000);
-
-    return () => clearInterval(interval);
-  }, [fetchSlots]);
+    // Live updates over SSE; fall back to refreshing every 30 seconds
+    let interval = null;
+    const unsubscribe = subscribeSlots(() => {
+      if (!interval) {
+        interval = setInterval(() => {
+          fetchSlots(true);
+        }, 30000);
+      }
+    });
+
+    return () => {
+      unsubscribe();
+      if (interval) clearInterval(interval);
+    };
+  }, [fetchSlots, subscribeSlots]);
+
+  // A rejected request is final, so the next attempt gets a new key; network
+  // errors, 5xx and 409 (still running) keep it so the retry is deduplicated
+  const renewKeyAfter = (error) => {
+    const status = error.response?.status;
+    if (status && status < 500 && status !== 409) {
+      setActionKey(newIdempotencyKey());
+    }
+  };
 
   const handleReserve = (slotId) => {
+    setActionKey(newIdempotencyKey());
     setSelectedSlotId(slotId);
     setShowReservationModal(true);
   };
 
   const handleReservationSubmit = async (reservationData) => {
     try {
-      await reserveSlot(reservationData);
+      await reserveSlot(reservationData, actionKey);
       setShowReservationModal(false);
       setSuccessMessage(`Slot ${reservationData.slot_id} reserved successfully!`);
       setErrorMessage('');
       setTimeout(() => setSuccessMessage(''), 3000);
     } catch (error) {
+      renewKeyAfter(error);
       setErrorMessage(error.message);
       setSuccessMessage('');
       setTimeout(() => setErrorMessage(''), 5000);
@@ -51,13 +72,14 @@ const Slots = () => {
   };
 
   const handleCancelClick = (slotId) => {
+    setActionKey(newIdempotencyKey());
     setSelectedSlotId(slotId);
     setShowCancelModal(true);
   };
 
   const handleCancelSubmit = async (emailId) => {
     try {
-      const result = await cancelReservation(selectedSlotId, emailId);
+      const result = await cancelReservation(selectedSlotId, emailId, actionKey);
       setShowCancelModal(false);
 
       if (result.billing) {
@@ -70,6 +92,7 @@ const Slots = () => {
         setTimeout(() => setSuccessMessage(''), 3000);
       }
     } catch (error) {
+      renewKeyAfter(error);
       setErrorMessage(error.message);
       setSuccessMessage('');
       setTimeout(() => setErrorMessage(''), 5000);
@@ -78,13 +101,14 @@ const Slots = () => {
 
   const handlePayBillClick = (slotId) => {
     const slot = slots.find(s => s.slot_id === slotId);
+    setActionKey(newIdempotencyKey());
     setSelectedSlot(slot);
     setShowPayBillModal(true);
   };
 
   const handlePayBillSubmit = async (paymentData) => {
     try {
-      const data = await parkingAPI.payBill(selectedSlot.slot_id, paymentData);
+      const data = await parkingAPI.payBill(selectedSlot.slot_id, paymentData, actionKey);
 
       // Refresh slots in background
       fetchSlots();
@@ -92,6 +116,7 @@ const Slots = () => {
       // Return billing data to PayBillModal to show QR code
       return data;
     } catch (error) {
+      renewKeyAfter(error);
       setErrorMessage(error.message);
       setSuccessMessage('');
       setTimeout(() => setErrorMessage(''), 5000);
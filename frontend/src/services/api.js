@@ -38,28 +38,41 @@ api.interceptors.response.use(
   }
 );
 
+// One key per user action, created when the action starts (e.g. its modal opens)
+// and passed on every retry: the server then returns the original response
+// instead of running the action twice
+export const newIdempotencyKey = () =>
+  window.crypto && window.crypto.randomUUID
+    ? window.crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
+const idempotent = (key) => ({ headers: { 'Idempotency-Key': key } });
+
 export const parkingAPI = {
   getAllSlots: async () => {
     const response = await api.get('/api/slots');
     return response.data;
   },
 
+  // Server-Sent Events stream: 'snapshot' on connect, then 'delta' per change
+  streamSlots: () => new EventSource(`${API_URL}/api/slots/stream`),
+
   getSlot: async (slotId) => {
     const response = await api.get(`/api/slots/${slotId}`);
     return response.data;
   },
 
-  reserveSlot: async (data) => {
-    const response = await api.post('/api/slots/reserve', data);
+  reserveSlot: async (data, idempotencyKey) => {
+    const response = await api.post('/api/slots/reserve', data, idempotent(idempotencyKey));
     return response.data;
   },
 
   // ✅ FIXED: Proper payload format
-  cancelReservation: async (slotId, emailId) => {
+  cancelReservation: async (slotId, emailId, idempotencyKey) => {
     const response = await api.post('/api/slots/cancel', {
       slot_id: parseInt(slotId),
       email_id: emailId
-    });
+    }, idempotent(idempotencyKey));
     return response.data;
   },
 
@@ -89,8 +102,8 @@ export const parkingAPI = {
   },
 
   // New endpoints for payment tracking
-  payBill: async (slotId, data) => {
-    const response = await api.post(`/api/slots/pay-bill/${slotId}`, data);
+  payBill: async (slotId, data, idempotencyKey) => {
+    const response = await api.post(`/api/slots/pay-bill/${slotId}`, data, idempotent(idempotencyKey));
     return response.data;
   },
 
@@ -104,6 +117,12 @@ export const parkingAPI = {
     return response.data;
   },
 
+  // Active tariff: { tariff, description } - the pricing text shown to users
+  getTariff: async () => {
+    const response = await api.get('/api/tariff');
+    return response.data;
+  },
+
   getRevenueStats: async () => {
     const response = await api.get('/api/history/revenue');
     return response.data;
@@ -119,6 +138,12 @@ export const parkingAPI = {
     return response.data;
   },
 
+  // Bulk settlement: { history_ids: [...] } or filters { vehicle_number, slot_id, before }
+  settlePayments: async (request) => {
+    const response = await api.post('/api/history/mark-paid', request);
+    return response.data;
+  },
+
   resetAllSlots: async () => {
     const response = await api.post('/api/database/reset-slots');
     return response.data;